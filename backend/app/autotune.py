@@ -0,0 +1,282 @@
+"""Index parameter autotuner: the fastest index configuration that meets a recall floor.
+
+Usage (PowerShell):
+python -m backend.app.autotune --recall 0.95 --k 6
+python -m backend.app.autotune --queries logs/questions.txt --recall 0.98 --types ivf hnsw
+python -m backend.app.autotune --recall 0.9 --max-memory-mb 256 --pca-dims 192 --report tuning.json
+
+Queries are logged questions (a text file with one per line, or JSONL with a
+"question" / "query" field) or, without --queries, --sample stored chunk texts cut
+to their first 16 words (the stand-in bench uses). Ground truth is the exact top-k
+over the live stored vectors (IndexFlatIP).
+
+Each index is built once per build-time parameter set (type, compression, PCA
+dimension, nlist / M / pq_m) from those vectors, then searched with increasing
+nprobe / efSearch the way embedding_store serves a dense query: one query at a time,
+a max(k*10, 50) candidate pool, and exact re-scoring of the candidates for
+compressed or projected indexes. Every configuration gets recall@k, p50 / p99
+latency (re-scoring included) and index memory (serialized size; the raw vectors
+used for re-scoring are memory-mapped and the same for all of them).
+
+The recall / latency Pareto front is printed: the configurations (within
+--max-memory-mb) that no other configuration is both faster and more accurate than.
+The fastest configuration on the front that meets --recall is written to settings.index_tuning_file, an
+env file that config.py loads under the environment and .env. The stored base is
+not rebuilt here: run the printed reindex command, or just restart the servers when
+only nprobe / efSearch changed.
+"""
+from __future__ import annotations
+import argparse
+import json
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+import faiss  # type: ignore
+import numpy as np
+from .config import settings
+from . import index_factory
+
+NPROBES = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+EF_SEARCHES = (16, 32, 64, 128, 256, 512)
+HNSW_MS = (16, 32, 48)
+NLIST_FACTORS = (0.5, 1, 2)  # times the nlist derived from the corpus size
+PQ_MS = (16, 32, 48, 64, 96, 192)  # those that divide the index dimension are tried
+WARMUP_QUERIES = 10
+
+# Tuned field -> environment variable read by config.py
+ENV_NAMES = {
+    "type": "INDEX_TYPE",
+    "compression": "INDEX_COMPRESSION",
+    "pca_dim": "PCA_DIM",
+    "nlist": "IVF_NLIST",
+    "nprobe": "IVF_NPROBE",
+    "M": "HNSW_M",
+    "efConstruction": "HNSW_EF_CONSTRUCTION",
+    "efSearch": "HNSW_EF_SEARCH",
+    "pq_m": "PQ_M",
+}
+
+
+def load_queries(path: Path) -> List[str]:
+    """Questions from a text file (one per line) or JSONL ("question" / "query" field)."""
+    queries = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                row = json.loads(line)
+                line = row.get("question") or row.get("query") or ""
+            if line:
+                queries.append(line)
+    if not queries:
+        raise SystemExit(f"No queries in {path}")
+    return queries
+
+
+def build_grid(kinds: List[str], compressions: List[str], pca_dims: List[int], n: int, d: int) -> List[Dict]:
+    """Build-time parameter sets to try; search-time knobs are swept per built index."""
+    grid = []
+    for pca_dim in [0] + [p for p in pca_dims if 0 < p < d]:
+        if pca_dim and n < index_factory.PCA_MIN_TRAIN_POINTS:
+            print(f"Skipping pca_dim={pca_dim}: needs at least {index_factory.PCA_MIN_TRAIN_POINTS} vectors")
+            continue
+        dim = pca_dim or d
+        for compression in compressions:
+            if compression == "pq" and n < index_factory.PQ_MIN_TRAIN_POINTS:
+                print(f"Skipping pq: needs at least {index_factory.PQ_MIN_TRAIN_POINTS} vectors")
+                continue
+            codes = [{"pq_m": m} for m in PQ_MS if dim % m == 0] if compression == "pq" else [{}]
+            for code in codes:
+                base = {"compression": compression, "pca_dim": pca_dim, **code}
+                for kind in kinds:
+                    if kind == "flat":
+                        grid.append({"type": "flat", **base})
+                    elif kind == "ivf":
+                        derived = index_factory.ivf_nlist(n)
+                        nlists = sorted({index_factory.ivf_nlist(n, max(1, int(derived * f))) for f in NLIST_FACTORS})
+                        grid.extend({"type": "ivf", "nlist": nlist, **base} for nlist in nlists)
+                    elif kind == "hnsw" and compression != "pq":  # no inner-product HNSW-PQ in FAISS
+                        grid.extend({"type": "hnsw", "M": m, "efConstruction": settings.hnsw_ef_construction, **base}
+                                    for m in HNSW_MS)
+    return grid
+
+
+def _search_knobs(config: Dict) -> List[Dict]:
+    if config["type"] == "ivf":
+        return [{"nprobe": p} for p in NPROBES if p <= config["nlist"]]
+    if config["type"] == "hnsw":
+        return [{"efSearch": ef} for ef in EF_SEARCHES]
+    return [{}]
+
+
+def _measure(index, vectors: np.ndarray, queries: np.ndarray, truth: np.ndarray, k: int) -> Dict:
+    """recall@k and per-query latency of dense serving: pool search, exact re-scoring if approximate."""
+    pool = min(max(k * 10, 50), index.ntotal)
+    rescore = index_factory.is_approximate(index)
+    for q in queries[:WARMUP_QUERIES]:
+        index.search(q[None, :], pool)
+    hits, latencies = 0, []
+    for q, expected in zip(queries, truth):
+        t0 = time.perf_counter()
+        scores, rows = index.search(q[None, :], pool)
+        rows = rows[0][rows[0] >= 0]
+        if rescore:
+            rows = rows[np.argsort(-(vectors[rows] @ q), kind="stable")]
+        found = rows[:k]
+        latencies.append((time.perf_counter() - t0) * 1000)
+        hits += len(np.intersect1d(found, expected))
+    return {"recall": hits / truth.size, "p50_ms": float(np.percentile(latencies, 50)),
+            "p99_ms": float(np.percentile(latencies, 99))}
+
+
+def sweep(grid: List[Dict], vectors: np.ndarray, queries: np.ndarray, truth: np.ndarray, k: int) -> List[Dict]:
+    results = []
+    for config in grid:
+        build = {key: value for key, value in config.items() if key not in ("type", "compression")}
+        t0 = time.perf_counter()
+        try:
+            index = index_factory.build_index(config["type"], vectors, params=build, compression=config["compression"])
+        except (ValueError, RuntimeError) as e:
+            print(f"  {describe(config)}: {e}")
+            continue
+        build_s = time.perf_counter() - t0
+        memory_mb = len(faiss.serialize_index(index)) / 2**20
+        for knobs in _search_knobs(config):
+            index_factory.apply_search_params(index, knobs)
+            result = {**config, **knobs, **_measure(index, vectors, queries, truth, k),
+                      "memory_mb": memory_mb, "build_s": build_s}
+            results.append(result)
+            print(f"  {describe(result):58s} recall@{k}={result['recall']:.3f} p50={result['p50_ms']:7.3f} ms "
+                  f"p99={result['p99_ms']:7.3f} ms index={memory_mb:8.1f} MiB build={build_s:6.1f} s")
+            if result["recall"] >= 1.0:
+                break  # wider searches only cost more
+    return results
+
+
+def describe(config: Dict) -> str:
+    parts = [config["type"], config["compression"]]
+    if config.get("pca_dim"):
+        parts.append(f"pca_dim={config['pca_dim']}")
+    parts += [f"{key}={config[key]}" for key in ("pq_m", "nlist", "nprobe", "M", "efSearch") if key in config]
+    return " ".join(parts)
+
+
+def pareto_front(results: List[Dict], latency: str, max_memory_mb: Optional[float] = None) -> List[Dict]:
+    """Results within the memory cap that no other is both faster and more accurate than, fastest first."""
+    if max_memory_mb is not None:
+        results = [r for r in results if r["memory_mb"] <= max_memory_mb]
+    front, best_recall = [], -1.0
+    for result in sorted(results, key=lambda r: (r[latency], -r["recall"], r["memory_mb"])):
+        if result["recall"] > best_recall:
+            front.append(result)
+            best_recall = result["recall"]
+    return front
+
+
+def choose(front: List[Dict], recall: float) -> Optional[Dict]:
+    """Fastest front member meeting the recall floor."""
+    return next((result for result in front if result["recall"] >= recall), None)
+
+
+def env_lines(result: Dict) -> Dict[str, object]:
+    env = {ENV_NAMES[key]: result[key] for key in ENV_NAMES if key in result}
+    env.setdefault("PCA_DIM", 0)
+    return env
+
+
+def write_env(path: Path, result: Dict, header: str):
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(f"# {header}\n")
+        for name, value in env_lines(result).items():
+            f.write(f"{name}={value}\n")
+    tmp.replace(path)
+
+
+def reindex_command(result: Dict) -> str:
+    params = ",".join(f"{key}={result[key]}" for key in ("nlist", "nprobe", "M", "efConstruction", "efSearch", "pq_m")
+                      if key in result)
+    return (f"python -m backend.app.reindex --type {result['type']} --compression {result['compression']} "
+            f"--pca-dim {result.get('pca_dim', 0)}" + (f" --params {params}" if params else ""))
+
+
+def _same_build(index, result: Dict) -> bool:
+    """True if the served base already has result's build-time parameters (only search knobs differ)."""
+    if index is None or index_factory.index_kind(index) != result["type"]:
+        return False
+    if index_factory.index_compression(index) != result["compression"]:
+        return False
+    if index_factory.index_pca_dim(index) != result.get("pca_dim", 0):
+        return False
+    if result["type"] == "ivf":
+        return faiss.extract_index_ivf(index).nlist == result["nlist"]
+    if result["type"] == "hnsw":
+        return index_factory._inner(index).hnsw.nb_neighbors(1) == result["M"]
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep index types / parameters for the lowest latency at a recall floor")
+    parser.add_argument("--recall", type=float, default=0.95, help="recall@k floor")
+    parser.add_argument("--k", type=int, default=settings.max_retrieve)
+    parser.add_argument("--queries", type=Path, help="Logged questions (.txt / .jsonl); default: sampled chunk texts")
+    parser.add_argument("--sample", type=int, default=200, help="Chunk texts to sample as queries without --queries")
+    parser.add_argument("--types", nargs="+", choices=index_factory.INDEX_TYPES, default=list(index_factory.INDEX_TYPES))
+    parser.add_argument("--compressions", nargs="+", choices=index_factory.COMPRESSIONS,
+                        default=list(index_factory.COMPRESSIONS))
+    parser.add_argument("--pca-dims", nargs="*", type=int, default=[], help="Projected dimensions to try as well")
+    parser.add_argument("--latency", choices=("p50_ms", "p99_ms"), default="p99_ms", help="Latency to minimize")
+    parser.add_argument("--max-memory-mb", type=float, default=None, help="Leave out configurations with a larger index")
+    parser.add_argument("--out", type=Path, default=Path(settings.index_tuning_file), help="Env file to write")
+    parser.add_argument("--report", type=Path, help="Also write every measurement as JSON")
+    args = parser.parse_args()
+
+    from . import embedding_store
+    from .bench import sample_queries
+    snap = embedding_store.snapshot()
+    if snap.live_count == 0:
+        raise SystemExit("The store is empty; run offline_ingest first.")
+    vectors = embedding_store._store._all_vectors(snap)
+    if len(snap.tombstones):
+        vectors = np.delete(vectors, snap.tombstones, axis=0)
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    texts = load_queries(args.queries) if args.queries else sample_queries(args.sample)[0]
+    queries = embedding_store._embed_queries(texts)
+    k = min(args.k, len(vectors))
+    _, truth = faiss.knn(queries, vectors, k, metric=faiss.METRIC_INNER_PRODUCT)
+
+    grid = build_grid(args.types, args.compressions, args.pca_dims, len(vectors), vectors.shape[1])
+    print(f"{embedding_store.PERSIST_DIR}: {len(vectors)} vectors, {len(queries)} queries, "
+          f"{len(grid)} index builds, recall@{k} floor {args.recall}")
+    results = sweep(grid, vectors, queries, truth, k)
+    front = pareto_front(results, args.latency, args.max_memory_mb)
+    print(f"Pareto front (recall@{k} / {args.latency} / index MiB):")
+    for result in front:
+        print(f"  {describe(result):58s} {result['recall']:.3f} {result[args.latency]:8.3f} ms "
+              f"{result['memory_mb']:8.1f} MiB")
+    if args.report:
+        args.report.write_text(json.dumps({"k": k, "vectors": len(vectors), "queries": len(queries),
+                                           "results": results, "pareto": front}, indent=2), encoding="utf-8")
+
+    best = choose(front, args.recall)
+    if best is None:
+        top = max(results, key=lambda r: r["recall"], default=None)
+        reached = f"; best recall@{k} was {top['recall']:.3f} ({describe(top)})" if top else ""
+        raise SystemExit(f"No configuration meets recall@{k} >= {args.recall}{reached}. {args.out} left unchanged.")
+    header = (f"python -m backend.app.autotune, {datetime.now():%Y-%m-%d %H:%M}: recall@{k}={best['recall']:.3f} "
+              f"(floor {args.recall}) p50={best['p50_ms']:.3f} ms p99={best['p99_ms']:.3f} ms "
+              f"index={best['memory_mb']:.1f} MiB on {len(vectors)} vectors / {len(queries)} queries")
+    write_env(args.out, best, header)
+    print(f"Chose {describe(best)}: recall@{k}={best['recall']:.3f} {args.latency}={best[args.latency]:.3f} ms "
+          f"index={best['memory_mb']:.1f} MiB -> {args.out}")
+    if _same_build(snap.index, best):
+        print("The stored base already has these build parameters; restart the servers to pick up the search knobs.")
+    else:
+        print("Rebuild the base with: " + reindex_command(best))
+
+
+if __name__ == "__main__":
+    main()
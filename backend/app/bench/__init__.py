@@ -0,0 +1,134 @@
+"""Measurements for the retrieval layer.
+
+Subcommands live in the modules of this package, one per feature area (storage,
+encoding, search, diversity, stress); this module holds the harness they share.
+
+Usage (PowerShell):
+python -m backend.app.bench load --store vector_store
+python -m backend.app.bench batch --queries 512 --k 6
+python -m backend.app.bench encoder --backends torch onnx
+python -m backend.app.bench stress --seconds 20 --readers 4
+python -m backend.app.bench lexical --docs 1000000
+python -m backend.app.bench workers --counts 1 4 8 --docs 200000
+python -m backend.app.bench metadata --rows 3000 1000000
+python -m backend.app.bench recall --dims 128 192 --k 10
+python -m backend.app.bench hierarchical --chapters 50 200 800
+python -m backend.app.bench mmr --k 4 --lambdas 0.5 0.7
+
+Each measurement that depends on process memory runs in a fresh subprocess (probe)
+so that earlier allocations do not skew the numbers.
+"""
+from __future__ import annotations
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+
+def rss_mb() -> float:
+    """Resident set size of this process in MiB (peak RSS where /proc is unavailable)."""
+    try:
+        with open("/proc/self/status", "r", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    except ImportError:  # pragma: no cover - Windows
+        return 0.0
+
+
+def smaps_mb() -> Dict[str, float]:
+    """Rss / Pss / private (Uss) of this process in MiB from /proc/self/smaps_rollup (rss only elsewhere)."""
+    out = {"rss": 0.0, "pss": 0.0, "uss": 0.0}
+    try:
+        with open("/proc/self/smaps_rollup", "r", encoding="ascii") as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                kb = int(rest.split()[0]) if rest.strip() and rest.split()[0].isdigit() else 0
+                if key == "Rss":
+                    out["rss"] = kb / 1024
+                elif key == "Pss":
+                    out["pss"] = kb / 1024
+                elif key in ("Private_Clean", "Private_Dirty"):
+                    out["uss"] += kb / 1024
+    except OSError:
+        out["rss"] = rss_mb()
+    return out
+
+
+def probe_command(command: str, *args: str) -> List[str]:
+    return [sys.executable, "-m", "backend.app.bench", command, *args]
+
+
+def probe(command: str, *args: str, env: Optional[Dict[str, str]] = None) -> Dict:
+    """Run a probe subcommand in a fresh process; returns the JSON object on its last output line."""
+    out = subprocess.run(probe_command(command, *args), env=dict(os.environ, **(env or {})),
+                         check=True, capture_output=True, text=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def timed(fn: Callable, *args, **kwargs) -> Tuple[object, float]:
+    """(fn(*args, **kwargs), seconds it took)."""
+    t0 = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - t0
+
+
+def percentiles(samples: Sequence[float]) -> Tuple[float, float]:
+    samples = sorted(samples)
+    return samples[len(samples) // 2], samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+
+
+def latency(samples: Sequence[float]) -> str:
+    """p50 / p99 of latencies given in seconds, formatted in ms."""
+    p50, p99 = percentiles(samples)
+    return f"p50={p50 * 1000:8.3f} ms p99={p99 * 1000:8.3f} ms"
+
+
+def recall_at(found, truth, k: int) -> float:
+    """Mean share of each query's true top k (rows of truth) among its found rows."""
+    return sum(len(set(list(f)) & set(list(t))) / k for f, t in zip(found, truth)) / max(len(truth), 1)
+
+
+def unit_vectors(rng, n: int, dim: int = 384):
+    """n random float32 unit vectors (numpy Generator rng)."""
+    import numpy as np
+    vectors = rng.standard_normal((n, dim), dtype="float32")
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def held_out_mask(n: int, queries: int, seed: int = 0):
+    """Boolean mask of min(queries, n / 10) random rows to use as queries instead of corpus."""
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    held = np.zeros(n, dtype=bool)
+    held[rng.choice(n, min(queries, n // 10), replace=False)] = True
+    return held
+
+
+def synthetic_metadata(rows: int) -> List[Dict]:
+    subjects = ["Physics", "Chemistry", "Biology", "Mathematics"]
+    return [{"subject": subjects[i % 4], "source": f"book{i // 500}.pdf", "page": i % 500, "id": i}
+            for i in range(rows)]
+
+
+def sample_queries(n: int, seed: int = 0) -> Tuple[List[str], List[str]]:
+    """Build (queries, subjects) from stored chunk texts; a stand-in for logged questions."""
+    from .. import embedding_store
+    snap = embedding_store.snapshot()
+    total = snap.count
+    if total == 0:
+        raise SystemExit("The store is empty; run offline_ingest first.")
+    rng = random.Random(seed)
+    rows = [rng.randrange(total) for _ in range(n)]
+    queries = [" ".join(snap.texts[r].split()[:16]) or "physics" for r in rows]
+    subjects = [snap.metadata[r].get("subject") for r in rows]
+    return queries, subjects
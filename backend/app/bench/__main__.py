@@ -0,0 +1,15 @@
+import argparse
+from . import diversity, encoding, search, storage, stress
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m backend.app.bench", description="Retrieval layer measurements")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for module in (storage, search, encoding, diversity, stress):
+        module.register(sub)
+    args = parser.parse_args()
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""MMR re-selection: prompt tokens, distinct context and latency per prompting mode."""
+from __future__ import annotations
+from typing import List
+from . import latency, sample_queries, timed
+
+PROMPT_MODES = {
+    "standard": {},
+    "zero_shot": {"use_zero_shot": True},
+    "one_shot": {"use_one_shot": True},
+    "multi_shot": {"use_multi_shot": True},
+    "dynamic": {"use_dynamic": True},
+    "chain_of_thought": {"use_chain_of_thought": True},
+}
+
+
+def _shingles(texts: List[str], n: int = 8) -> set:
+    """Word n-grams of the texts: the distinct content a context carries."""
+    out = set()
+    for text in texts:
+        words = text.split()
+        out.update(tuple(words[i:i + n]) for i in range(max(len(words) - n + 1, 1)))
+    return out
+
+
+def bench_mmr(n: int, k_base: int, k: int, lambdas: List[float]):
+    """Prompt tokens, distinct content and latency per prompting mode: top-k_base vs top-k vs MMR top-k."""
+    from .. import embedding_store
+    from ..llm import count_tokens
+    from ..rag_pipeline import build_prompt
+    from ..embedding_store import similarity_search
+    queries, subjects = sample_queries(n)
+    embedding_store._result_cache.capacity = 0  # every search runs
+    similarity_search(queries[0], k=k_base, subject=subjects[0])  # warm up model and index
+    configs = [(f"top-{k_base}", k_base, 1.0), (f"top-{k}", k, 1.0)] + [(f"mmr-{k} l={lam:g}", k, lam) for lam in lambdas]
+    runs = {name: [timed(similarity_search, q, k=kk, subject=subj, mmr_lambda=lam)
+                   for q, subj in zip(queries, subjects)]
+            for name, kk, lam in configs}
+    retrieved = {name: [hits for hits, _ in run] for name, run in runs.items()}
+    base = f"top-{k_base}"
+    print(f"{len(queries)} sampled queries; content = distinct 8-word shingles of the context, "
+          f"coverage = share of the {base} context's shingles it still contains")
+    for name, _, _ in configs:
+        cover, distinct, redundant = [], [], []
+        for hits, base_hits in zip(retrieved[name], retrieved[base]):
+            texts = [h["text"] for h in hits]
+            mine, theirs = _shingles(texts), _shingles([h["text"] for h in base_hits])
+            total = sum(len(_shingles([t])) for t in texts)
+            distinct.append(len(mine))
+            redundant.append(1 - len(mine) / total if total else 0.0)
+            cover.append(len(mine & theirs) / len(theirs) if theirs else 1.0)
+        print(f"{name:14s} search {latency([s for _, s in runs[name]])} "
+              f"content={sum(distinct) / len(distinct):7.1f} repeated={sum(redundant) / len(redundant):5.1%} "
+              f"coverage={sum(cover) / len(cover):5.1%}")
+    print("prompt tokens (mean) and prompt build time per prompting mode:")
+    for mode, flags in PROMPT_MODES.items():
+        cells, base_tokens = [], None
+        for name, _, _ in configs:
+            prompts, build_s = timed(lambda: [build_prompt(q, hits, subject=subj, **flags)
+                                              for q, subj, hits in zip(queries, subjects, retrieved[name])])
+            tokens = sum(count_tokens(p) for p in prompts) / len(prompts)
+            base_tokens = base_tokens or tokens
+            saved = f" ({tokens / base_tokens - 1:+.0%})" if name != base else ""
+            cells.append(f"{name}={tokens:6.0f}{saved} {build_s * 1000 / len(prompts):.2f} ms")
+        print(f"  {mode:16s} " + "  ".join(cells))
+
+
+def register(sub):
+    mmr = sub.add_parser("mmr", help="Prompt tokens / distinct context / latency per prompting mode, top-k vs MMR")
+    mmr.add_argument("--queries", type=int, default=200)
+    mmr.add_argument("--k-base", type=int, default=6, help="Plain top-k to compare against")
+    mmr.add_argument("--k", type=int, default=4)
+    mmr.add_argument("--lambdas", type=float, nargs="+", default=[0.5, 0.7])
+    mmr.set_defaults(run=lambda a: bench_mmr(a.queries, a.k_base, a.k, a.lambdas))
@@ -0,0 +1,75 @@
+"""Encoder backends and the query micro-batcher: latency / throughput."""
+from __future__ import annotations
+import threading
+import time
+from typing import List
+from . import latency, timed
+
+
+def bench_encoder(backends: List[str], rounds: int):
+    """Batch-1 latency and batch-64 throughput of each encoder backend."""
+    from ..encoders import get_encoder, sample_texts
+    texts = sample_texts(64)
+    texts = (texts * (64 // len(texts) + 1))[:64]
+    batches = max(1, rounds // 16)
+    for backend in backends:
+        encoder = get_encoder(backend)
+        encoder.encode(texts[:8])  # warm up
+        single = [timed(encoder.encode, [texts[i % len(texts)]], batch_size=1)[1] for i in range(rounds)]
+        _, total_s = timed(lambda: [encoder.encode(texts, batch_size=64) for _ in range(batches)])
+        per_batch = total_s / batches
+        print(f"{encoder.name:55s} batch=1 {latency(single)} | "
+              f"batch=64 {per_batch * 1000:8.1f} ms ({64 / per_batch:7.1f} texts/s)")
+
+
+def bench_query_load(clients: List[int], seconds: float, batch_size: int, waits: List[float]):
+    """Query-encode latency p50 / p99 and queries/sec under N concurrent clients, direct vs micro-batched."""
+    from .. import embedding_store
+    from ..encoders import sample_texts
+    batcher = embedding_store._query_batcher
+    texts = [" ".join(t.split()[:24]) for t in sample_texts(256)]
+    embedding_store._embed_queries(texts[:4])  # warm up
+    counter = iter(range(10 ** 12))  # unique suffixes: every query misses the query cache
+    modes = [("direct", 1, 0.0)] + [(f"batched wait={w:g}ms", batch_size, w) for w in waits]
+    for name, size, wait in modes:
+        batcher.max_batch, batcher.max_wait_ms = size, wait
+        for n in clients:
+            batcher.reset_stats()
+            latencies: List[List[float]] = [[] for _ in range(n)]
+            stop = threading.Event()
+
+            def client(out: List[float]):
+                while not stop.is_set():
+                    i = next(counter)
+                    out.append(timed(embedding_store._embed_queries, [f"{texts[i % len(texts)]} #{i}"])[1])
+
+            threads = [threading.Thread(target=client, args=(out,)) for out in latencies]
+            t0 = time.perf_counter()
+            for t in threads:
+                t.start()
+            time.sleep(seconds)
+            stop.set()
+            for t in threads:
+                t.join()
+            elapsed = time.perf_counter() - t0
+            samples = [x for out in latencies for x in out]
+            stats = batcher.stats()
+            print(f"{name:22s} clients={n:3d} {latency(samples)} {len(samples) / elapsed:8.1f} q/s"
+                  + (f"  mean batch={stats['mean_batch']:5.1f}" if size > 1 else ""))
+    batcher.max_batch, batcher.max_wait_ms = batch_size, waits[0]
+
+
+def register(sub):
+    from ..config import settings
+    enc = sub.add_parser("encoder", help="Latency / throughput of encoder backends at batch 1 and 64")
+    enc.add_argument("--backends", nargs="+", default=["torch", "onnx"])
+    enc.add_argument("--rounds", type=int, default=200)
+    enc.set_defaults(run=lambda a: bench_encoder(a.backends, a.rounds))
+    qload = sub.add_parser("query-load", help="Concurrent query-encode latency / throughput, direct vs micro-batched")
+    qload.add_argument("--clients", type=int, nargs="+", default=[1, 8, 32])
+    qload.add_argument("--seconds", type=float, default=5.0, help="Per client count and mode")
+    qload.add_argument("--batch-size", type=int, default=None, help="Default: settings.query_batch_size")
+    qload.add_argument("--wait-ms", type=float, nargs="+", default=None, help="Default: settings.query_batch_wait_ms")
+    qload.set_defaults(run=lambda a: bench_query_load(a.clients, a.seconds,
+                                                      a.batch_size or max(settings.query_batch_size, 2),
+                                                      a.wait_ms or [settings.query_batch_wait_ms]))
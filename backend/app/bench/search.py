@@ -0,0 +1,246 @@
+"""Search paths: batching, BM25, PCA recall, hierarchical search and metadata filters."""
+from __future__ import annotations
+import tempfile
+from pathlib import Path
+from typing import List
+from . import held_out_mask, latency, recall_at, sample_queries, timed, unit_vectors
+
+
+def bench_batch(n: int, k: int):
+    """Queries/sec of a similarity_search loop versus one similarity_search_many call."""
+    from ..embedding_store import similarity_search, similarity_search_many
+    queries, subjects = sample_queries(n)
+    similarity_search(queries[0], k=k, subject=subjects[0])  # warm up model and index
+    looped, loop_s = timed(lambda: [similarity_search(q, k=k, subject=s) for q, s in zip(queries, subjects)])
+    batched, many_s = timed(similarity_search_many, queries, k=k, subjects=subjects)
+    same = all([r["metadata"]["id"] for r in a] == [r["metadata"]["id"] for r in b]
+               for a, b in zip(looped, batched))
+    print(f"queries={n} k={k}")
+    print(f"similarity_search loop   {n / loop_s:9.1f} q/s")
+    print(f"similarity_search_many   {n / many_s:9.1f} q/s  ({loop_s / many_s:.1f}x, identical results: {same})")
+
+
+def bench_lexical(docs: int, queries: int, max_postings: int, terms_per_doc: int = 120):
+    """Build / lookup cost of the BM25 index on a synthetic Zipf-distributed corpus."""
+    import numpy as np
+    from ..lexical_index import LexicalIndex, LexicalPart, build_part
+    rng = np.random.default_rng(0)
+    vocab = np.array([f"w{i}" for i in range(200_000)])
+
+    def texts():
+        # Zipf(1.1) word ranks, clipped to the vocabulary, like term frequencies in textbook prose
+        for start in range(0, docs, 10_000):
+            ranks = np.minimum(rng.zipf(1.1, size=(min(10_000, docs - start), terms_per_doc)) - 1, len(vocab) - 1)
+            for row in vocab[ranks]:
+                yield " ".join(row)
+
+    part, build_s = timed(build_part, texts())
+    with tempfile.TemporaryDirectory() as tmp:
+        part.save(Path(tmp) / "lexical")
+        size_mb = sum(f.stat().st_size for f in (Path(tmp) / "lexical").iterdir()) / 2**20
+        index, load_s = timed(lambda: LexicalIndex([(0, LexicalPart.load(Path(tmp) / "lexical"))]))
+        print(f"docs={docs} terms={len(part.terms)} postings={len(part.docs)} max_postings={max_postings or 'all'} "
+              f"build={build_s:.1f} s load={load_s * 1000:.0f} ms size={size_mb:.1f} MiB")
+        df = np.diff(np.asarray(part.offsets))
+        # Query terms drawn by document frequency band; "any" samples the vocabulary as text does
+        weights = df / df.sum()
+        for label, lo, hi in (("df<=100", 1, 100), ("df<=10k", 101, 10_000), ("df<=10%", 1, docs // 10),
+                              ("any", 1, docs)):
+            band = np.flatnonzero((df >= lo) & (df <= hi))
+            if not len(band):
+                continue
+            p = weights[band] / weights[band].sum() if label == "any" else None
+            latencies = []
+            for _ in range(queries):
+                query = " ".join(part.terms[int(t)] for t in rng.choice(band, size=3, p=p))
+                latencies.append(timed(index.search, query, 20, max_postings=max_postings or None)[1])
+            print(f"  3 terms, {label:8s} {latency(latencies)}")
+
+
+def _spectrum_vectors(n: int, dim: int = 384, seed: int = 0):
+    """Unit vectors with a decaying variance spectrum, a stand-in for sentence embeddings."""
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    basis, _ = np.linalg.qr(rng.standard_normal((dim, dim)))
+    scale = (np.arange(1, dim + 1) ** -0.75).astype("float32")
+    vectors = (rng.standard_normal((n, dim), dtype="float32") * scale) @ basis.T.astype("float32")
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def bench_recall(dims: List[int], k: int, queries: int, kind: str, synthetic: int):
+    """recall@k of PCA-projected indexes against the full-dimension flat index, on held-out chunk vectors."""
+    import faiss  # type: ignore
+    import numpy as np
+    from .. import index_factory
+    if synthetic:
+        vectors = _spectrum_vectors(synthetic)
+        label = f"synthetic ({synthetic} rows)"
+    else:
+        from .. import embedding_store
+        snap = embedding_store.snapshot()
+        if snap.live_count == 0:
+            raise SystemExit("The store is empty; run offline_ingest first (or pass --synthetic N).")
+        vectors = embedding_store._store._all_vectors(snap)
+        if len(snap.tombstones):
+            vectors = np.delete(vectors, snap.tombstones, axis=0)
+        label = f"{embedding_store.PERSIST_DIR} ({len(vectors)} rows)"
+    held_rows = held_out_mask(len(vectors), queries)
+    corpus, held = np.ascontiguousarray(vectors[~held_rows]), np.ascontiguousarray(vectors[held_rows])
+    _, truth = faiss.knn(held, corpus, k, metric=faiss.METRIC_INNER_PRODUCT)
+    pool = max(k * 10, 50)  # the dense candidate pool embedding_store re-scores
+    kind = index_factory.resolve_index_type(len(corpus), kind)
+    print(f"{label}: {len(corpus)} corpus / {len(held)} held-out queries, {kind} index, recall@{k}")
+    for dim in [0] + dims:
+        if dim and len(corpus) < index_factory.PCA_MIN_TRAIN_POINTS:
+            print(f"  pca_dim={dim}: needs at least {index_factory.PCA_MIN_TRAIN_POINTS} rows")
+            continue
+        index, build_s = timed(index_factory.build_index, kind, corpus, params={"pca_dim": dim})
+        (_, found), search_s = timed(index.search, held, k)
+        _, candidates = index.search(held, pool)
+        rescored = []
+        for q, rows in zip(held, candidates):
+            rows = rows[rows >= 0]
+            rescored.append(rows[np.argsort(-(corpus[rows] @ q), kind="stable")[:k]])
+        print(f"  pca_dim={dim or corpus.shape[1]:4d} index={len(faiss.serialize_index(index)) / 2**20:7.1f} MiB "
+              f"build={build_s:6.1f} s search={search_s * 1000 / len(held):6.3f} ms/query "
+              f"recall@{k}={recall_at(found, truth, k):.3f} re-scored from {pool}={recall_at(rescored, truth, k):.3f}")
+
+
+def _chapter_vectors(chapters: int, pages: int, chunks: int, dim: int = 384, seed: int = 0):
+    """Unit vectors clustered by chapter and page, with the matching metadata rows."""
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    unit = lambda x: (x / np.linalg.norm(x, axis=-1, keepdims=True)).astype("float32")
+    centers = unit(rng.standard_normal((chapters, 1, dim)))
+    page_centers = unit(centers + 0.8 * unit(rng.standard_normal((chapters, pages, dim))))
+    vectors = unit(page_centers[:, :, None, :] + 0.9 * unit(rng.standard_normal((chapters, pages, chunks, dim))))
+    rows = [{"subject": "Physics", "source": f"ch{c:04d}.pdf", "page": p, "id": (c * pages + p) * chunks + j}
+            for c in range(chapters) for p in range(pages) for j in range(chunks)]
+    return vectors.reshape(-1, dim), rows
+
+
+def bench_hierarchical(chapter_counts: List[int], pages: int, chunks: int, queries: int, k: int):
+    """Query latency and recall@k of chapter -> page -> chunk search vs an exact scan, as chapters grow."""
+    import faiss  # type: ignore
+    import numpy as np
+    from ..coarse_index import build_coarse
+    from ..config import settings
+    from ..metadata_columns import build_columns
+    faiss.omp_set_num_threads(1)
+    pool = max(k * 10, 50)
+    for chapters in chapter_counts:
+        vectors, rows = _chapter_vectors(chapters, pages, chunks)
+        held_rows = held_out_mask(len(vectors), queries)
+        corpus, held = np.ascontiguousarray(vectors[~held_rows]), np.ascontiguousarray(vectors[held_rows])
+        coarse = build_coarse(build_columns(r for r, h in zip(rows, held_rows) if not h), [corpus], corpus.shape[1])
+        _, truth = faiss.knn(held, corpus, k, metric=faiss.METRIC_INNER_PRODUCT)
+        flat = faiss.IndexFlatIP(corpus.shape[1])
+        flat.add(corpus)
+        fallbacks, searched = 0, []
+
+        def hierarchical(q):
+            nonlocal fallbacks
+            cand = coarse.select(q, settings.coarse_chapters, settings.coarse_pages, settings.coarse_margin, pool)
+            if cand is None:
+                fallbacks += 1
+                return flat.search(q[None, :], pool)[1][0]
+            searched.append(len(cand))
+            return cand[np.argsort(-(corpus[cand] @ q))[:pool]]
+
+        exact_s = [timed(flat.search, q[None, :], pool)[1] for q in held]
+        runs = [timed(hierarchical, q) for q in held]
+        found = [top[:k] for top, _ in runs]
+        print(f"chapters={chapters:5d} chunks={len(corpus):8d} exact {latency(exact_s)} "
+              f"hierarchical {latency([s for _, s in runs])} recall@{k}={recall_at(found, truth, k):.3f} "
+              f"fallback={fallbacks / len(held):.1%} chunks scored={np.mean(searched) if searched else 0:.0f}")
+
+
+def bench_filter(docs: int, queries: int, k: int, kind: str):
+    """Filtered search: subject post-filter over a max(k*10, 50) pool vs filters pushed into the search."""
+    import faiss  # type: ignore
+    import numpy as np
+    from ..config import settings
+    from ..embedding_store import EmbeddingStore, StoreSnapshot, _FilterRows, _select
+    from ..metadata_columns import MetadataChain, build_columns
+    from ..metadata_filter import parse_filter
+    from ..vector_archive import VectorChain
+    faiss.omp_set_num_threads(1)
+    rng = np.random.default_rng(0)
+    vectors = unit_vectors(rng, docs)
+    # Skewed subjects (Geology: 0.1% of the chunks) over 300-chunk chapters
+    subjects = rng.choice(["Physics", "Chemistry", "Biology", "Mathematics", "Geology"], size=docs,
+                          p=[0.45, 0.3, 0.2, 0.049, 0.001])
+    rows = [{"subject": str(subject), "source": f"book{i // 300}.pdf", "page": (i % 300) // 4, "id": i}
+            for i, subject in enumerate(subjects)]
+    kind = kind or "flat"
+    index = faiss.IndexHNSWFlat(384, settings.hnsw_m, faiss.METRIC_INNER_PRODUCT) if kind == "hnsw" else faiss.IndexFlatIP(384)
+    if kind == "hnsw":
+        index.hnsw.efConstruction = settings.hnsw_ef_construction
+        index.hnsw.efSearch = settings.hnsw_ef_search
+    index.add(vectors)
+    snap = StoreSnapshot(index=index, metadata=MetadataChain([build_columns(rows)]), vectors=VectorChain([(0, vectors)]))
+    store = EmbeddingStore.__new__(EmbeddingStore)  # only the search helpers are used
+    q_emb = unit_vectors(rng, queries)
+    pool = max(k * 10, 50)
+    books = ", ".join(f"book{i}" for i in range(0, docs // 300, 97))
+    cases = [("subject = Physics", "Physics"), ("subject = Mathematics", "Mathematics"),
+             ("subject = Geology", "Geology"), (f"subject = Physics AND source in {{{books}}}", None),
+             ("subject = Biology AND page in 10..19", None)]
+
+    def post_filter(q, subject):
+        scores, idxs = index.search(q, pool)
+        return [i for i, _ in _select(snap, scores[0], idxs[0], k, subject) if subjects[i] == subject]
+
+    def pushdown(q, where):
+        return store._candidates(snap, q, pool, _FilterRows(snap).get(where))[0][1][:k].tolist()
+
+    for text, subject in cases:
+        where = parse_filter(text)
+        where.rows(snap.metadata)  # the sorted columns are built on first use
+        subset, eval_s = timed(where.rows, snap.metadata)
+        truth = [subset[np.argsort(-(vectors[subset] @ q))[:k]] for q in q_emb]
+        runs = {"pushdown": [timed(pushdown, q_emb[j:j + 1], where) for j in range(queries)]}
+        if subject:
+            runs["post"] = [timed(post_filter, q_emb[j:j + 1], subject) for j in range(queries)]
+        line = f"{text[:48]:48s} rows={len(subset):8d} ({len(subset) / docs:6.2%}) eval={eval_s * 1000:6.2f} ms"
+        for name in ("post", "pushdown"):
+            if name in runs:
+                found = [r for r, _ in runs[name]]
+                short = np.mean([len(r) < k for r in found])
+                line += (f" | {name} {latency([s for _, s in runs[name]])} "
+                         f"recall@{k}={recall_at(found, truth, k):.3f} short={short:.0%}")
+        print(line)
+
+
+def register(sub):
+    from ..config import settings
+    batch = sub.add_parser("batch", help="Throughput of similarity_search_many vs a per-query loop")
+    batch.add_argument("--queries", type=int, default=512)
+    batch.add_argument("--k", type=int, default=6)
+    batch.set_defaults(run=lambda a: bench_batch(a.queries, a.k))
+    lex = sub.add_parser("lexical", help="BM25 index build size and lookup latency on a synthetic corpus")
+    lex.add_argument("--docs", type=int, default=1_000_000)
+    lex.add_argument("--queries", type=int, default=500)
+    lex.add_argument("--max-postings", type=int, default=None, help="Default: settings.bm25_max_postings")
+    lex.set_defaults(run=lambda a: bench_lexical(
+        a.docs, a.queries, settings.bm25_max_postings if a.max_postings is None else a.max_postings))
+    rec = sub.add_parser("recall", help="recall@k of PCA-projected indexes vs the full-dimension flat index")
+    rec.add_argument("--dims", type=int, nargs="+", default=[128, 192])
+    rec.add_argument("--k", type=int, default=10)
+    rec.add_argument("--queries", type=int, default=500, help="Chunks held out of the corpus as queries")
+    rec.add_argument("--index-type", default=None, help="flat / ivf / hnsw (default: settings)")
+    rec.add_argument("--synthetic", type=int, default=0, help="Use N generated vectors instead of the store")
+    rec.set_defaults(run=lambda a: bench_recall(a.dims, a.k, a.queries, a.index_type, a.synthetic))
+    hier = sub.add_parser("hierarchical", help="Chapter -> page -> chunk search latency / recall vs chapter count")
+    hier.add_argument("--chapters", type=int, nargs="+", default=[50, 200, 800])
+    hier.add_argument("--pages", type=int, default=30, help="Pages per chapter")
+    hier.add_argument("--chunks", type=int, default=4, help="Chunks per page")
+    hier.add_argument("--queries", type=int, default=300)
+    hier.add_argument("--k", type=int, default=10)
+    hier.set_defaults(run=lambda a: bench_hierarchical(a.chapters, a.pages, a.chunks, a.queries, a.k))
+    flt = sub.add_parser("filter", help="Metadata-filtered search: post-filtering vs filters pushed into FAISS")
+    flt.add_argument("--docs", type=int, default=200_000)
+    flt.add_argument("--queries", type=int, default=200)
+    flt.add_argument("--k", type=int, default=6)
+    flt.add_argument("--index-type", default=None, help="flat / hnsw (default: flat)")
+    flt.set_defaults(run=lambda a: bench_filter(a.docs, a.queries, a.k, a.index_type))
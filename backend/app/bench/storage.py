@@ -0,0 +1,167 @@
+"""Store load time and memory: texts / metadata layouts, and N workers on a directory vs a pack."""
+from __future__ import annotations
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List
+from . import probe, probe_command, rss_mb, smaps_mb, synthetic_metadata, timed, unit_vectors
+
+
+def bench_load(store: Path):
+    """Compare store load time / RSS for the JSONL texts layout against texts.bin."""
+    from ..text_store import migrate_jsonl
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy = Path(tmp) / "legacy"
+        migrated = Path(tmp) / "migrated"
+        shutil.copytree(store, legacy)
+        shutil.copytree(store, migrated)
+        if (migrated / "texts.jsonl").exists():
+            migrate_jsonl(migrated / "texts.jsonl", migrated / "texts.bin")
+            (migrated / "texts.jsonl").unlink()
+        for label, path in (("texts.jsonl", legacy), ("texts.bin", migrated)):
+            stats = probe("_load_probe", env={"PERSIST_DIRECTORY": str(path)})
+            print(f"{label:12s} chunks={stats['chunks']} load={stats['load_s'] * 1000:.1f} ms "
+                  f"rss_delta={stats['rss_delta_mb']:.1f} MiB")
+
+
+def _load_probe():
+    from .. import embedding_store
+    before = rss_mb()
+    snap, load_s = timed(embedding_store.snapshot)
+    print(json.dumps({"chunks": snap.count, "load_s": round(load_s, 4), "rss_delta_mb": round(rss_mb() - before, 2)}))
+
+
+def bench_metadata(sizes: List[int]):
+    """Startup time / memory of chunk metadata as JSONL dicts vs the binary columns."""
+    from ..metadata_columns import build_columns, save_columns
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in sizes:
+            rows = synthetic_metadata(n)
+            legacy, columns = Path(tmp) / "metadata.jsonl", Path(tmp) / "metadata.cols"
+            with legacy.open("w", encoding="utf-8") as f:
+                for row in rows:
+                    f.write(json.dumps(row, ensure_ascii=False) + "\n")
+            save_columns(columns, build_columns(rows))
+            del rows
+            for path in (legacy, columns):
+                stats = probe("_metadata_probe", str(path))
+                print(f"rows={n:8d} {path.name:15s} file={path.stat().st_size / 2**20:7.1f} MiB "
+                      f"load={stats['load_s'] * 1000:8.1f} ms rss_delta={stats['rss_delta_mb']:7.1f} MiB "
+                      f"subject filter/60 rows={stats['filter_us']:6.1f} us")
+
+
+def _metadata_probe(path: Path):
+    """Load one metadata file (metadata.jsonl as dicts or metadata.cols as columns) and filter by subject."""
+    import numpy as np
+    from ..metadata_columns import load_columns
+    jsonl = path.suffix == ".jsonl"
+
+    def load():
+        if not jsonl:
+            return load_columns(path)
+        with path.open("r", encoding="utf-8") as f:
+            return tuple(json.loads(line) for line in f)
+
+    before = rss_mb()
+    metadata, load_s = timed(load)
+    rss = rss_mb() - before
+    pools = np.random.default_rng(0).integers(0, len(metadata), size=(200, 60))  # candidate pools of 60
+    _, filter_s = timed(lambda: [[metadata[i].get("subject") == "Physics" for i in pool] if jsonl
+                                 else metadata.matches("subject", "Physics", pool) for pool in pools])
+    print(json.dumps({"rows": len(metadata), "load_s": load_s, "rss_delta_mb": rss,
+                      "filter_us": filter_s / len(pools) * 1e6}))
+
+
+def _synthetic_store(path: Path, docs: int, dim: int = 384):
+    """Write a docs-row store of random unit vectors and generated texts without running the encoder."""
+    import faiss  # type: ignore
+    import numpy as np
+    from ..dedup import DedupChain
+    from ..embedding_store import EmbeddingStore, StoreSnapshot
+    from ..lexical_index import LexicalIndex, build_part
+    from ..metadata_columns import MetadataChain, build_columns
+    from ..text_store import TextChain
+    rng = np.random.default_rng(0)
+    index = faiss.IndexFlatIP(dim)
+    index.add(unit_vectors(rng, docs, dim))
+    vocab = np.array([f"w{i}" for i in range(50_000)])
+    texts = [" ".join(row) for row in vocab[np.minimum(rng.zipf(1.1, size=(docs, 120)) - 1, len(vocab) - 1)]]
+    store = EmbeddingStore(path)
+    snap = StoreSnapshot(index=index, metadata=MetadataChain([build_columns(synthetic_metadata(docs))]),
+                         texts=TextChain([texts]), lexical=LexicalIndex([(0, build_part(texts))]),
+                         dedup=DedupChain([(0, np.zeros(docs, dtype="uint64"),
+                                            np.zeros((docs, store._hasher.num_perm), dtype="uint32"))]),
+                         next_id=docs)
+    store._compact(snap)
+    return store
+
+
+def bench_workers(counts: List[int], docs: int, queries: int):
+    """Per-worker memory of N server processes: each loading the store directory vs mapping one pack."""
+    with tempfile.TemporaryDirectory() as tmp:
+        store_dir, pack_path = Path(tmp) / "store", Path(tmp) / "store.pack"
+        _, build_s = timed(lambda: _synthetic_store(store_dir, docs).pack(pack_path))
+        print(f"docs={docs} store={sum(f.stat().st_size for f in store_dir.rglob('*') if f.is_file()) / 2**20:.0f} MiB "
+              f"pack={pack_path.stat().st_size / 2**20:.0f} MiB (built in {build_s:.0f} s)")
+        for label, extra in (("directory", {"PERSIST_DIRECTORY": str(store_dir)}),
+                             ("packed", {"PERSIST_DIRECTORY": str(store_dir), "PACKED_STORE": str(pack_path)})):
+            for n in counts:
+                procs = [subprocess.Popen(probe_command("_serve_probe", "--queries", str(queries)),
+                                          env=dict(os.environ, **extra), stdin=subprocess.PIPE,
+                                          stdout=subprocess.PIPE, text=True)
+                         for _ in range(n)]
+                for p in procs:
+                    if p.stdout.readline().strip() != "ready":
+                        raise SystemExit(f"worker {p.pid} failed")
+                for p in procs:
+                    p.stdin.write("\n")
+                    p.stdin.flush()
+                stats = [json.loads(p.stdout.readline()) for p in procs]
+                for p in procs:
+                    p.wait()
+                mean = lambda key: sum(s[key] for s in stats) / n
+                print(f"  {label:9s} workers={n} load={mean('load_s') * 1000:7.0f} ms "
+                      f"rss/worker={mean('rss'):6.0f} MiB (store {mean('rss') - mean('base_rss'):5.0f}) "
+                      f"pss/worker={mean('pss'):6.0f} MiB uss/worker={mean('uss'):6.0f} MiB "
+                      f"total pss={sum(s['pss'] for s in stats):6.0f} MiB")
+
+
+def _serve_probe(queries: int):
+    """One stand-in server worker: load the store, answer a few queries, report memory when told to."""
+    from .. import embedding_store
+    base = smaps_mb()
+    snap, load_s = timed(embedding_store.snapshot)
+    rng = random.Random(os.getpid())
+    rows = [rng.randrange(snap.count) for _ in range(queries)]
+    embedding_store.similarity_search_many([" ".join(snap.texts[r].split()[:12]) for r in rows], k=6, snap=snap)
+    print("ready", flush=True)
+    sys.stdin.readline()  # every worker has loaded: shared pages are now split between them
+    print(json.dumps({"load_s": load_s, "base_rss": base["rss"], **smaps_mb()}), flush=True)
+
+
+def register(sub):
+    load = sub.add_parser("load", help="Store load time and RSS, JSONL vs binary texts")
+    load.add_argument("--store", type=Path, default=Path("vector_store"))
+    load.set_defaults(run=lambda a: bench_load(a.store))
+    meta = sub.add_parser("metadata", help="Metadata load time / RSS: JSONL dicts vs binary columns")
+    meta.add_argument("--rows", type=int, nargs="+", default=[3000, 1_000_000])
+    meta.set_defaults(run=lambda a: bench_metadata(a.rows))
+    workers = sub.add_parser("workers", help="Per-worker RSS / PSS with N processes: store directory vs packed file")
+    workers.add_argument("--counts", type=int, nargs="+", default=[1, 4, 8])
+    workers.add_argument("--docs", type=int, default=200_000)
+    workers.add_argument("--queries", type=int, default=32)
+    workers.set_defaults(run=lambda a: bench_workers(a.counts, a.docs, a.queries))
+    # Probes: run in a fresh process by the benchmarks above
+    sub.add_parser("_load_probe").set_defaults(run=lambda a: _load_probe())
+    meta_probe = sub.add_parser("_metadata_probe")
+    meta_probe.add_argument("path", type=Path)
+    meta_probe.set_defaults(run=lambda a: _metadata_probe(a.path))
+    serve = sub.add_parser("_serve_probe")
+    serve.add_argument("--queries", type=int, default=32)
+    serve.set_defaults(run=lambda a: _serve_probe(a.queries))
@@ -0,0 +1,91 @@
+"""Snapshot consistency under concurrent writes, removals, resets and searches."""
+from __future__ import annotations
+import random
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import List
+
+
+def _check_snapshot(snap) -> List[str]:
+    """Invariants every published snapshot must satisfy."""
+    errors = []
+    rows = snap.base_count + sum(delta.ntotal for _, delta in snap.deltas)
+    if not (snap.count == len(snap.texts) == rows):
+        errors.append(f"v{snap.version}: metadata={snap.count} texts={len(snap.texts)} index rows={rows}")
+    return errors
+
+
+def bench_stress(seconds: float, readers: int, batch: int, reset_every: int):
+    """Concurrent ingest / replace + search + reset against a scratch store; fails on any torn read."""
+    from ..config import settings
+    from ..embedding_store import EmbeddingStore
+    subjects = ["physics", "chemistry", "biology", "mathematics"]
+    settings.compact_min_rows = batch * 4  # compact every few batches
+    errors: List[str] = []
+    counts = {"batches": 0, "searches": 0, "resets": 0, "compactions": 0, "removed": 0}
+    stop = threading.Event()
+
+    def writer(store):
+        token = 0
+        while not stop.is_set():
+            chunks, metadata = [], []
+            for _ in range(batch):
+                subject = subjects[token % len(subjects)]
+                chunks.append(f"tok-{token} {subject} chunk about topic {token % 97}")
+                metadata.append({"token": token, "subject": subject, "source": f"src-{counts['batches'] % 5}.pdf"})
+                token += 1
+            before = store.snapshot().base
+            if counts["batches"] % 2:
+                counts["removed"] += store.replace_source(metadata[0]["source"], chunks, metadata)["removed"]
+            else:
+                store.add_texts(chunks, metadata)
+            counts["batches"] += 1
+            counts["compactions"] += store.snapshot().base != before
+            if reset_every and counts["batches"] % reset_every == 0:
+                store.reset()
+                counts["resets"] += 1
+
+    def reader(store, seed):
+        rng = random.Random(seed)
+        while not stop.is_set():
+            snap = store.snapshot()
+            errors.extend(_check_snapshot(snap))
+            dead = {snap.metadata[row]["id"] for row in snap.tombstones}
+            queries = [f"topic {rng.randrange(97)}" for _ in range(8)]
+            wanted = [rng.choice(subjects + [None]) for _ in queries]
+            for results in store.search_many(queries, 5, wanted, snap=snap):
+                for r in results:
+                    if not r["text"].startswith(f"tok-{r['metadata']['token']} "):
+                        errors.append(f"v{snap.version}: text/metadata mismatch for id {r['metadata']['id']}")
+                    if r["metadata"]["id"] in dead:
+                        errors.append(f"v{snap.version}: removed id {r['metadata']['id']} returned")
+            counts["searches"] += len(queries)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = EmbeddingStore(Path(tmp))
+        threads = [threading.Thread(target=writer, args=(store,))]
+        threads += [threading.Thread(target=reader, args=(store, i)) for i in range(readers)]
+        for t in threads:
+            t.start()
+        time.sleep(seconds)
+        stop.set()
+        for t in threads:
+            t.join()
+        errors.extend(_check_snapshot(store.snapshot()))
+    print(f"seconds={seconds} readers={readers} batches={counts['batches']} compactions={counts['compactions']} "
+          f"resets={counts['resets']} removed={counts['removed']} searches={counts['searches']} errors={len(errors)}")
+    for e in errors[:10]:
+        print("  " + e)
+    if errors:
+        raise SystemExit(1)
+
+
+def register(sub):
+    stress = sub.add_parser("stress", help="Concurrent add_texts / search / reset consistency check")
+    stress.add_argument("--seconds", type=float, default=20)
+    stress.add_argument("--readers", type=int, default=4)
+    stress.add_argument("--batch", type=int, default=32)
+    stress.add_argument("--reset-every", type=int, default=50)
+    stress.set_defaults(run=lambda a: bench_stress(a.seconds, a.readers, a.batch, a.reset_every))
@@ -0,0 +1,119 @@
+"""Two-level (chapter -> page -> chunk) retrieval over the base rows.
+
+Every chunk belongs to a chapter PDF (metadata "source", e.g. lebo103.pdf) and a page.
+A CoarseIndex holds the normalized mean vector of each page and of each chapter, and
+the base rows of every page. With settings.hierarchical_search a query scores the
+chapter centroids, then the page centroids of the best settings.coarse_chapters
+chapters, and searches exactly (inner product against the raw vectors, see
+vector_archive) only the chunks of the best settings.coarse_pages pages. The work
+per query depends on those two settings and on page sizes, not on the number of
+chapters in the store.
+
+When the chapter ranking is ambiguous (a chapter left out scores within
+settings.coarse_margin of the best one) or the pages hold too few chunks, `select`
+returns None and embedding_store searches the whole base instead. With a metadata
+filter (or a subject) only the chapters and pages holding matching rows are ranked.
+
+Built at compaction for the new base generation (coarse/ next to lexical/); delta
+segments are always searched in full.
+"""
+from __future__ import annotations
+import os
+import shutil
+from pathlib import Path
+from typing import Iterable, Optional
+import numpy as np
+from .metadata_columns import MetadataColumns
+
+ARRAYS = ("chapter_centroids", "chapter_pages", "page_centroids", "page_offsets", "page_rows")
+
+
+class CoarseIndex:
+    """Chapter / page centroids with page -> row lists (CSR)."""
+
+    def __init__(self, chapter_centroids: np.ndarray, chapter_pages: np.ndarray, page_centroids: np.ndarray,
+                 page_offsets: np.ndarray, page_rows: np.ndarray):
+        self.chapter_centroids = chapter_centroids  # (chapters, d), normalized
+        self.chapter_pages = chapter_pages  # chapter c owns pages chapter_pages[c]:chapter_pages[c + 1]
+        self.page_centroids = page_centroids  # (pages, d), normalized
+        self.page_offsets = page_offsets  # page p owns page_rows[page_offsets[p]:page_offsets[p + 1]]
+        self.page_rows = page_rows  # base rows grouped by page
+
+    @property
+    def ntotal(self) -> int:
+        return len(self.page_rows)
+
+    def pages_with(self, rows: np.ndarray) -> np.ndarray:
+        """Boolean mask of the pages holding at least one of the given base rows."""
+        present = np.zeros(len(self.page_rows), dtype=bool)
+        present[rows] = True
+        return np.logical_or.reduceat(present[self.page_rows], self.page_offsets[:-1])
+
+    def select(self, q: np.ndarray, chapters: int, pages: int, margin: float, min_rows: int,
+               allowed: Optional[np.ndarray] = None) -> Optional[np.ndarray]:
+        """Base rows of the best pages of the best chapters for q, or None when the coarse ranking is ambiguous.
+
+        allowed (see pages_with) limits the ranking to the chapters and pages of a metadata filter.
+        """
+        chapter_ids = np.arange(len(self.chapter_centroids))
+        if allowed is not None:
+            chapter_ids = np.flatnonzero(np.logical_or.reduceat(allowed, self.chapter_pages[:-1]))
+            if not len(chapter_ids):
+                return None
+            scores = np.asarray(self.chapter_centroids[chapter_ids], dtype="float32") @ q
+        else:
+            scores = self.chapter_centroids @ q
+        if len(scores) > chapters:
+            top = np.argpartition(-scores, chapters)[:chapters + 1]
+            top = top[np.argsort(-scores[top])]
+            if scores[top[0]] - scores[top[chapters]] < margin:
+                return None
+            top = top[:chapters]
+        else:
+            top = np.arange(len(scores))
+        candidates = np.concatenate([np.arange(self.chapter_pages[c], self.chapter_pages[c + 1])
+                                     for c in chapter_ids[top]])
+        if allowed is not None:
+            candidates = candidates[allowed[candidates]]
+        if len(candidates) > pages:
+            page_scores = np.asarray(self.page_centroids[candidates], dtype="float32") @ q
+            candidates = candidates[np.argpartition(-page_scores, pages)[:pages]]
+        rows = np.concatenate([self.page_rows[self.page_offsets[p]:self.page_offsets[p + 1]] for p in candidates])
+        return rows if len(rows) >= min_rows else None
+
+    def save(self, path: Path):
+        """Write to the directory path (replaced atomically as a whole)."""
+        path = Path(path)
+        tmp = path.with_name(path.name + ".tmp")
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+        for name in ARRAYS:
+            np.save(tmp / f"{name}.npy", getattr(self, name))
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Path) -> "CoarseIndex":
+        return cls(*(np.load(Path(path) / f"{name}.npy", mmap_mode="r") for name in ARRAYS))
+
+
+def _normalized(sums: np.ndarray) -> np.ndarray:
+    return (sums / (np.linalg.norm(sums, axis=1, keepdims=True) + 1e-12)).astype("float32")
+
+
+def build_coarse(metadata: MetadataColumns, batches: Iterable[np.ndarray], d: int) -> CoarseIndex:
+    """Group rows by (source, page) and average their vectors (batches: all rows in order)."""
+    # Pages sort by chapter first, so each chapter's pages are contiguous
+    keys = (metadata.source_codes.astype("int64") << 32) | (metadata.pages.astype("int64") & 0xFFFFFFFF)
+    page_keys, page_of_row = np.unique(keys, return_inverse=True)
+    _, chapter_starts = np.unique(page_keys >> 32, return_index=True)
+    sums = np.zeros((len(page_keys), d), dtype="float64")
+    row = 0
+    for block in batches:
+        np.add.at(sums, page_of_row[row:row + len(block)], block)
+        row += len(block)
+    chapter_pages = np.append(chapter_starts, len(page_keys)).astype("int64")
+    counts = np.bincount(page_of_row, minlength=len(page_keys))
+    return CoarseIndex(_normalized(np.add.reduceat(sums, chapter_starts, axis=0)), chapter_pages, _normalized(sums),
+                       np.concatenate([[0], np.cumsum(counts)]).astype("int64"),
+                       np.argsort(page_of_row, kind="stable").astype("int64"))
@@ -9,6 +9,9 @@ PROJECT_ROOT = Path(__file__).parent.parent.parent
 # Load .env from project root
 dotenv_path = PROJECT_ROOT / '.env'
 load_dotenv(dotenv_path=dotenv_path)
+# Index settings written by python -m backend.app.autotune; the environment and .env take precedence
+INDEX_TUNING_FILE = os.getenv("INDEX_TUNING_FILE", str(PROJECT_ROOT / "index_tuning.env"))
+load_dotenv(dotenv_path=INDEX_TUNING_FILE)
 
 class Settings(BaseModel):
     google_api_key: str | None = os.getenv("GOOGLE_API_KEY")
@@ -17,7 +20,71 @@ class Settings(BaseModel):
     chunk_size: int = int(os.getenv("CHUNK_SIZE", 800))
     chunk_overlap: int = int(os.getenv("CHUNK_OVERLAP", 120))
     read_only: bool = os.getenv("READ_ONLY_MODE", "false").lower() in {"1", "true", "yes"}
+    # Serve from a single packed file (python -m backend.app.packed_store pack) instead of persist_directory
+    packed_store: str = os.getenv("PACKED_STORE", "")
+    pack_verify: bool = os.getenv("PACK_VERIFY", "false").lower() in {"1", "true", "yes"}  # crc32 every section on load
+    # Scatter-gather over shard servers (python -m backend.app.shards serve): "host:port,host:port"
+    shards: str = os.getenv("SHARDS", "")
+    shard_timeout: float = float(os.getenv("SHARD_TIMEOUT", 2.0))  # seconds; slower shards are skipped (partial results)
+    shard_authkey: str = os.getenv("SHARD_AUTHKEY", "")  # required by serve and the coordinator; no default
+    reload_interval: float = float(os.getenv("RELOAD_INTERVAL", 5))  # seconds between store manifest checks when read-only (0 disables)
     max_retrieve: int = int(os.getenv("MAX_RETRIEVE", 6))
     temperature_default: float = float(os.getenv("TEMPERATURE_DEFAULT", 0.2))
+    # Delta segments are merged into the base files once they hold this fraction of the base (0 disables)
+    compact_ratio: float = float(os.getenv("COMPACT_RATIO", 1.0))
+    compact_min_rows: int = int(os.getenv("COMPACT_MIN_ROWS", 5000))
+    # FAISS index: flat | ivf | hnsw | auto (flat until auto_index_threshold vectors, then auto_index_type)
+    index_type: str = os.getenv("INDEX_TYPE", "flat")
+    auto_index_type: str = os.getenv("AUTO_INDEX_TYPE", "hnsw")
+    auto_index_threshold: int = int(os.getenv("AUTO_INDEX_THRESHOLD", 50000))
+    ivf_nlist: int = int(os.getenv("IVF_NLIST", 0))  # 0 derives nlist from the corpus size
+    ivf_nprobe: int = int(os.getenv("IVF_NPROBE", 16))
+    hnsw_m: int = int(os.getenv("HNSW_M", 32))
+    hnsw_ef_construction: int = int(os.getenv("HNSW_EF_CONSTRUCTION", 80))
+    hnsw_ef_search: int = int(os.getenv("HNSW_EF_SEARCH", 128))
+    # Compressed index codes: none | sq8 | pq (candidates are re-scored against float32 vectors on disk)
+    index_compression: str = os.getenv("INDEX_COMPRESSION", "none")
+    pq_m: int = int(os.getenv("PQ_M", 96))  # sub-quantizers; must divide the embedding dimension
+    vector_archive_dtype: str = os.getenv("VECTOR_ARCHIVE_DTYPE", "float32")  # raw vectors.npy rows: float32 | float16
+    # Learned PCA projection in front of the base index (e.g. 128 or 192; 0 keeps the full dimension)
+    pca_dim: int = int(os.getenv("PCA_DIM", 0))
+    index_tuning_file: str = INDEX_TUNING_FILE  # env file python -m backend.app.autotune writes
+    # Text encoder: torch (SentenceTransformer) | onnx (exported model under onnx_model_dir)
+    encoder_backend: str = os.getenv("ENCODER_BACKEND", "torch")
+    onnx_model_dir: str = os.getenv("ONNX_MODEL_DIR", "models/all-MiniLM-L6-v2-onnx")
+    onnx_int8: bool = os.getenv("ONNX_INT8", "true").lower() in {"1", "true", "yes"}
+    # Retrieval: dense (FAISS only) | hybrid (FAISS + BM25 fused by reciprocal rank)
+    search_mode: str = os.getenv("SEARCH_MODE", "dense")
+    hybrid_pool: int = int(os.getenv("HYBRID_POOL", 20))  # candidates taken from each ranking in hybrid mode
+    rrf_k: int = int(os.getenv("RRF_K", 60))
+    bm25_k1: float = float(os.getenv("BM25_K1", 1.2))
+    bm25_b: float = float(os.getenv("BM25_B", 0.75))
+    bm25_max_postings: int = int(os.getenv("BM25_MAX_POSTINGS", 2048))  # per term; 0 reads full postings lists
+    # Ingest de-duplication: exact content hashes, plus (opt-in) MinHash near-duplicates at this Jaccard, e.g. 0.9
+    dedup_exact: bool = os.getenv("DEDUP_EXACT", "true").lower() in {"1", "true", "yes"}
+    near_dup_threshold: float = float(os.getenv("NEAR_DUP_THRESHOLD", 0))  # 0: near-duplicates are stored
+    minhash_permutations: int = int(os.getenv("MINHASH_PERMUTATIONS", 128))
+    # Two-level search: chapter / page centroids pick the base chunks searched exactly (see coarse_index)
+    hierarchical_search: bool = os.getenv("HIERARCHICAL_SEARCH", "false").lower() in {"1", "true", "yes"}
+    coarse_chapters: int = int(os.getenv("COARSE_CHAPTERS", 8))
+    coarse_pages: int = int(os.getenv("COARSE_PAGES", 48))
+    coarse_margin: float = float(os.getenv("COARSE_MARGIN", 0.01))  # chapter score gap below which search is global
+    # Metadata-filtered searches score subsets up to this many rows exactly; larger ones go through FAISS ID selectors
+    filter_exact_rows: int = int(os.getenv("FILTER_EXACT_ROWS", 20000))
+    tombstone_ratio: float = float(os.getenv("TOMBSTONE_RATIO", 0.2))  # removed-row share that triggers a compaction
+    # Persistent (model, chunk text sha) -> embedding cache used by add_texts, e.g. embedding_cache.sqlite
+    # (relative paths are under persist_directory); empty, the default, disables it
+    embedding_cache_path: str = os.getenv("EMBEDDING_CACHE_PATH", "")
+    embedding_cache_dtype: str = os.getenv("EMBEDDING_CACHE_DTYPE", "float32")  # float32 | float16
+    # Query encodes of concurrent requests are batched for up to query_batch_wait_ms / query_batch_size texts (1 disables)
+    query_batch_size: int = int(os.getenv("QUERY_BATCH_SIZE", 32))
+    query_batch_wait_ms: float = float(os.getenv("QUERY_BATCH_WAIT_MS", 0.0))  # 0: batch what queued during the previous encode
+    query_cache_size: int = int(os.getenv("QUERY_CACHE_SIZE", 2048))  # query embeddings kept in the LRU (0 disables)
+    # MMR re-selection of the k results from mmr_pool candidates (1 keeps relevance order; ~0.7 drops near-repeats)
+    mmr_lambda: float = float(os.getenv("MMR_LAMBDA", 1.0))
+    mmr_pool: int = int(os.getenv("MMR_POOL", 20))
+    # Search results keyed by (normalized query, subject, k, mode, filter, MMR lambda, store generation); 0 disables
+    result_cache_size: int = int(os.getenv("RESULT_CACHE_SIZE", 1024))
+    result_cache_ttl: float = float(os.getenv("RESULT_CACHE_TTL", 300))  # seconds an entry is served (0: until evicted)
 
 settings = Settings()
@@ -0,0 +1,154 @@
+"""Exact and near-duplicate chunk detection for ingest.
+
+The overlapping windows of pdf_processing, the repeated passages of the NCERT
+appendices / answer sections and re-runs of offline_ingest all produce chunks the
+store already holds. embedding_store.add_texts checks each incoming chunk here
+before it is embedded:
+
+ - exact: 64-bit SHA-1 prefix of the case- and whitespace-normalized text
+ - near:  MinHash over word 3-gram shingles, bucketed by LSH bands; a candidate
+          counts when its estimated Jaccard similarity reaches the threshold,
+          and the chunk is recorded as an alias of the stored row instead
+
+Every base generation and delta segment keeps the hashes (hashes.npy, uint64) and
+signatures (minhash.npy, uint32 rows) of its chunks so the lookup tables can be
+rebuilt without re-reading texts.
+"""
+from __future__ import annotations
+import hashlib
+import re
+import zlib
+from typing import Container, Dict, Iterable, List, Optional, Sequence, Tuple
+import numpy as np
+
+HASHES_FILE = "hashes.npy"
+MINHASH_FILE = "minhash.npy"
+WORD_RE = re.compile(r"\w+")
+_PRIME = (1 << 31) - 1  # a * x + b stays below 2**63 for 32-bit x
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+def content_hash(text: str) -> int:
+    return int.from_bytes(hashlib.sha1(normalize_text(text).encode("utf-8")).digest()[:8], "little")
+
+
+def lsh_params(num_perm: int, threshold: float) -> Tuple[int, int]:
+    """(bands, rows per band) whose LSH S-curve midpoint is closest below threshold (favours recall)."""
+    best = (num_perm, 1)
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        if (1 / bands) ** (1 / rows) <= threshold:
+            best = (bands, rows)
+    return best
+
+
+class MinHasher:
+    """MinHash signatures from universal hashes (a * x + b) mod (2**31 - 1) of word shingles."""
+
+    def __init__(self, num_perm: int = 128, shingle: int = 3, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.shingle = shingle
+        self._a = rng.integers(1, _PRIME, size=(num_perm, 1), dtype="uint64")
+        self._b = rng.integers(0, _PRIME, size=(num_perm, 1), dtype="uint64")
+
+    def signature(self, text: str) -> np.ndarray:
+        words = WORD_RE.findall(text.lower())
+        n = max(1, len(words) - self.shingle + 1)
+        shingles = {" ".join(words[i:i + self.shingle]) for i in range(n)}
+        x = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype="uint64", count=len(shingles))
+        return ((self._a * x + self._b) % _PRIME).min(axis=1).astype("uint32")
+
+    def signatures(self, texts: Iterable[str]) -> np.ndarray:
+        rows = [self.signature(t) for t in texts]
+        return np.vstack(rows) if rows else np.zeros((0, self.num_perm), dtype="uint32")
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Estimated Jaccard similarity of two signatures."""
+    return float(np.mean(a == b))
+
+
+class DedupChain:
+    """Row-addressed (hashes, signatures) of the base generation and each delta segment."""
+
+    def __init__(self, parts: List[Tuple[int, np.ndarray, np.ndarray]] | None = None):
+        self.parts: List[Tuple[int, np.ndarray, np.ndarray]] = list(parts or [])
+
+    def extended(self, start: int, hashes: np.ndarray, signatures: np.ndarray) -> "DedupChain":
+        return DedupChain(self.parts + [(start, hashes, signatures)])
+
+    def rows(self, count: int, num_perm: int, texts: Sequence[str], hasher: "MinHasher"):
+        """(hashes, signatures) for rows 0..count-1; rows without stored data are computed from texts."""
+        hashes = np.zeros(count, dtype="uint64")
+        signatures = np.zeros((count, num_perm), dtype="uint32")
+        known = np.zeros(count, dtype=bool)
+        for start, h, s in self.parts:
+            end = min(count, start + len(h))
+            if end <= start or s.shape[1] != num_perm:
+                continue
+            hashes[start:end] = h[:end - start]
+            signatures[start:end] = s[:end - start]
+            known[start:end] = True
+        for row in np.flatnonzero(~known):
+            text = texts[int(row)]
+            hashes[row] = content_hash(text)
+            signatures[row] = hasher.signature(text)
+        return hashes, signatures
+
+
+class DuplicateFinder:
+    """In-memory lookup tables over stored rows: exact hash -> row, LSH band key -> rows."""
+
+    def __init__(self, hasher: MinHasher, threshold: float):
+        self.hasher = hasher
+        self.threshold = threshold
+        self.bands, self.rows = lsh_params(hasher.num_perm, threshold) if threshold > 0 else (0, 0)
+        self._exact: Dict[int, List[int]] = {}
+        self._buckets: List[Dict[bytes, List[int]]] = [{} for _ in range(self.bands)]
+        self._signatures: Dict[int, np.ndarray] = {}
+
+    def _keys(self, signature: np.ndarray):
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def add(self, row: int, hash_: int, signature: np.ndarray):
+        self._exact.setdefault(int(hash_), []).append(row)
+        if self.bands:
+            self._signatures[row] = signature
+            for band, key in self._keys(signature):
+                self._buckets[band].setdefault(key, []).append(row)
+
+    def add_many(self, start: int, hashes: np.ndarray, signatures: np.ndarray, skip: Container[int] = ()):
+        for offset, (h, s) in enumerate(zip(hashes, signatures)):
+            if start + offset not in skip:
+                self.add(start + offset, int(h), s)
+
+    def rows_with_hash(self, hash_: int) -> List[int]:
+        return self._exact.get(int(hash_), [])
+
+    def exact(self, hash_: int, skip: Container[int] = ()) -> Optional[int]:
+        """First stored row with this content hash, ignoring rows in skip."""
+        for row in self._exact.get(int(hash_), ()):
+            if row not in skip:
+                return row
+        return None
+
+    def near(self, signature: np.ndarray, skip: Container[int] = ()) -> Optional[Tuple[int, float]]:
+        """Most similar stored row at or above the threshold, with its estimated similarity."""
+        best: Optional[Tuple[int, float]] = None
+        seen = set()
+        for band, key in self._keys(signature):
+            for row in self._buckets[band].get(key, ()):
+                if row in seen or row in skip:
+                    continue
+                seen.add(row)
+                sim = similarity(signature, self._signatures[row])
+                if sim >= self.threshold and (best is None or sim > best[1]):
+                    best = (row, sim)
+        return best
@@ -0,0 +1,193 @@
+"""Persistent chunk embedding cache.
+
+Changing CHUNK_SIZE / CHUNK_OVERLAP or rebuilding after reset_index re-chunks every
+PDF, but most chunk texts come out byte-identical to the previous run. add_texts
+looks each chunk up here by (encoder name, SHA-256 of the exact text) and only
+encodes the misses, in one batch.
+
+The cache is one SQLite file (settings.embedding_cache_path, off unless set; a
+relative path is taken under settings.persist_directory) in WAL mode, so several
+ingest processes can share it. Vectors are stored normalized, as float32 or float16
+(settings.embedding_cache_dtype; float16 halves the file and is re-normalized on
+read). Lookup counters are kept in the file, so `stats` reports the hit rate across
+runs.
+
+python -m backend.app.embedding_cache stats
+python -m backend.app.embedding_cache prune --store vector_store --pack vector_store.pack
+"""
+from __future__ import annotations
+import argparse
+import hashlib
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set
+import numpy as np
+from .config import settings
+
+DTYPES = ("float32", "float16")
+_BATCH = 500  # keys per SELECT (SQLite caps bound parameters)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    model TEXT NOT NULL, sha BLOB NOT NULL, dtype TEXT NOT NULL, vector BLOB NOT NULL,
+    PRIMARY KEY (model, sha)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS counters (model TEXT PRIMARY KEY, hits INTEGER NOT NULL, misses INTEGER NOT NULL);
+"""
+
+
+def text_sha(text: str) -> bytes:
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+
+class EmbeddingCache:
+    """(model, text sha) -> normalized float32 vector, persisted in SQLite."""
+
+    def __init__(self, path: Path, dtype: str = "float32"):
+        if dtype not in DTYPES:
+            raise ValueError(f"Unknown embedding cache dtype {dtype!r}; expected one of {DTYPES}")
+        self.path = Path(path)
+        self.dtype = dtype
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+
+    def get_many(self, model: str, texts: List[str]) -> Dict[int, np.ndarray]:
+        """{position in texts: vector} for the cached texts; counts hits and misses."""
+        shas = [text_sha(t) for t in texts]
+        found: Dict[bytes, np.ndarray] = {}
+        with self._lock:
+            for i in range(0, len(shas), _BATCH):
+                batch = list(set(shas[i:i + _BATCH]))
+                rows = self._conn.execute(
+                    f"SELECT sha, dtype, vector FROM embeddings WHERE model = ? AND sha IN ({','.join('?' * len(batch))})",
+                    [model, *batch])
+                for sha, dtype, blob in rows:
+                    found[sha] = np.frombuffer(blob, dtype=dtype).astype("float32")
+            hits = sum(sha in found for sha in shas)
+            self._conn.execute("INSERT INTO counters VALUES (?, ?, ?) ON CONFLICT(model) DO UPDATE SET "
+                               "hits = hits + excluded.hits, misses = misses + excluded.misses",
+                               (model, hits, len(shas) - hits))
+            self._conn.commit()
+        out = {i: found[sha] for i, sha in enumerate(shas) if sha in found}
+        if out and self.dtype == "float16":
+            for i, vec in out.items():
+                out[i] = vec / (np.linalg.norm(vec) + 1e-12)
+        return out
+
+    def contains_many(self, model: str, texts: List[str]) -> Set[int]:
+        """Positions in texts that are cached (not counted as lookups)."""
+        shas = [text_sha(t) for t in texts]
+        found: Set[bytes] = set()
+        with self._lock:
+            for i in range(0, len(shas), _BATCH):
+                batch = list(set(shas[i:i + _BATCH]))
+                found.update(sha for (sha,) in self._conn.execute(
+                    f"SELECT sha FROM embeddings WHERE model = ? AND sha IN ({','.join('?' * len(batch))})",
+                    [model, *batch]))
+        return {i for i, sha in enumerate(shas) if sha in found}
+
+    def put_many(self, model: str, texts: List[str], vectors: np.ndarray):
+        rows = [(model, text_sha(t), self.dtype, np.asarray(v, dtype=self.dtype).tobytes())
+                for t, v in zip(texts, vectors)]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)", rows)
+            self._conn.commit()
+
+    def stats(self) -> List[Dict]:
+        """Per model: entries, stored bytes, hits, misses, hit_ratio."""
+        with self._lock:
+            sizes = {model: (n, size) for model, n, size in self._conn.execute(
+                "SELECT model, COUNT(*), SUM(LENGTH(vector)) FROM embeddings GROUP BY model")}
+            counters = {model: (h, m) for model, h, m in self._conn.execute("SELECT model, hits, misses FROM counters")}
+        out = []
+        for model in sorted(set(sizes) | set(counters)):
+            n, size = sizes.get(model, (0, 0))
+            hits, misses = counters.get(model, (0, 0))
+            out.append({"model": model, "entries": n, "bytes": size or 0, "hits": hits, "misses": misses,
+                        "hit_ratio": hits / (hits + misses) if hits + misses else 0.0})
+        return out
+
+    def prune(self, keep: Set[bytes], dry_run: bool = False) -> int:
+        """Delete the entries (of every model) whose text sha is not in keep; returns how many."""
+        with self._lock:
+            dead = [sha for (sha,) in self._conn.execute("SELECT DISTINCT sha FROM embeddings") if sha not in keep]
+            if dead and not dry_run:
+                self._conn.executemany("DELETE FROM embeddings WHERE sha = ?", [(sha,) for sha in dead])
+                self._conn.commit()
+                self._conn.execute("VACUUM")
+        return len(dead)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_cache: Optional[EmbeddingCache] = None
+_cache_lock = threading.Lock()
+
+
+def cache_path() -> Optional[Path]:
+    """settings.embedding_cache_path, relative to settings.persist_directory (None when disabled)."""
+    if not settings.embedding_cache_path:
+        return None
+    return Path(settings.persist_directory) / settings.embedding_cache_path
+
+
+def get_cache() -> Optional[EmbeddingCache]:
+    """Process-wide cache at cache_path() (None when disabled)."""
+    global _cache
+    path = cache_path()
+    if path is None:
+        return None
+    with _cache_lock:
+        if _cache is None or _cache.path != path:
+            _cache = EmbeddingCache(path, settings.embedding_cache_dtype)
+        return _cache
+
+
+def referenced_shas(stores: Iterable[Path], packs: Iterable[Path]) -> Set[bytes]:
+    """Text shas of the live chunks of the given store directories and packs."""
+    from .embedding_store import EmbeddingStore
+    keep: Set[bytes] = set()
+    opened = [EmbeddingStore(Path(p)) for p in stores] + [EmbeddingStore(Path(p).parent, pack_path=Path(p)) for p in packs]
+    for store in opened:
+        snap = store.snapshot()
+        dead = set(snap.tombstones.tolist())
+        keep.update(text_sha(text) for row, text in enumerate(snap.texts) if row not in dead)
+    return keep
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Persistent embedding cache")
+    parser.add_argument("--cache", type=Path, default=None, help="Default: settings.embedding_cache_path")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("stats", help="Entries, size and hit rate per model")
+    pr = sub.add_parser("prune", help="Drop entries whose text no given store holds")
+    pr.add_argument("--store", type=Path, nargs="*", default=None, help="Default: settings.persist_directory")
+    pr.add_argument("--pack", type=Path, nargs="*", default=[])
+    pr.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    path = args.cache or cache_path()
+    if path is None:
+        raise SystemExit("The embedding cache is disabled; set EMBEDDING_CACHE_PATH or pass --cache")
+    if not path.exists():
+        raise SystemExit(f"No embedding cache at {path}")
+    cache = EmbeddingCache(path, settings.embedding_cache_dtype)
+    if args.command == "stats":
+        print(f"{path}: {path.stat().st_size / 2**20:.1f} MiB")
+        for row in cache.stats():
+            print(f"  {row['model']}: {row['entries']} entries ({row['bytes'] / 2**20:.1f} MiB of vectors), "
+                  f"{row['hits']} hits / {row['misses']} misses, hit rate {row['hit_ratio']:.1%}")
+    else:
+        stores = [Path(settings.persist_directory)] if args.store is None else args.store
+        removed = cache.prune(referenced_shas(stores, args.pack), dry_run=args.dry_run)
+        print(f"{'Would remove' if args.dry_run else 'Removed'} {removed} entries; {path.stat().st_size / 2**20:.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
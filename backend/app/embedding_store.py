@@ -2,34 +2,129 @@
 
 Stores:
  - FAISS index for vector similarity (cosine via inner product on normalized vectors)
- - Parallel lists for texts and metadata (persisted as JSONL)
+ - Chunk texts in a memory-mapped, block-compressed texts.bin (see text_store); only the
+   texts of returned hits are decoded. Legacy texts.jsonl stores are still readable and
+   are converted on the next compaction.
+ - Chunk metadata as typed columns (metadata.cols, see metadata_columns); dicts are only
+   built for returned hits. Legacy metadata.jsonl files are still read and are
+   converted on the next compaction.
 
-Subject filtering is performed post-retrieval by expanding the candidate pool if necessary.
+All state lives in an immutable StoreSnapshot: searches never lock, writers publish a
+new snapshot (see EmbeddingStore).
+
+add_texts appends delta segments (segments/); compact() folds them into a new base
+generation (generations/gen-NNNNNN) recorded in manifest.json.
+
+The FAISS index type (flat / IVF / HNSW, or "auto" by corpus size) comes from
+settings; see index_factory.
+
+Compressed (settings.index_compression) and PCA-projected (settings.pca_dim) indexes
+are re-scored exactly against vectors.npy (see _rescore).
+
+Texts are embedded by the backend selected with settings.encoder_backend (see encoders).
+Query embeddings are memoized in an LRU keyed by (encoder, whitespace-normalized
+query); see query_cache_stats(). Misses of concurrent requests are encoded as one
+batch by a single worker thread (see query_batcher, query_batch_stats()). Whole result
+lists are cached per store generation (see similarity_search_many). Chunk
+embeddings go through the persistent embedding cache (see _encode_chunks,
+embedding_cache).
+
+With settings.search_mode = "hybrid" dense and BM25 rankings (see lexical_index) are
+fused by reciprocal rank (see _hybrid_select).
+settings.mmr_lambda below 1 re-selects the k results by maximal marginal relevance
+(see _diversify).
+
+add_texts skips exact and, optionally, near-duplicate chunks (see add_texts, dedup).
+
+remove_source / replace_source tombstone the rows of one PDF until the next compaction.
+
+Every published write bumps the store generation reported with each hit;
+READ_ONLY_MODE replicas hot-reload new generations (see EmbeddingStore.reload).
+
+pack() writes the live rows into one file that settings.packed_store serves through a
+shared read-only mmap (see packed_store).
+
+settings.hierarchical_search scores only the chunks of the best chapters / pages
+(see _coarse_search).
+
+Metadata filters (see metadata_filter) are pushed into the search (see search_vectors).
 """
-from typing import List, Dict, Optional
+from typing import Callable, List, Dict, Optional, Set, Tuple
+from dataclasses import dataclass, field, replace
 from pathlib import Path
+import copy
 import json
 import os
+import shutil
+import tempfile
+import threading
+from bisect import bisect_right
 import faiss  # type: ignore
 import numpy as np
-from sentence_transformers import SentenceTransformer
 from .config import settings
+from .text_store import TextChain, TextStore, write_text_store
+from . import index_factory
+from .vector_archive import VectorChain, load_vectors, save_vectors
+from .caching import LRUCache, TTLCache
+from .embedding_cache import get_cache
+from .encoders import encoder_name, get_encoder
+from .query_batcher import QueryBatcher
+from .lexical_index import LexicalIndex, LexicalPart, build_part, merge_parts
+from .coarse_index import CoarseIndex, build_coarse
+from .metadata_filter import MetadataFilter, parse_filter
+from .mmr import mmr
+from .dedup import HASHES_FILE, MINHASH_FILE, DedupChain, DuplicateFinder, MinHasher, content_hash
+from .packed_store import MappedFlatIndex, PackFile, write_pack
+from .metadata_columns import (ARRAYS as METADATA_ARRAYS, MetadataChain, MetadataColumns, build_columns,
+                               load_columns, save_columns)
 
 PERSIST_DIR = Path(settings.persist_directory)
 PERSIST_DIR.mkdir(parents=True, exist_ok=True)
 
-INDEX_PATH = PERSIST_DIR / "index.faiss"
-METADATA_PATH = PERSIST_DIR / "metadata.jsonl"
-TEXTS_PATH = PERSIST_DIR / "texts.jsonl"
-STATE_PATH = PERSIST_DIR / "state.json"
+# File names inside a base directory (a generation, or the store root for legacy stores)
+INDEX_FILE = "index.faiss"
+METADATA_FILE = "metadata.jsonl"  # legacy layout, superseded by metadata.cols
+METADATA_COLUMNS_FILE = "metadata.cols"
+TEXTS_FILE = "texts.jsonl"  # legacy layout, superseded by texts.bin
+TEXTS_BIN_FILE = "texts.bin"
+VECTORS_FILE = "vectors.npy"  # raw normalized rows (see vector_archive)
+STATE_FILE = "state.json"  # legacy next_id holder
+LEXICAL_DIR = "lexical"  # BM25 postings (see lexical_index)
+COARSE_DIR = "coarse"  # chapter / page centroids (see coarse_index)
+ALIASES_FILE = "aliases.jsonl"  # near-duplicate chunks folded into a stored one (store root)
+
+_model = None  # settings.encoder_backend: torch or onnx; loaded on first use by _get_model
+_model_lock = threading.Lock()
+
+# (embedding model, normalized query) -> normalized float32 query vector
+_query_cache = LRUCache(settings.query_cache_size)
+_query_cache_model: str = settings.embedding_model
+# (normalized query, subject, k, mode, filter key, store generation) -> result list of similarity_search_many
+_result_cache = TTLCache(settings.result_cache_size, settings.result_cache_ttl)
+# Replaces _model.encode for chunk texts when set (offline ingest worker pool, see encode_pool)
+_chunk_encoder: Optional[Callable[[List[str]], np.ndarray]] = None
+# Cache misses of concurrent requests are encoded together (see query_batcher)
+_query_batcher = QueryBatcher(lambda texts: _get_model().encode(texts), settings.query_batch_size,
+                              settings.query_batch_wait_ms)
 
-_model = SentenceTransformer(settings.embedding_model)
 
-# Runtime containers
-_index = None  # faiss.Index
-_metadata: List[Dict] = []
-_texts: List[str] = []
-_next_id: int = 0
+def _get_model():
+    """The encoder, loaded on first encode rather than at import.
+
+    Processes that never encode here (the offline ingest parent with --workers, shard
+    servers, bench probes) then do not pay for the model's load time and memory.
+    """
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                _model = get_encoder()
+    return _model
+
+
+def _model_name() -> str:
+    """Embedding / query cache key of the encoder, without loading it."""
+    return _model.name if _model is not None else encoder_name()
 
 
 def _normalize(vectors: np.ndarray) -> np.ndarray:
@@ -37,140 +132,1415 @@ def _normalize(vectors: np.ndarray) -> np.ndarray:
     return vectors / norms
 
 
+def _encode_chunks(chunks: List[str]) -> np.ndarray:
+    """Normalized chunk vectors; with the embedding cache only the misses are encoded (in one batch).
+
+    Re-chunking or a rebuild after reset_index therefore only encodes chunk texts that
+    were never embedded before.
+    """
+    cache = get_cache()
+    cached = cache.get_many(_model_name(), chunks) if cache is not None else {}
+    missing = [i for i in range(len(chunks)) if i not in cached]
+    if missing:
+        encode = _chunk_encoder or _get_model().encode
+        emb = _normalize(np.array(encode([chunks[i] for i in missing]), dtype="float32"))
+        if cache is not None:
+            cache.put_many(_model_name(), [chunks[i] for i in missing], emb)
+        cached.update(zip(missing, emb))
+    return np.vstack([cached[i] for i in range(len(chunks))]).astype("float32")
+
+
 def _create_index(d: int):
+    # Delta segments are always exact; compaction builds the base in the configured kind
     return faiss.IndexFlatIP(d)
 
 
-def _load_state():
-    global _index, _metadata, _texts, _next_id
-    if INDEX_PATH.exists():
-        _index = faiss.read_index(str(INDEX_PATH))
-    else:
-        _index = None
-    if METADATA_PATH.exists():
-        with METADATA_PATH.open("r", encoding="utf-8") as f:
-            _metadata = [json.loads(line) for line in f]
-    if TEXTS_PATH.exists():
-        with TEXTS_PATH.open("r", encoding="utf-8") as f:
-            _texts = [json.loads(line)["text"] for line in f]
-    if STATE_PATH.exists():
-        with STATE_PATH.open("r", encoding="utf-8") as f:
-            data = json.load(f)
-            _next_id = data.get("next_id", len(_texts))
-    else:
-        _next_id = len(_texts)
-
-
-def _save_state():
-    if _index is not None:
-        faiss.write_index(_index, str(INDEX_PATH))
-    # Metadata JSONL
-    with METADATA_PATH.open("w", encoding="utf-8") as f:
-        for m in _metadata:
-            f.write(json.dumps(m, ensure_ascii=False) + "\n")
-    with TEXTS_PATH.open("w", encoding="utf-8") as f:
-        for t in _texts:
-            f.write(json.dumps({"text": t}, ensure_ascii=False) + "\n")
-    with STATE_PATH.open("w", encoding="utf-8") as f:
-        json.dump({"next_id": _next_id}, f)
-
-
-def _ensure_loaded():
-    if not hasattr(_ensure_loaded, "_loaded"):
-        _load_state()
-        setattr(_ensure_loaded, "_loaded", True)
-
-
-def add_texts(chunks: List[str], metadata: List[Dict]):
-    """Add new text chunks & metadata to FAISS index."""
-    _ensure_loaded()
-    global _index, _next_id
-    if not chunks:
-        return
-    embeddings = _model.encode(chunks, show_progress_bar=False)
-    embeddings = _normalize(np.array(embeddings, dtype="float32"))
-    d = embeddings.shape[1]
-    if _index is None:
-        _index = _create_index(d)
-    elif _index.d != d:
-        raise ValueError(f"Embedding dimension mismatch: existing {_index.d} vs new {d}")
-    _index.add(embeddings)
-    # Append metadata & texts with ids
-    for m, t in zip(metadata, chunks):
-        m = dict(m)  # copy
-        m["id"] = _next_id
-        _metadata.append(m)
-        _texts.append(t)
-        _next_id += 1
-    _save_state()
-
-
-def similarity_search(query: str, k: int = 4, subject: Optional[str] = None):
-    if not query:
-        return []
-    
-    _ensure_loaded()
-    if _index is None or _index.ntotal == 0:
+def _write_atomic(path: Path, writer):
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        writer(f)
+    os.replace(tmp, path)
+
+
+def _write_jsonl(f, rows):
+    for row in rows:
+        f.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+
+def _read_jsonl(path: Path) -> List[Dict]:
+    with path.open("r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def _has_metadata(directory: Path) -> bool:
+    return (directory / METADATA_COLUMNS_FILE).exists() or (directory / METADATA_FILE).exists()
+
+
+def _load_metadata(directory: Path) -> MetadataColumns:
+    """metadata.cols of a base / segment directory, or its legacy metadata.jsonl encoded on the fly."""
+    if (directory / METADATA_COLUMNS_FILE).exists():
+        return load_columns(directory / METADATA_COLUMNS_FILE)
+    return build_columns(_read_jsonl(directory / METADATA_FILE))
+
+
+class _RowFilter:
+    """Search parameters that make one FAISS index skip tombstoned rows (given as index-local ids)."""
+
+    def __init__(self, index, dead: np.ndarray):
+        self.dead = dead
+        self._batch = faiss.IDSelectorBatch(dead)
+        self._selector = faiss.IDSelectorNot(self._batch)  # both referenced here so they outlive the params
+        self.params = index_factory.search_params(index, self._selector)
+
+    def search(self, index, q_emb: np.ndarray, k: int):
+        if self.params is not None:
+            return index.search(q_emb, k, params=self.params)
+        # Index types without search parameters: over-fetch and blank out the dead rows
+        scores, idxs = index.search(q_emb, min(index.ntotal, k + len(self.dead)))
+        idxs = np.where(np.isin(idxs, self.dead), -1, idxs)
+        return scores, idxs
+
+
+class _RowSubset:
+    """Search parameters that restrict one FAISS index to the given rows (index-local ids) via a bitmap."""
+
+    def __init__(self, index, rows: np.ndarray):
+        self.rows = rows
+        mask = np.zeros(index.ntotal, dtype=bool)
+        mask[rows] = True
+        self._bitmap = np.packbits(mask, bitorder="little")  # referenced here so it outlives the selector
+        self._selector = faiss.IDSelectorBitmap(len(self._bitmap), faiss.swig_ptr(self._bitmap))
+        self.params = index_factory.search_params(index, self._selector, len(rows) / max(index.ntotal, 1))
+
+    def search(self, index, q_emb: np.ndarray, k: int):
+        if self.params is not None:
+            return index.search(q_emb, k, params=self.params)
+        # Index types without search parameters: rank every row and keep the first k of the subset
+        scores, idxs = index.search(q_emb, index.ntotal)
+        inside = np.isin(idxs, self.rows)
+        order = np.argsort(~inside, axis=1, kind="stable")[:, :k]
+        idxs = np.where(np.take_along_axis(inside, order, 1), np.take_along_axis(idxs, order, 1), -1)
+        return np.take_along_axis(scores, order, 1), idxs
+
+
+def _ranges(rows: np.ndarray) -> List[List[int]]:
+    """Sorted rows as [start, end) runs (compact for the contiguous rows of one source)."""
+    if not len(rows):
         return []
-    q_emb = _model.encode([query])
-    q_emb = _normalize(np.array(q_emb, dtype="float32"))
+    breaks = np.flatnonzero(np.diff(rows) != 1) + 1
+    return [[int(run[0]), int(run[-1]) + 1] for run in np.split(rows, breaks)]
+
+
+@dataclass(frozen=True)
+class StoreSnapshot:
+    """Immutable view of the store. Writers publish a new one instead of mutating this."""
+    index: Optional[object] = None  # base faiss.Index (rows 0..base_count-1)
+    deltas: Tuple[Tuple[int, object], ...] = ()  # (first row, flat faiss.Index) per delta segment
+    metadata: MetadataChain = field(default_factory=MetadataChain)
+    texts: TextChain = field(default_factory=TextChain)
+    vectors: VectorChain = field(default_factory=VectorChain)  # memory-mapped full-precision rows
+    lexical: LexicalIndex = field(default_factory=LexicalIndex)
+    coarse: Optional[CoarseIndex] = None  # chapter / page centroids over the base rows
+    dedup: DedupChain = field(default_factory=DedupChain)  # content hashes / MinHash signatures per row
+    aliases: Dict[int, Tuple[Dict, ...]] = field(default_factory=dict)  # stored id -> near-duplicate metadata
+    tombstones: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype="int64"))  # removed rows, sorted
+    unembedded: int = 0  # rows base_count.. with no stored vector (legacy stores saved without index.faiss)
+    base_filter: Optional[_RowFilter] = None
+    delta_filters: Tuple[Optional[_RowFilter], ...] = ()  # aligned with deltas; missing entries mean no filter
+    next_id: int = 0
+    base: Optional[str] = None  # generation directory name, None for the legacy root layout
+    segments: Tuple[Dict, ...] = ()  # delta segments not yet folded in: {"name", "start", "count"}
+    version: int = 0  # store generation: bumped by every published write, persisted in the manifest
+
+    @property
+    def count(self) -> int:
+        return len(self.metadata)
+
+    @property
+    def live_count(self) -> int:
+        return self.count - len(self.tombstones)
+
+    @property
+    def base_count(self) -> int:
+        return self.index.ntotal if self.index is not None else 0
+
+    @property
+    def dim(self) -> Optional[int]:
+        if self.index is not None:
+            return self.index.d
+        return self.deltas[0][1].d if self.deltas else None
+
+
+class EmbeddingStore:
+    """Snapshot-isolated store over one persist directory.
+
+    All state lives in an immutable StoreSnapshot. Searches take the current one and
+    never lock; writers (add_texts, compact, reset) are serialized, build the next
+    snapshot off to the side and publish it with one reference swap, so a search sees
+    the old or the new state, never a mix.
+
+    Persistence is append-only: each add_texts batch becomes a delta segment
+    (segments/, searched as a small flat index next to the base) and compaction folds
+    the segments into a new base generation (generations/gen-NNNNNN). Stores written
+    before generations (base files directly in the store directory) are still read and
+    are moved into a generation on the first compaction; rows they hold without a vector
+    (no index.faiss) are re-embedded from their texts then.
+
+    manifest.json, replaced atomically, names the base, the segments and the generation
+    number that every published write bumps; the files it names are never modified.
+    """
+
+    def __init__(self, persist_dir: Path, pack_path: Optional[Path] = None):
+        self.persist_dir = Path(persist_dir)
+        self.pack_path = Path(pack_path) if pack_path else None  # serve read-only from a packed file
+        self.manifest_path = self.persist_dir / "manifest.json"
+        self.segments_dir = self.persist_dir / "segments"
+        self.generations_dir = self.persist_dir / "generations"
+        self._snapshot = StoreSnapshot()
+        self._loaded = False
+        self._load_lock = threading.Lock()
+        self._write_lock = threading.RLock()
+        self._hasher = MinHasher(settings.minhash_permutations)
+        self._finder: Optional[DuplicateFinder] = None  # writer-side, covers the live rows of _finder_key
+        self._finder_key = None
+        self._watcher: Optional[threading.Thread] = None
+        self._stop_watching = threading.Event()
+
+    # ----- loading -------------------------------------------------------------------
+    def snapshot(self) -> StoreSnapshot:
+        """Current state; safe to use from any thread for as long as needed."""
+        if not self._loaded:
+            with self._load_lock:
+                if not self._loaded:
+                    self._snapshot = self._load()
+                    self._loaded = True
+                    if settings.read_only and settings.reload_interval > 0:
+                        self.watch(settings.reload_interval)
+        return self._snapshot
+
+    def _manifest_stamp(self):
+        try:
+            st = (self.pack_path or self.manifest_path).stat()
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    def reload(self) -> bool:
+        """Load the state the manifest currently points to and publish it if it differs; True if swapped.
+
+        For processes that do not write (replicas); a writer's own snapshot is always current.
+        READ_ONLY_MODE replicas poll the manifest (settings.reload_interval, see watch) and
+        swap the new state in with the same reference swap writers use: requests already
+        running finish on the snapshot they started with, so a new corpus goes live
+        without a restart.
+        """
+        snap = self._load()
+        current = self._snapshot
+        if snap.version == current.version and snap.base == current.base and snap.segments == current.segments:
+            return False
+        self._snapshot = snap  # in-flight searches keep the old snapshot until they finish
+        self._loaded = True
+        return True
+
+    def watch(self, interval: float):
+        """Poll manifest.json (or the pack) every interval seconds in a daemon thread and reload on change."""
+        if self._watcher is not None and self._watcher.is_alive():
+            return
+        self._stop_watching.clear()
+
+        def loop():
+            seen = self._manifest_stamp()
+            while not self._stop_watching.wait(interval):
+                stamp = self._manifest_stamp()
+                if stamp == seen:
+                    continue
+                try:
+                    self.reload()
+                except (OSError, ValueError, RuntimeError):  # RuntimeError: faiss read_index
+                    continue  # a compaction removed files of the manifest we read; retry next tick
+                seen = stamp
+
+        self._watcher = threading.Thread(target=loop, name="store-reload", daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self):
+        self._stop_watching.set()
+        if self._watcher is not None:
+            self._watcher.join()
+            self._watcher = None
+
+    def _base_dir(self, base: Optional[str]) -> Path:
+        return self.generations_dir / base if base else self.persist_dir
+
+    def _load(self) -> StoreSnapshot:
+        if self.pack_path is not None:
+            return self._load_packed()
+        manifest = {}
+        if self.manifest_path.exists():
+            with self.manifest_path.open("r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        base = manifest.get("base")
+        base_dir = self._base_dir(base)
+
+        index = faiss.read_index(str(base_dir / INDEX_FILE)) if (base_dir / INDEX_FILE).exists() else None
+        vectors = VectorChain([(0, load_vectors(base_dir / VECTORS_FILE))] if (base_dir / VECTORS_FILE).exists() else [])
+        metadata = MetadataChain([_load_metadata(base_dir)] if _has_metadata(base_dir) else [])
+        if (base_dir / TEXTS_BIN_FILE).exists():
+            texts = TextChain([TextStore(base_dir / TEXTS_BIN_FILE)])
+        elif (base_dir / TEXTS_FILE).exists():
+            texts = TextChain([[row["text"] for row in _read_jsonl(base_dir / TEXTS_FILE)]])
+        else:
+            texts = TextChain()
+        if (base_dir / LEXICAL_DIR).exists():
+            lexical = LexicalIndex([(0, LexicalPart.load(base_dir / LEXICAL_DIR))])
+        else:
+            # Stores written before the lexical index; persisted by the next compaction
+            lexical = LexicalIndex([(0, build_part(texts))]) if len(texts) else LexicalIndex()
+        dedup = DedupChain()
+        if (base_dir / HASHES_FILE).exists():
+            dedup = dedup.extended(0, load_vectors(base_dir / HASHES_FILE), load_vectors(base_dir / MINHASH_FILE))
+        next_id = len(metadata)
+        if (base_dir / STATE_FILE).exists():
+            with (base_dir / STATE_FILE).open("r", encoding="utf-8") as f:
+                next_id = json.load(f).get("next_id", next_id)
+
+        deltas = []
+        segments = []
+        for seg in manifest.get("segments", []):
+            # Manifests written before generations could list segments already merged into the base
+            if base is None and seg["start"] + seg["count"] <= len(texts):
+                continue
+            seg_dir = self.segments_dir / seg["name"]
+            seg_vectors = load_vectors(seg_dir / "vectors.npy")
+            delta = _create_index(seg_vectors.shape[1])
+            delta.add(np.ascontiguousarray(seg_vectors, dtype="float32"))
+            deltas.append((seg["start"], delta))
+            vectors.add(seg["start"], seg_vectors)
+            metadata = metadata.extended(_load_metadata(seg_dir))
+            seg_texts = TextStore(seg_dir / "texts.bin")
+            texts.append_part(seg_texts)
+            seg_lexical = LexicalPart.load(seg_dir / LEXICAL_DIR) if (seg_dir / LEXICAL_DIR).exists() else build_part(seg_texts)
+            lexical = lexical.extended(seg["start"], seg_lexical)
+            if (seg_dir / HASHES_FILE).exists():
+                dedup = dedup.extended(seg["start"], load_vectors(seg_dir / HASHES_FILE),
+                                       load_vectors(seg_dir / MINHASH_FILE))
+            segments.append(seg)
+        next_id = max(next_id, manifest.get("next_id", 0))
+        aliases: Dict[int, Tuple[Dict, ...]] = {}
+        if (self.persist_dir / ALIASES_FILE).exists():
+            for row in _read_jsonl(self.persist_dir / ALIASES_FILE):
+                aliases[row["id"]] = aliases.get(row["id"], ()) + (row,)
+
+        # Base rows neither index.faiss nor vectors.npy covers have no vector to search with
+        unembedded = max(0, (deltas[0][0] if deltas else len(metadata)) - (index.ntotal if index is not None else 0))
+        snap = StoreSnapshot(index=index, deltas=tuple(deltas), metadata=metadata, texts=texts,
+                             vectors=vectors, lexical=lexical, dedup=dedup, aliases=aliases, next_id=next_id,
+                             base=base, segments=tuple(segments), version=manifest.get("generation", 0),
+                             unembedded=unembedded)
+        if self._needs_rebuild(snap) and not snap.unembedded:
+            # In-memory only here; the rebuilt base is persisted by the next compaction
+            index, vectors = self._build_base(snap)
+            snap = replace(snap, index=index, deltas=(), vectors=vectors)
+        if snap.index is not None:
+            index_factory.enable_reconstruct(snap.index)
+            index_factory.apply_search_params(snap.index)
+        coarse = CoarseIndex.load(base_dir / COARSE_DIR) if (base_dir / COARSE_DIR).exists() else None
+        if coarse is None or coarse.ntotal != snap.base_count:
+            # Bases written without it (or just rebuilt in memory); persisted by the next compaction
+            coarse = None
+            if settings.hierarchical_search and snap.base_count:
+                base_rows = np.arange(snap.count) < snap.base_count
+                coarse = build_coarse(snap.metadata.merged(base_rows), _vector_batches(snap, base_rows), snap.dim)
+        snap = replace(snap, coarse=coarse)
+        dead = [np.arange(start, end) for start, end in manifest.get("tombstones", [])]
+        return _with_tombstones(snap, np.concatenate(dead) if dead else snap.tombstones)
+
+    def _load_packed(self) -> StoreSnapshot:
+        pack = PackFile(self.pack_path)
+        if settings.pack_verify:
+            bad = pack.verify()
+            if bad:
+                raise ValueError(f"Checksum mismatch in {self.pack_path}: {', '.join(bad)}")
+        index = pack.load_index()
+        if not isinstance(index, MappedFlatIndex):
+            index_factory.apply_search_params(index)
+        metadata = MetadataChain([MetadataColumns(pack.json("metadata.subjects"), pack.json("metadata.sources"),
+                                                  *(pack.array(f"metadata.{name}") for name in METADATA_ARRAYS),
+                                                  pack.section("metadata.extra"))])
+        lexical = LexicalPart(pack.json("lexical.terms"),
+                              *(pack.array(f"lexical.{name}") for name in ("offsets", "docs", "tfs", "lengths")))
+        aliases: Dict[int, Tuple[Dict, ...]] = {}
+        for row in pack.json("aliases"):
+            aliases[row["id"]] = aliases.get(row["id"], ()) + (row,)
+        return StoreSnapshot(index=index, metadata=metadata,
+                             texts=TextChain([TextStore(self.pack_path, buffer=pack.section("texts"))]),
+                             vectors=VectorChain([(0, pack.array("vectors"))]),
+                             lexical=LexicalIndex([(0, lexical)]), aliases=aliases,
+                             next_id=pack.info["next_id"], base=f"pack-{pack.checksum}",
+                             version=pack.info["generation"])
+
+    # ----- index maintenance ---------------------------------------------------------
+    def _needs_rebuild(self, snap: StoreSnapshot) -> bool:
+        """True if the base index kind no longer matches the configured one for snap.count rows."""
+        if snap.count == 0 or snap.index is None:
+            return False
+        kind = index_factory.resolve_index_type(snap.count)
+        compression = index_factory.resolve_compression(snap.count)
+        return index_factory.needs_rebuild(snap.index, kind, compression, ntotal=snap.count)
+
+    def _all_vectors(self, snap: StoreSnapshot) -> np.ndarray:
+        """Full-precision rows, from disk when available (compressed indexes only reconstruct approximations)."""
+        d = snap.dim
+        if snap.index is None:
+            base = np.zeros((0, d), dtype="float32")
+        elif snap.vectors.complete(snap.base_count):
+            base = snap.vectors.prefix(snap.base_count, d)
+        else:
+            base = index_factory.reconstruct_all(snap.index)
+        return np.concatenate([base] + [index_factory.reconstruct_all(delta) for _, delta in snap.deltas])
+
+    def _build_base(self, snap: StoreSnapshot, keep: Optional[np.ndarray] = None):
+        """New base index over the rows of snap (all, or those set in keep) and the matching vector chain.
+
+        Built off to the side; the snapshot is not modified.
+        """
+        n = snap.count if keep is None else int(keep.sum())
+        kind = index_factory.resolve_index_type(n)
+        compression = index_factory.resolve_compression(n)
+        vectors = snap.vectors
+        reusable = snap.index is not None and not index_factory.needs_rebuild(snap.index, kind, compression, ntotal=n)
+        if n == 0:
+            return _create_index(snap.dim), VectorChain()
+        if keep is None and reusable:
+            index = faiss.clone_index(snap.index)
+            for _, delta in snap.deltas:
+                index.add(index_factory.reconstruct_all(delta))
+            index_factory.enable_reconstruct(index)
+        else:
+            rows = self._all_vectors(snap)
+            if keep is not None:
+                rows = rows[keep]
+            if reusable:
+                # Same kind: keep the trained quantizers and re-add only the surviving rows
+                index = faiss.clone_index(snap.index)
+                index.reset()
+                index.add(rows)
+                index_factory.enable_reconstruct(index)
+            else:
+                index = index_factory.build_index(kind, rows, compression=compression)
+            if index_factory.is_approximate(index) and (keep is not None or not vectors.complete(n)):
+                # Keep the exact rows until compaction writes them to vectors.npy
+                vectors = VectorChain([(0, rows)])
+        index_factory.apply_search_params(index)
+        return index, vectors
+
+    # ----- persistence ---------------------------------------------------------------
+    def _check_writable(self):
+        if self.pack_path is not None:
+            raise RuntimeError(f"{self.pack_path} is a read-only packed store")
+
+    def pack(self, path: Path, rows: Optional[np.ndarray] = None) -> Dict:
+        """Write the live rows of the current snapshot into one packed file (see packed_store).
+
+        rows, a boolean mask over the snapshot, restricts the pack to a slice (a shard).
+        """
+        snap = self.snapshot()
+        self._check_embedded(snap)
+        keep = None
+        if len(snap.tombstones) or rows is not None:
+            keep = np.ones(snap.count, dtype=bool) if rows is None else np.array(rows, dtype=bool)
+            keep[snap.tombstones] = False
+        n = snap.live_count if keep is None else int(keep.sum())
+        if not n:
+            raise ValueError("No live rows to pack")
+        vectors = self._all_vectors(snap)
+        if keep is not None:
+            vectors = vectors[keep]
+        info = {"format": 1, "generation": snap.version, "count": n, "dim": snap.dim, "next_id": snap.next_id,
+                "index_type": index_factory.resolve_index_type(n),
+                "compression": index_factory.resolve_compression(n), "pca_dim": index_factory.resolve_pca_dim(n)}
+        index_bytes = None
+        if info["index_type"] != "flat" or info["compression"] != "none" or info["pca_dim"]:
+            index_bytes = faiss.serialize_index(self._build_base(snap, keep)[0])
+        metadata = snap.metadata.merged(keep)
+        texts = iter(snap.texts) if keep is None else (t for t, live in zip(snap.texts, keep) if live)
+        lexical = merge_parts(snap.lexical.parts, keep)
+        packed_ids = set(metadata.ids.tolist())
+        path = Path(path)
+        with tempfile.TemporaryDirectory(dir=path.parent) as tmp:
+            texts_path = Path(tmp) / TEXTS_BIN_FILE
+            write_text_store(texts_path, texts)
+            sections = [
+                ("vectors", np.ascontiguousarray(vectors, dtype="float32")),
+                *((f"metadata.{name}", json.dumps(value, ensure_ascii=False).encode("utf-8")
+                   if isinstance(value, list) else value) for name, value in metadata.arrays().items()),
+                ("texts", texts_path),
+                ("lexical.terms", json.dumps(lexical.terms, ensure_ascii=False).encode("utf-8")),
+                ("lexical.offsets", np.asarray(lexical.offsets, dtype="int64")),
+                ("lexical.docs", np.asarray(lexical.docs, dtype="int32")),
+                ("lexical.tfs", np.asarray(lexical.tfs, dtype="uint16")),
+                ("lexical.lengths", np.asarray(lexical.lengths, dtype="uint32")),
+                ("aliases", json.dumps([a for entries in snap.aliases.values() for a in entries
+                                        if keep is None or entries[0]["id"] in packed_ids]).encode("utf-8")),
+            ]
+            write_pack(path, sections, info, index_bytes)
+        return info
+
+    def _save_manifest(self, snap: StoreSnapshot):
+        manifest = {"version": 2, "generation": snap.version, "next_id": snap.next_id, "base": snap.base,
+                    "segments": list(snap.segments), "tombstones": _ranges(snap.tombstones)}
+        _write_atomic(self.manifest_path, lambda f: json.dump(manifest, f))
+
+    def _write_segment(self, snap: StoreSnapshot, vectors: np.ndarray, metadata: List[Dict],
+                       chunks: List[str], hashes: np.ndarray, signatures: np.ndarray) -> StoreSnapshot:
+        """Persist one add_texts batch as a delta segment and return the snapshot that includes it."""
+        start = snap.count
+        name = f"seg-{start:09d}"
+        seg_dir = self.segments_dir / name
+        seg_dir.mkdir(parents=True, exist_ok=True)
+        save_vectors(seg_dir / "vectors.npy", [vectors], vectors.shape[1], len(vectors), settings.vector_archive_dtype)
+        columns = build_columns(metadata)
+        save_columns(seg_dir / METADATA_COLUMNS_FILE, columns)
+        write_text_store(seg_dir / "texts.bin", chunks)
+        build_part(chunks).save(seg_dir / LEXICAL_DIR)
+        np.save(seg_dir / HASHES_FILE, hashes)
+        np.save(seg_dir / MINHASH_FILE, signatures)
+        delta = _create_index(vectors.shape[1])
+        delta.add(vectors)
+        return replace(
+            snap,
+            deltas=snap.deltas + ((start, delta),),
+            metadata=snap.metadata.extended(columns),
+            texts=snap.texts.extended(TextStore(seg_dir / "texts.bin")),
+            vectors=snap.vectors.extended(start, load_vectors(seg_dir / "vectors.npy")),
+            lexical=snap.lexical.extended(start, LexicalPart.load(seg_dir / LEXICAL_DIR)),
+            dedup=snap.dedup.extended(start, load_vectors(seg_dir / HASHES_FILE), load_vectors(seg_dir / MINHASH_FILE)),
+            next_id=snap.next_id + len(chunks),
+            segments=snap.segments + ({"name": name, "start": start, "count": len(chunks)},),
+            version=snap.version + 1,
+        )
+
+    def _compaction_due(self, snap: StoreSnapshot) -> bool:
+        if snap.unembedded:
+            return True  # re-embeds them (see _embed_missing)
+        if len(snap.tombstones) and len(snap.tombstones) >= settings.tombstone_ratio * snap.count:
+            return True
+        if not snap.segments:
+            return False
+        # A type migration (e.g. auto -> HNSW) is persisted right away
+        if snap.index is None:
+            if index_factory.resolve_index_type(snap.count) != "flat" \
+                    or index_factory.resolve_compression(snap.count) != "none" \
+                    or index_factory.resolve_pca_dim(snap.count):
+                return True
+        elif self._needs_rebuild(snap):
+            return True
+        if settings.compact_ratio <= 0:
+            return False
+        delta_rows = snap.count - snap.base_count
+        return delta_rows >= settings.compact_ratio * max(snap.base_count, settings.compact_min_rows)
+
+    def _check_embedded(self, snap: StoreSnapshot):
+        if snap.unembedded:
+            raise ValueError(f"{snap.unembedded} rows of {self.persist_dir} have no stored vector (saved without "
+                             f"{INDEX_FILE}); run compact() first to re-embed them.")
+
+    def _embed_missing(self, snap: StoreSnapshot) -> StoreSnapshot:
+        """snap with its rows that have no stored vector encoded from their texts, held like a delta in memory."""
+        if not snap.unembedded:
+            return snap
+        start = snap.base_count
+        vectors = np.ascontiguousarray(
+            _encode_chunks([snap.texts[r] for r in range(start, start + snap.unembedded)]), dtype="float32")
+        if snap.dim is not None and snap.dim != vectors.shape[1]:
+            raise ValueError(f"Embedding dimension mismatch: existing {snap.dim} vs new {vectors.shape[1]}")
+        delta = _create_index(vectors.shape[1])
+        delta.add(vectors)
+        parts = sorted(snap.vectors.parts + [(start, vectors)], key=lambda part: part[0])
+        snap = replace(snap, deltas=((start, delta),) + snap.deltas, vectors=VectorChain(parts), unembedded=0)
+        return _with_tombstones(snap, snap.tombstones)
+
+    def _next_generation(self, snap: StoreSnapshot) -> str:
+        current = int(snap.base.split("-")[1]) if snap.base else 0
+        existing = [int(p.name.split("-")[1]) for p in self.generations_dir.glob("gen-*") if p.is_dir()]
+        return f"gen-{max([current] + existing) + 1:06d}"
+
+    def _compact(self, snap: StoreSnapshot, index=None) -> StoreSnapshot:
+        """Write every live row of snap into a new generation directory and switch the manifest to it.
+
+        index, if given, is a base index already built over those rows (see reindex).
+        """
+        snap = self._embed_missing(snap)
+        keep = None
+        if len(snap.tombstones):
+            keep = np.ones(snap.count, dtype=bool)
+            keep[snap.tombstones] = False
+            self._finder = None  # rows are renumbered
+        if index is None:
+            index, _ = self._build_base(snap, keep)
+        gen = self._next_generation(snap)
+        gen_dir = self.generations_dir / gen
+        gen_dir.mkdir(parents=True, exist_ok=True)
+        faiss.write_index(index, str(gen_dir / INDEX_FILE))
+        save_vectors(gen_dir / VECTORS_FILE, _vector_batches(snap, keep), index.d, index.ntotal,
+                     settings.vector_archive_dtype)
+        vectors = VectorChain([(0, load_vectors(gen_dir / VECTORS_FILE))])
+        metadata = snap.metadata.merged(keep)
+        texts = iter(snap.texts) if keep is None else (t for t, live in zip(snap.texts, keep) if live)
+        save_columns(gen_dir / METADATA_COLUMNS_FILE, metadata)
+        write_text_store(gen_dir / TEXTS_BIN_FILE, texts)
+        merge_parts(snap.lexical.parts, keep).save(gen_dir / LEXICAL_DIR)
+        coarse = None
+        if settings.hierarchical_search and index.ntotal:
+            build_coarse(metadata, vectors.iter_rows(), index.d).save(gen_dir / COARSE_DIR)
+            coarse = CoarseIndex.load(gen_dir / COARSE_DIR)
+        hashes, signatures = snap.dedup.rows(snap.count, self._hasher.num_perm, snap.texts, self._hasher)
+        if keep is not None:
+            hashes, signatures = hashes[keep], signatures[keep]
+        np.save(gen_dir / HASHES_FILE, hashes)
+        np.save(gen_dir / MINHASH_FILE, signatures)
+        new = replace(snap, index=index, deltas=(), vectors=vectors, metadata=MetadataChain([metadata]),
+                      tombstones=np.zeros(0, dtype="int64"), base_filter=None, delta_filters=(),
+                      texts=TextChain([TextStore(gen_dir / TEXTS_BIN_FILE)]),
+                      lexical=LexicalIndex([(0, LexicalPart.load(gen_dir / LEXICAL_DIR))]), coarse=coarse,
+                      dedup=DedupChain([(0, load_vectors(gen_dir / HASHES_FILE), load_vectors(gen_dir / MINHASH_FILE))]),
+                      base=gen, segments=(), version=snap.version + 1)
+        self._save_manifest(new)  # commit point
+        self._remove_unreferenced(new)
+        return new
+
+    def _remove_unreferenced(self, snap: StoreSnapshot):
+        """Best-effort removal of files no longer referenced by the manifest.
+
+        Searches still running on an older snapshot may hold mmaps on them; on Windows the
+        delete then fails and is retried after the next compaction.
+        """
+        keep = {seg["name"] for seg in snap.segments}
+        if self.segments_dir.exists():
+            for seg_dir in self.segments_dir.iterdir():
+                if seg_dir.name not in keep:
+                    shutil.rmtree(seg_dir, ignore_errors=True)
+        if self.generations_dir.exists():
+            for gen_dir in self.generations_dir.iterdir():
+                if gen_dir.name != snap.base:
+                    shutil.rmtree(gen_dir, ignore_errors=True)
+        if snap.base:
+            for name in (INDEX_FILE, METADATA_FILE, TEXTS_FILE, TEXTS_BIN_FILE, VECTORS_FILE, STATE_FILE):
+                try:
+                    (self.persist_dir / name).unlink()
+                except OSError:
+                    pass
+
+    # ----- writes --------------------------------------------------------------------
+    def _duplicate_finder(self, snap: StoreSnapshot) -> DuplicateFinder:
+        """Lookup tables over the live rows (built on first use, then extended per batch)."""
+        key = (snap.count, len(snap.tombstones))
+        if self._finder is None or self._finder_key != key:
+            finder = DuplicateFinder(self._hasher, settings.near_dup_threshold)
+            hashes, signatures = snap.dedup.rows(snap.count, self._hasher.num_perm, snap.texts, self._hasher)
+            finder.add_many(0, hashes, signatures, skip=set(snap.tombstones.tolist()))
+            self._finder, self._finder_key = finder, key
+        return self._finder
+
+    def _find_duplicates(self, snap: StoreSnapshot, rows: List[int], hashes: np.ndarray, signatures: np.ndarray,
+                         skip: Set[int]):
+        """Split batch rows into kept ones and {row: (target, similarity)} duplicates.
+
+        Stored rows in skip (about to be removed) do not count. target is ("id", stored id,
+        stored metadata) or ("row", earlier kept batch row); similarity is None for exact copies.
+        """
+        finder = self._duplicate_finder(snap)
+        batch = DuplicateFinder(self._hasher, settings.near_dup_threshold)
+        kept, dups = [], {}
+        for row in rows:
+            h, sig = int(hashes[row]), signatures[row]
+            if settings.dedup_exact:
+                hit = finder.exact(h, skip)
+                if hit is not None:
+                    dups[row] = (("id", snap.metadata[hit]["id"], snap.metadata[hit]), None)
+                    continue
+                hit = batch.exact(h)
+                if hit is not None:
+                    dups[row] = (("row", hit), None)
+                    continue
+            if finder.bands:
+                hit = finder.near(sig, skip)
+                if hit is not None:
+                    dups[row] = (("id", snap.metadata[hit[0]]["id"], snap.metadata[hit[0]]), hit[1])
+                    continue
+                hit = batch.near(sig)
+                if hit is not None:
+                    dups[row] = (("row", hit[0]), hit[1])
+                    continue
+            batch.add(row, h, sig)
+            kept.append(row)
+        return kept, dups
+
+    def _plan(self, snap: StoreSnapshot, hashes: np.ndarray, signatures: np.ndarray, source: Optional[str]):
+        """(rows of source to remove, kept batch rows, duplicates, {kept row: removed row with the same text})."""
+        removing = []
+        if source is not None:
+            matching = snap.metadata.matches("source", source)
+            matching[snap.tombstones] = False
+            removing = np.flatnonzero(matching).tolist()
+        kept, dups = self._find_duplicates(snap, list(range(len(hashes))), hashes, signatures, set(removing))
+        reuse = {}
+        if removing:
+            finder = self._duplicate_finder(snap)
+            removed = set(removing)
+            no_vector = range(snap.base_count, snap.base_count + snap.unembedded)
+            for row in kept:
+                old = [r for r in finder.rows_with_hash(int(hashes[row])) if r in removed and r not in no_vector]
+                if old:
+                    reuse[row] = old[0]
+        return removing, kept, dups, reuse
+
+    def _ingest(self, chunks: List[str], metadata: List[Dict], source: Optional[str] = None) -> Dict[str, int]:
+        """Add chunks (skipping duplicates) and, if source is given, remove its current rows in the same publish."""
+        self._check_writable()
+        stats = {"added": 0, "exact_duplicates": 0, "near_duplicates": 0}
+        if source is not None:
+            stats["removed"] = 0
+        if not chunks and source is None:
+            return stats
+        hashes = np.array([content_hash(c) for c in chunks], dtype="uint64")
+        signatures = self._hasher.signatures(chunks)
+        with self._write_lock:
+            planned = self.snapshot()
+            _, kept, _, reuse = self._plan(planned, hashes, signatures, source)
+        # Encode outside the write lock, and only chunks that are new; publishing is serialized
+        todo = [r for r in kept if r not in reuse]
+        encoded = dict(zip(todo, _encode_chunks([chunks[r] for r in todo]))) if todo else {}
+        with self._write_lock:
+            snap = self.snapshot()
+            removing, kept, dups, reuse = self._plan(snap, hashes, signatures, source)
+            if snap is not planned:
+                # Another writer published meanwhile; the plan was redone against its rows
+                late = [r for r in kept if r not in reuse and r not in encoded]
+                if late:
+                    encoded.update(zip(late, _encode_chunks([chunks[r] for r in late])))
+            embeddings = None
+            if kept:
+                reused = dict(zip(reuse, _row_vectors(snap, list(reuse.values())))) if reuse else {}
+                embeddings = np.vstack([reused[r] if r in reuse else encoded[r] for r in kept]).astype("float32")
+                if snap.dim is not None and snap.dim != embeddings.shape[1]:
+                    raise ValueError(f"Embedding dimension mismatch: existing {snap.dim} vs new {embeddings.shape[1]}")
+            # Append metadata & texts with ids
+            ids = {row: snap.next_id + offset for offset, row in enumerate(kept)}
+            batch_meta = []
+            for row in kept:
+                m = dict(metadata[row])  # copy
+                m["id"] = ids[row]
+                batch_meta.append(m)
+
+            # Near duplicates, and exact copies from another source / page, become aliases
+            aliases = []
+            for row, (target, sim) in sorted(dups.items()):
+                stats["exact_duplicates" if sim is None else "near_duplicates"] += 1
+                while target[0] == "row" and target[1] not in ids:
+                    target = dups[target[1]][0]  # that batch row was dropped as well
+                if target[0] == "row":
+                    target = ("id", ids[target[1]], metadata[target[1]])
+                _, target_id, target_meta = target
+                if sim is None and all(metadata[row].get(key) == target_meta.get(key) for key in ("subject", "source", "page")):
+                    continue  # re-ingest of the same chunk
+                aliases.append({"id": target_id, "metadata": dict(metadata[row]),
+                                "similarity": 1.0 if sim is None else round(sim, 4)})
+
+            stats["added"] = len(kept)
+            if source is not None:
+                stats["removed"] = len(removing)
+            if not kept and not aliases and not removing:
+                return stats
+            version = snap.version
+            if kept:
+                start = snap.count
+                snap = self._write_segment(snap, embeddings, batch_meta, [chunks[r] for r in kept],
+                                           hashes[kept], signatures[kept])
+                if not removing:
+                    self._finder.add_many(start, hashes[kept], signatures[kept])
+                    self._finder_key = (snap.count, len(snap.tombstones))
+            if removing:
+                snap = _with_tombstones(snap, np.union1d(snap.tombstones, np.array(removing, dtype="int64")))
+                removed_ids = {snap.metadata[row]["id"] for row in removing}
+                remaining = {}
+                for target_id, entries in snap.aliases.items():
+                    entries = tuple(a for a in entries if a["metadata"].get("source") != source)
+                    if target_id not in removed_ids and entries:
+                        remaining[target_id] = entries
+                for alias in aliases:
+                    remaining[alias["id"]] = remaining.get(alias["id"], ()) + (alias,)
+                _write_atomic(self.persist_dir / ALIASES_FILE,
+                              lambda f: _write_jsonl(f, (a for entries in remaining.values() for a in entries)))
+                snap = replace(snap, aliases=remaining)
+            elif aliases:
+                with (self.persist_dir / ALIASES_FILE).open("a", encoding="utf-8") as f:
+                    _write_jsonl(f, aliases)
+                merged = dict(snap.aliases)
+                for alias in aliases:
+                    merged[alias["id"]] = merged.get(alias["id"], ()) + (alias,)
+                snap = replace(snap, aliases=merged)
+            snap = replace(snap, version=version + 1)
+            self._save_manifest(snap)  # commit point
+            self._snapshot = snap
+            if self._compaction_due(snap):
+                self._snapshot = self._compact(snap)
+        return stats
+
+    def add_texts(self, chunks: List[str], metadata: List[Dict]) -> Dict[str, int]:
+        """Append chunks, skipping duplicates; returns added / exact_duplicates / near_duplicates counts."""
+        return self._ingest(chunks, metadata)
+
+    def replace_source(self, source: str, chunks: List[str], metadata: List[Dict]) -> Dict[str, int]:
+        """Swap every chunk of source for the given ones in one publish; add_texts counts plus "removed".
+
+        Chunks whose text is unchanged keep their stored vectors, so fixing a chapter only
+        embeds the chunks that actually changed.
+        """
+        return self._ingest(chunks, metadata, source=source)
+
+    def remove_source(self, source: str) -> int:
+        """Tombstone every chunk of source; returns how many were removed.
+
+        FAISS searches skip tombstoned rows through an IDSelector and BM25 hits are
+        filtered; the rows are dropped physically by the next compaction, which runs as
+        soon as tombstones reach settings.tombstone_ratio of the store.
+        """
+        return self._ingest([], [], source=source)["removed"]
+
+    def compact(self):
+        """Fold delta segments and tombstones into a new base generation now.
+
+        Writes also compact on their own once the deltas pass settings.compact_ratio of
+        the base, so ingest cost scales with the batch rather than the store, and when
+        the configured index type no longer fits the corpus size (see index_factory).
+        """
+        self._check_writable()
+        with self._write_lock:
+            snap = self.snapshot()
+            if snap.segments or len(snap.tombstones) or snap.unembedded:
+                self._snapshot = self._compact(snap)
+
+    def reindex(self, kind: str, compression: str = "none", params: Optional[Dict] = None,
+                batch: int = 65536) -> StoreSnapshot:
+        """Rebuild the base index from the vector archive, streamed batch by batch, as a new generation.
 
-    # Retrieve an expanded candidate pool to allow subject filtering
-    candidate_pool = min(max(k * 10, 50), _index.ntotal)
-    scores, idxs = _index.search(q_emb, candidate_pool)
-    scores = scores[0]
-    idxs = idxs[0]
+        Delta segments and removed rows are folded in as by compact(); only rows saved without a
+        vector are encoded.
+        """
+        self._check_writable()
+        with self._write_lock:
+            snap = self.snapshot()
+            if snap.live_count == 0:
+                raise ValueError("The store is empty")
+            snap = self._embed_missing(snap)
+            keep = None
+            live = np.arange(snap.count)
+            if len(snap.tombstones):
+                keep = np.ones(snap.count, dtype=bool)
+                keep[snap.tombstones] = False
+                live = np.flatnonzero(keep)
+                self._finder = None  # rows are renumbered
+            index = index_factory.build_index_from(kind, snap.dim, len(live),
+                                                   lambda rows: _row_vectors(snap, live[rows].tolist()),
+                                                   _vector_batches(snap, keep, batch), params, compression)
+            self._snapshot = self._compact(snap, index=index)
+            return self._snapshot
 
-    results = []
-    for score, i in zip(scores, idxs):
+    def reset(self):
+        self._check_writable()
+        with self._write_lock:
+            self._snapshot = StoreSnapshot(version=self.snapshot().version + 1)
+            self._finder, self._finder_key = None, None
+            for name in (INDEX_FILE, METADATA_FILE, TEXTS_FILE, TEXTS_BIN_FILE, VECTORS_FILE, STATE_FILE):
+                try:
+                    (self.persist_dir / name).unlink()
+                except OSError:
+                    pass
+            shutil.rmtree(self.persist_dir / LEXICAL_DIR, ignore_errors=True)
+            try:
+                (self.persist_dir / ALIASES_FILE).unlink()
+            except OSError:
+                pass
+            shutil.rmtree(self.segments_dir, ignore_errors=True)
+            shutil.rmtree(self.generations_dir, ignore_errors=True)
+            self._save_manifest(self._snapshot)  # empty, but keeps the generation counting up
+
+    # ----- reads ---------------------------------------------------------------------
+    def _candidates(self, snap: StoreSnapshot, q_emb: np.ndarray, pool: int, rows: Optional[np.ndarray] = None):
+        """Per query, up to pool (scores, rows) merged from the base and delta indexes, best first.
+
+        rows (the sorted live rows of a metadata filter) restricts the search to them:
+        small subsets are scored exactly, larger ones through FAISS ID selectors.
+        """
+        if rows is not None and len(rows) <= settings.filter_exact_rows and snap.vectors.complete(snap.count):
+            return [_top(scores, rows, pool) for scores in q_emb @ snap.vectors.gather(rows).T]
+        base_filter, delta_filters = snap.base_filter, snap.delta_filters
+        if rows is not None:
+            base_filter, delta_filters = _subset_filters(snap, rows)
+        hits = [([], []) for _ in range(len(q_emb))]
+        if snap.index is not None and snap.index.ntotal and (rows is None or base_filter is not None):
+            k = min(pool, snap.index.ntotal)
+            todo = list(range(len(q_emb)))
+            if settings.hierarchical_search and snap.coarse is not None and snap.vectors.complete(snap.base_count):
+                base_rows = rows[rows < snap.base_count] if rows is not None else None
+                allowed = snap.coarse.pages_with(base_rows) if rows is not None else None
+                todo = []
+                for r, q in enumerate(q_emb):
+                    found = _coarse_search(snap, q, k, base_rows, allowed)
+                    if found is None:
+                        todo.append(r)  # ambiguous: global search below
+                    else:
+                        hits[r][0].append(found[0])
+                        hits[r][1].append(found[1])
+            if todo:
+                queries = np.ascontiguousarray(q_emb[todo])
+                if base_filter is not None:
+                    scores, idxs = base_filter.search(snap.index, queries, k)
+                else:
+                    scores, idxs = snap.index.search(queries, k)
+                for r, q, s, i in zip(todo, queries, scores, idxs):
+                    s, i = _rescore(snap, q, s, i)
+                    hits[r][0].append(s)
+                    hits[r][1].append(i)
+        for j, (start, delta) in enumerate(snap.deltas):
+            flt = delta_filters[j] if j < len(delta_filters) else None
+            if rows is not None and flt is None:
+                continue  # no row of this segment passes the filter
+            k = min(pool, delta.ntotal)
+            scores, idxs = flt.search(delta, q_emb, k) if flt is not None else delta.search(q_emb, k)
+            for r, (s, i) in enumerate(zip(scores, idxs)):
+                keep = i >= 0
+                hits[r][0].append(s[keep])
+                hits[r][1].append(i[keep] + start)
+        out = []
+        for score_parts, row_parts in hits:
+            scores = np.concatenate(score_parts) if score_parts else np.zeros(0, dtype="float32")
+            rows = np.concatenate(row_parts) if row_parts else np.zeros(0, dtype="int64")
+            if len(row_parts) > 1:
+                order = np.argsort(-scores, kind="stable")[:pool]
+                scores, rows = scores[order], rows[order]
+            out.append((scores, rows))
+        return out
+
+    def _lexical_candidates(self, snap: StoreSnapshot, query: str, rows: Optional[np.ndarray] = None):
+        """Top settings.hybrid_pool live (BM25 scores, rows) for query, only among rows if given."""
+        dead = _unsearchable(snap)  # the BM25 index also holds rows without a vector
+        pool = snap.count if rows is not None else min(settings.hybrid_pool + len(dead), snap.count)
+        lex_scores, lex_rows = snap.lexical.search(query, pool, k1=settings.bm25_k1, b=settings.bm25_b,
+                                                   max_postings=settings.bm25_max_postings or None)
+        if rows is not None:
+            inside = np.isin(lex_rows, rows)
+            lex_scores, lex_rows = lex_scores[inside], lex_rows[inside]
+        elif len(dead):
+            live = ~np.isin(lex_rows, dead)
+            lex_scores, lex_rows = lex_scores[live], lex_rows[live]
+        return lex_scores[:settings.hybrid_pool], lex_rows[:settings.hybrid_pool]
+
+    def _hybrid_select(self, snap: StoreSnapshot, query: str, q_emb: np.ndarray, dense, k: int,
+                       subject: Optional[str], rows: Optional[np.ndarray] = None):
+        """Fuse dense and BM25 rankings by reciprocal rank.
+
+        Each base generation and delta segment carries a BM25 index (lexical/). Fusing
+        settings.hybrid_pool candidates of each ranking recovers exact-term matches the
+        embeddings miss without a wide dense candidate pool.
+
+        Returns (row, cosine similarity, fused score) in fused order.
+        """
+        dense_scores, dense_rows = dense
+        _, lex_rows = self._lexical_candidates(snap, query, rows)
+        fused = rrf([dense_rows.tolist(), lex_rows.tolist()])
+        order = sorted(fused, key=lambda row: -fused[row])
+        selected = _select(snap, np.array([fused[r] for r in order]), np.array(order, dtype="int64"), k, subject)
+
+        cosine = {int(r): float(s) for s, r in zip(dense_scores, dense_rows)}
+        missing = [i for i, _ in selected if i not in cosine]
+        if missing:
+            cosine.update(zip(missing, (_row_vectors(snap, missing) @ q_emb).tolist()))
+        return [(i, cosine[i], fused[i]) for i, _ in selected]
+
+    def search_many(self, queries: List[str], k: int, subjects: List[Optional[str]],
+                    snap: Optional[StoreSnapshot] = None, mode: Optional[str] = None,
+                    filters: Optional[List[Optional[MetadataFilter]]] = None,
+                    mmr_lambda: Optional[float] = None) -> List[List[Dict]]:
+        snap = snap or self.snapshot()
+        rows = [r for r, q in enumerate(queries) if q]
+        if not rows or snap.count == 0:
+            return [[] for _ in queries]
+        out = self.search_vectors(queries, rows, _embed_queries([queries[r] for r in rows]), k, subjects, snap, mode,
+                                  filters=filters, mmr_lambda=mmr_lambda)
+        for hits in out:
+            for hit in hits:
+                del hit["score"]
+        return out
+
+    def search_vectors(self, queries: List[str], rows: List[int], q_emb: np.ndarray, k: int,
+                       subjects: List[Optional[str]], snap: Optional[StoreSnapshot] = None,
+                       mode: Optional[str] = None, rankings: bool = False,
+                       filters: Optional[List[Optional[MetadataFilter]]] = None,
+                       mmr_lambda: Optional[float] = None) -> List:
+        """search_many for queries that are already embedded: q_emb[j] belongs to queries[rows[j]].
+
+        filters holds one MetadataFilter (or None) per query: hits only come from matching
+        rows, scored exactly when few (settings.filter_exact_rows), otherwise through an
+        IDSelectorBitmap per FAISS index. A subject is a preference on top of that: dense mode searches the subject's
+        rows first and only fills up from the rest of the filter when they run short.
+
+        Hits also carry "score", the value they were ranked by (cosine similarity, or the
+        fused RRF score in hybrid mode), so the results of several shards can be merged.
+        mmr_lambda overrides settings.mmr_lambda (below 1: MMR picks the k, see mmr).
+        With rankings (hybrid mode, for shards) each query instead gets the unfused
+        {"dense": hits by cosine, "lexical": hits by BM25, with "bm25"} so that the
+        coordinator can fuse global ranks.
+        """
+        snap = snap or self.snapshot()
+        mode = (mode or settings.search_mode).lower()
+        if mode not in ("dense", "hybrid"):
+            raise ValueError(f"Unknown search mode {mode!r}; expected 'dense' or 'hybrid'")
+        filters = list(filters) if filters is not None else [None] * len(queries)
+        lam = settings.mmr_lambda if mmr_lambda is None else mmr_lambda
+        if not 0 <= lam <= 1:
+            raise ValueError(f"MMR lambda must be within [0, 1], got {lam}")
+        take = max(k, settings.mmr_pool) if lam < 1 else k  # candidates MMR chooses the k from
+        if rankings and mode == "hybrid":
+            return self._rankings(snap, queries, rows, q_emb, k, filters)
+        out: List[List[Dict]] = [[] for _ in queries]
+        if not rows or snap.count == 0:
+            return out
+
+        picked = {}
+        subsets = _FilterRows(snap)
+        if mode == "hybrid":
+            # BM25 supplies the exact-term candidates, so the dense pool can stay small
+            candidate_pool = min(max(settings.hybrid_pool, k), snap.count)
+            dense = self._filtered_candidates(snap, q_emb, candidate_pool, [filters[row] for row in rows], subsets)
+            for j, row in enumerate(rows):
+                picked[row] = self._hybrid_select(snap, queries[row], q_emb[j], dense[j], take, subjects[row],
+                                                  subsets.get(filters[row]))
+        else:
+            # Subject rows first (pushed down into the search), the rest of the filter only to fill up
+            candidate_pool = min(max(k * 10, 50, take), snap.count)
+            preferred = [_and_subject(filters[row], subjects[row]) for row in rows]
+            found = self._filtered_candidates(snap, q_emb, candidate_pool, preferred, subsets)
+            short = [j for j, row in enumerate(rows) if subjects[row] and len(found[j][1]) < take]
+            if short:
+                fill = self._filtered_candidates(snap, q_emb[short], candidate_pool,
+                                                 [filters[rows[j]] for j in short], subsets)
+                for j, (s, i) in zip(short, fill):
+                    found[j] = _fill(found[j], (s, i))
+            for row, (s, i) in zip(rows, found):
+                picked[row] = [(r, score, score) for r, score in _select(snap, s, i, take, subjects[row])]
+        if take > k:
+            picked = {row: _diversify(snap, selected, k, lam, subjects[row]) for row, selected in picked.items()}
+
+        # Decode only the texts of the rows being returned
+        texts = snap.texts.get_many({i for selected in picked.values() for i, _, _ in selected})
+        for r, selected in picked.items():
+            out[r] = [{
+                "text": texts[i],
+                "metadata": _with_aliases(snap, snap.metadata[i]),
+                "distance": float(1 - score),  # cosine distance approx (since score ~ cosine similarity)
+                "generation": snap.version,
+                "score": float(rank_score),
+            } for i, score, rank_score in selected]
+        return out
+
+    def _filtered_candidates(self, snap: StoreSnapshot, q_emb: np.ndarray, pool: int,
+                             filters: List[Optional[MetadataFilter]], subsets: "_FilterRows"):
+        """_candidates with one filter (or None) per query; queries sharing a filter are searched together."""
+        groups: Dict[Optional[MetadataFilter], List[int]] = {}
+        for j, where in enumerate(filters):
+            groups.setdefault(where, []).append(j)
+        out: List = [None] * len(q_emb)
+        for where, js in groups.items():
+            found = self._candidates(snap, np.ascontiguousarray(q_emb[js]), pool, subsets.get(where))
+            for j, hit in zip(js, found):
+                out[j] = hit
+        return out
+
+    def _rankings(self, snap: StoreSnapshot, queries: List[str], rows: List[int], q_emb: np.ndarray, k: int,
+                  filters: List[Optional[MetadataFilter]]):
+        out: List[Dict] = [{"dense": [], "lexical": []} for _ in queries]
+        if not rows or snap.count == 0:
+            return out
+        candidate_pool = min(max(settings.hybrid_pool, k), snap.count)
+        subsets = _FilterRows(snap)
+        dense = self._filtered_candidates(snap, q_emb, candidate_pool, [filters[row] for row in rows], subsets)
+        lists = {}
+        for j, (row, (dense_scores, dense_rows)) in enumerate(zip(rows, dense)):
+            lex_scores, lex_rows = self._lexical_candidates(snap, queries[row], subsets.get(filters[row]))
+            cosine = _row_vectors(snap, lex_rows.tolist()) @ q_emb[j] if len(lex_rows) else []
+            lists[row] = (list(zip(dense_rows.tolist(), dense_scores.tolist(), [None] * len(dense_rows))),
+                          list(zip(lex_rows.tolist(), np.asarray(cosine).tolist(), lex_scores.tolist())))
+        texts = snap.texts.get_many({i for dense, lexical in lists.values() for i, _, _ in dense + lexical})
+        hit = lambda i, score, bm25: {"text": texts[i], "metadata": _with_aliases(snap, snap.metadata[i]),
+                                      "distance": float(1 - score), "generation": snap.version,
+                                      "score": float(score), **({"bm25": float(bm25)} if bm25 is not None else {})}
+        for row, (dense, lexical) in lists.items():
+            out[row] = {"dense": [hit(*c) for c in dense], "lexical": [hit(*c) for c in lexical]}
+        return out
+
+
+def rrf(rankings: List[List]) -> Dict:
+    """Reciprocal rank fusion (settings.rrf_k) of several best-first rankings of hashable keys."""
+    fused: Dict = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking):
+            fused[key] = fused.get(key, 0.0) + 1.0 / (settings.rrf_k + rank + 1)
+    return fused
+
+
+def _with_aliases(snap: StoreSnapshot, meta: Dict) -> Dict:
+    """Chunk metadata plus the metadata of the near-duplicates folded into it, if any."""
+    aliases = snap.aliases.get(meta.get("id"))
+    if not aliases:
+        return meta
+    return {**meta, "aliases": [alias["metadata"] for alias in aliases]}
+
+
+def _rescore(snap: StoreSnapshot, q_emb: np.ndarray, scores: np.ndarray, idxs: np.ndarray):
+    """Re-rank candidates of a compressed base index by exact inner product with the stored vectors.
+
+    With settings.index_compression (sq8 / pq) the index only holds compressed codes,
+    with settings.pca_dim PCA-projected vectors (the projection lives in index.faiss and
+    FAISS applies it to queries); re-scoring the candidate pool against vectors.npy
+    keeps "distance" = 1 - cosine.
+    """
+    found = idxs >= 0
+    idxs, scores = idxs[found], scores[found]
+    if not index_factory.is_approximate(snap.index) or not snap.vectors.complete(snap.base_count):
+        return scores, idxs
+    exact = snap.vectors.gather(idxs) @ q_emb
+    order = np.argsort(-exact, kind="stable")
+    return exact[order], idxs[order]
+
+
+def _unsearchable(snap: StoreSnapshot) -> np.ndarray:
+    """Sorted rows no search may return: tombstones and rows without a stored vector."""
+    if not snap.unembedded:
+        return snap.tombstones
+    return np.union1d(snap.tombstones, np.arange(snap.base_count, snap.base_count + snap.unembedded))
+
+
+def _with_tombstones(snap: StoreSnapshot, tombstones: np.ndarray) -> StoreSnapshot:
+    """snap with the given removed rows and the per-index search filters that skip them."""
+    tombstones = np.asarray(tombstones, dtype="int64")
+    if not len(tombstones):
+        return replace(snap, tombstones=tombstones, base_filter=None, delta_filters=())
+    base_dead = tombstones[tombstones < snap.base_count]
+    base_filter = _RowFilter(snap.index, base_dead) if len(base_dead) else None
+    delta_filters = []
+    for start, delta in snap.deltas:
+        dead = tombstones[(tombstones >= start) & (tombstones < start + delta.ntotal)] - start
+        delta_filters.append(_RowFilter(delta, dead) if len(dead) else None)
+    return replace(snap, tombstones=tombstones, base_filter=base_filter, delta_filters=tuple(delta_filters))
+
+
+def _row_vectors(snap: StoreSnapshot, rows: List[int]) -> np.ndarray:
+    """Full-precision vectors of the given rows (reconstructed from the indexes when not on disk).
+
+    IndexError for a row no index covers (see StoreSnapshot.unembedded).
+    """
+    if snap.vectors.complete(snap.count):
+        return snap.vectors.gather(np.array(rows))
+    out = np.empty((len(rows), snap.dim), dtype="float32")
+    starts = [start for start, _ in snap.deltas]
+    for j, row in enumerate(rows):
+        if 0 <= row < snap.base_count:
+            out[j] = snap.index.reconstruct(int(row))
+            continue
+        pos = bisect_right(starts, row) - 1
+        if pos < 0 or row >= starts[pos] + snap.deltas[pos][1].ntotal:
+            raise IndexError(f"No stored vector for row {row}")
+        start, delta = snap.deltas[pos]
+        out[j] = delta.reconstruct(int(row - start))
+    return out
+
+
+class _FilterRows:
+    """Matching live rows per filter, evaluated once per search call."""
+
+    def __init__(self, snap: StoreSnapshot):
+        self.snap = snap
+        self._rows: Dict[MetadataFilter, np.ndarray] = {}
+
+    def get(self, where: Optional[MetadataFilter]) -> Optional[np.ndarray]:
+        if where is None:
+            return None
+        if where not in self._rows:
+            self._rows[where] = where.rows(self.snap.metadata, _unsearchable(self.snap))
+        return self._rows[where]
+
+
+def _subset_filters(snap: StoreSnapshot, rows: np.ndarray):
+    """Per-index selectors for sorted global rows: (base filter, delta filters); None where no row falls."""
+    spans = [(0, snap.index)] + list(snap.deltas)
+    filters = []
+    for start, index in spans:
+        lo, hi = np.searchsorted(rows, [start, start + (index.ntotal if index is not None else 0)])
+        filters.append(_RowSubset(index, rows[lo:hi] - start) if hi > lo else None)
+    return filters[0], tuple(filters[1:])
+
+
+def _and_subject(where: Optional[MetadataFilter], subject: Optional[str]) -> Optional[MetadataFilter]:
+    if not subject:
+        return where
+    return (where or MetadataFilter()).and_subject(subject)
+
+
+def _fill(first, rest):
+    """first (scores, rows) followed by the rows of rest not already in it."""
+    new = ~np.isin(rest[1], first[1])
+    return np.concatenate([first[0], rest[0][new]]), np.concatenate([first[1], rest[1][new]])
+
+
+def _top(scores: np.ndarray, rows: np.ndarray, k: int):
+    """The k best (scores, rows), best first."""
+    top = np.argpartition(-scores, k - 1)[:k] if len(rows) > k else np.arange(len(rows))
+    top = top[np.argsort(-scores[top], kind="stable")]
+    return scores[top], rows[top]
+
+
+def _coarse_search(snap: StoreSnapshot, q: np.ndarray, k: int, within: Optional[np.ndarray] = None,
+                   allowed: Optional[np.ndarray] = None):
+    """Exact top k of q over the base chunks of its best chapters / pages, or None to search globally.
+
+    Chapter and page centroids (coarse/, built at compaction, see coarse_index) pick
+    the chunks; ambiguous queries (no clear best chapter) return None. within, the
+    sorted base rows of a metadata filter, restricts the pick to them (allowed: their
+    pages, see CoarseIndex.pages_with).
+    """
+    rows = snap.coarse.select(q, settings.coarse_chapters, settings.coarse_pages, settings.coarse_margin, k,
+                              allowed)
+    if rows is None:
+        return None
+    if within is not None:
+        rows = rows[np.isin(rows, within)]
+    elif len(snap.tombstones):
+        rows = rows[~np.isin(rows, snap.tombstones)]
+    if len(rows) < k:
+        return None
+    return _top(snap.vectors.gather(rows) @ q, rows, k)
+
+
+def _vector_batches(snap: StoreSnapshot, keep: Optional[np.ndarray] = None, batch: int = 65536):
+    """Full-precision rows of snap in order (only those set in keep), batch by batch."""
+    for lo in range(0, snap.count, batch):
+        hi = min(lo + batch, snap.count)
+        rows = np.arange(lo, hi)
+        if lo >= snap.base_count or snap.vectors.complete(snap.base_count):
+            block = snap.vectors.gather(rows)
+        else:
+            # Stores written before the archive: the base rows come back out of the index
+            index_factory.enable_reconstruct(snap.index)
+            base_hi = min(hi, snap.base_count)
+            block = snap.index.reconstruct_n(lo, base_hi - lo)
+            if hi > base_hi:
+                block = np.concatenate([block, snap.vectors.gather(rows[base_hi - lo:])])
+        yield block if keep is None else block[keep[lo:hi]]
+
+
+def _select(snap: StoreSnapshot, scores: np.ndarray, idxs: np.ndarray, k: int, subject: Optional[str]):
+    """Pick up to k (row, score) pairs from one ranked candidate list, preferring subject matches."""
+    selected = []
+    if subject:
+        matching = snap.metadata.matches("subject", subject, np.maximum(idxs, 0))
+    for j, (score, i) in enumerate(zip(scores, idxs)):
         if i < 0:
             continue
-        meta = _metadata[i]
-        if subject and meta.get("subject") != subject:
+        if subject and not matching[j]:
             continue
-        results.append({
-            "text": _texts[i],
-            "metadata": meta,
-            "distance": float(1 - score)  # cosine distance approx (since score ~ cosine similarity)
-        })
-        if len(results) >= k:
+        selected.append((i, score))
+        if len(selected) >= k:
             break
 
     # If filtering removed too many, fall back (ignore subject) to fill
-    if len(results) < k and subject:
+    if len(selected) < k and subject:
+        chosen = {i for i, _ in selected}
         for score, i in zip(scores, idxs):
-            if i < 0:
-                continue
-            meta = _metadata[i]
-            # Skip if already included
-            if any(r["metadata"]["id"] == meta["id"] for r in results):
+            if i < 0 or i in chosen:
                 continue
-            results.append({
-                "text": _texts[i],
-                "metadata": meta,
-                "distance": float(1 - score)
-            })
-            if len(results) >= k:
+            selected.append((i, score))
+            if len(selected) >= k:
                 break
-    return results
+    return selected
 
 
-def reset_index():
-    """Delete all persisted index data and reset in-memory structures."""
-    global _index, _metadata, _texts, _next_id
-    for p in [INDEX_PATH, METADATA_PATH, TEXTS_PATH, STATE_PATH]:
-        if p.exists():
-            try:
-                p.unlink()
-            except OSError:
-                pass
-    _index = None
-    _metadata = []
-    _texts = []
-    _next_id = 0
-    # Mark loader as not loaded so future operations rebuild state
-    if hasattr(_ensure_loaded, "_loaded"):
-        delattr(_ensure_loaded, "_loaded")
+def _diversify(snap: StoreSnapshot, selected: List[Tuple], k: int, lam: float, subject: Optional[str]):
+    """MMR pick of k of the ranked (row, cosine, rank score) candidates; subject matches keep their precedence.
+
+    Candidates come from the best settings.mmr_pool, so chunks that repeat each other
+    (window overlap, definitions restated on the next page) give way to ones that add
+    content.
+    """
+    if len(selected) <= k:
+        return selected
+    rows = [i for i, _, _ in selected]
+    vectors = _row_vectors(snap, rows)
+    relevance = np.array([cosine for _, cosine, _ in selected], dtype="float32")
+    chosen: List[int] = []
+    if subject:
+        matching = np.flatnonzero(snap.metadata.matches("subject", subject, np.array(rows, dtype="int64")))
+        if len(matching) >= k:  # other subjects would only have filled up
+            return [selected[matching[p]] for p in mmr(relevance[matching], vectors[matching], k, lam)]
+        chosen = matching.tolist()
+    return [selected[p] for p in mmr(relevance, vectors, k, lam, chosen)]
+
+
+def _normalize_query(query: str) -> str:
+    return " ".join(query.split())
+
+
+def _embed_queries(queries: List[str]) -> np.ndarray:
+    """Normalized query vectors, encoding only the queries missing from the cache (in one batch)."""
+    global _query_cache_model
+    if settings.embedding_model != _query_cache_model:
+        _query_cache.clear()
+        _query_cache_model = settings.embedding_model
+    keys = [(_model_name(), _normalize_query(q)) for q in queries]
+    cached = [_query_cache.get(key) for key in keys]
+    missing = [r for r, vec in enumerate(cached) if vec is None]
+    if missing:
+        emb = _query_batcher.encode([keys[r][1] for r in missing])
+        emb = _normalize(np.array(emb, dtype="float32"))
+        for r, vec in zip(missing, emb):
+            cached[r] = vec
+            _query_cache.put(keys[r], vec.copy())
+    return np.vstack(cached)
+
+
+_store = EmbeddingStore(PERSIST_DIR, pack_path=settings.packed_store or None)
+
+
+def snapshot() -> StoreSnapshot:
+    """Current immutable store state (pass it to similarity_search_many for consistent reads)."""
+    return _store.snapshot()
+
+
+def query_cache_stats() -> Dict:
+    """Hit / miss / eviction counters of the query-embedding cache."""
+    return _query_cache.stats()
+
+
+def set_chunk_encoder(encode: Optional[Callable[[List[str]], np.ndarray]]):
+    """Encode new chunks with encode (e.g. EncodePool.encode) instead of the in-process model; None restores it."""
+    global _chunk_encoder
+    _chunk_encoder = encode
+
 
+def uncached_chunks(chunks: List[str]) -> List[str]:
+    """The chunks whose embedding is not in the persistent embedding cache."""
+    cache = get_cache()
+    if cache is None:
+        return list(chunks)
+    cached = cache.contains_many(_model_name(), chunks)
+    return [c for i, c in enumerate(chunks) if i not in cached]
 
 
+def result_cache_stats() -> Dict:
+    """Hit / miss / eviction / expiration counters of the search result cache."""
+    return _result_cache.stats()
+
+
+def query_batch_stats() -> Dict:
+    """Batches / texts encoded by the query micro-batcher (mean and largest batch)."""
+    return _query_batcher.stats()
+
+
+def add_texts(chunks: List[str], metadata: List[Dict]) -> Dict[str, int]:
+    """Add new text chunks & metadata to FAISS index (duplicates skipped; returns the counts).
+
+    Chunks whose normalized text is already stored are skipped, and with
+    settings.near_dup_threshold so are chunks whose MinHash similarity to a stored one
+    reaches it (see dedup). Skipped near-duplicates are recorded as aliases
+    (aliases.jsonl) and listed under metadata["aliases"] of the stored chunk's hits.
+    """
+    return _store.add_texts(chunks, metadata)
+
+
+def remove_source(source: str) -> int:
+    """Remove every chunk ingested from source (a PDF file name); returns the number removed."""
+    return _store.remove_source(source)
+
+
+def replace_source(source: str, chunks: List[str], metadata: List[Dict]) -> Dict[str, int]:
+    """Replace the chunks of source with new ones, embedding only chunks whose text changed."""
+    return _store.replace_source(source, chunks, metadata)
+
+
+def pack(path: Path, rows: Optional[np.ndarray] = None) -> Dict:
+    """Write the live rows of the store (or those set in the rows mask) into a single packed file."""
+    return _store.pack(Path(path), rows)
+
+
+def compact():
+    """Merge all delta segments (and drop removed rows) into a new base generation."""
+    _store.compact()
+
+
+def similarity_search_many(queries: List[str], k: int = 4, subjects: Optional[List[Optional[str]]] = None,
+                           snap: Optional[StoreSnapshot] = None, mode: Optional[str] = None,
+                           filters: Optional[List] = None, mmr_lambda: Optional[float] = None):
+    """Batched similarity_search: one encode pass and one FAISS search for all queries.
+
+    subjects, if given, holds one preferred subject (or None) per query; other
+    subjects only fill up the results when it has fewer than k matches. filters holds
+    one metadata filter per query (a dict, a filter string or None, see
+    metadata_filter); hits never come from rows outside it. mode overrides
+    settings.search_mode ("dense" or "hybrid") and mmr_lambda settings.mmr_lambda.
+    Returns one result list per query, each with the same shape as similarity_search.
+
+    With settings.shards the queries are fanned out to the shard servers instead
+    (snap and mmr_lambda are then ignored: each shard applies its own MMR_LAMBDA)
+    and each result list is a shards.ShardResults.
+
+    Local results are cached per (normalized query, subject, k, mode, filter, MMR
+    lambda, store generation, base): every write bumps the generation, so ingests,
+    removals and reset_index invalidate entries without a flush, and a replaced pack
+    changes the base (its checksum); entries also expire after settings.result_cache_ttl
+    (see result_cache_stats).
+    """
+    subjects = list(subjects) if subjects is not None else [None] * len(queries)
+    if len(subjects) != len(queries):
+        raise ValueError(f"Got {len(subjects)} subjects for {len(queries)} queries")
+    filters = [parse_filter(f) for f in filters] if filters is not None else [None] * len(queries)
+    if len(filters) != len(queries):
+        raise ValueError(f"Got {len(filters)} filters for {len(queries)} queries")
+    if settings.shards:
+        from .shards import coordinator
+        return coordinator().search_many(queries, k, subjects, mode=mode, filters=filters)
+    if not _result_cache.capacity:
+        return _store.search_many(queries, k, subjects, snap=snap, mode=mode, filters=filters, mmr_lambda=mmr_lambda)
+    snap = snap or _store.snapshot()  # the generation in the keys is the one searched
+    mode = (mode or settings.search_mode).lower()
+    lam = settings.mmr_lambda if mmr_lambda is None else mmr_lambda
+    # base names the pack checksum for packed stores: a re-pack can keep the generation
+    keys = [(_normalize_query(q), s, k, mode, f.key if f is not None else None, lam, snap.version, snap.base)
+            for q, s, f in zip(queries, subjects, filters)]
+    out = [_result_cache.get(key) for key in keys]
+    todo: Dict[Tuple, int] = {}
+    for r, hits in enumerate(out):
+        if hits is None:
+            todo.setdefault(keys[r], r)
+    if todo:
+        rows = list(todo.values())
+        found = _store.search_many([queries[r] for r in rows], k, [subjects[r] for r in rows], snap=snap, mode=mode,
+                                   filters=[filters[r] for r in rows], mmr_lambda=lam)
+        fresh = dict(zip(todo, found))
+        for key, hits in fresh.items():
+            _result_cache.put(key, hits)
+        out = [hits if hits is not None else fresh[key] for key, hits in zip(keys, out)]
+    return [copy.deepcopy(hits) for hits in out]  # callers may modify their hits
+
+
+def similarity_search(query: str, k: int = 4, subject: Optional[str] = None, mode: Optional[str] = None,
+                      snap: Optional[StoreSnapshot] = None, filter=None, mmr_lambda: Optional[float] = None):
+    return similarity_search_many([query], k=k, subjects=[subject], snap=snap, mode=mode, filters=[filter],
+                                  mmr_lambda=mmr_lambda)[0]
+
+
+def reset_index():
+    """Delete all persisted index data and reset in-memory structures."""
+    _store.reset()
+    _query_cache.clear()
+    _result_cache.clear()
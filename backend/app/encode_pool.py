@@ -0,0 +1,134 @@
+"""Multi-process chunk encoding for offline ingest.
+
+add_texts encodes in the calling process, so a rebuild on a many-core machine keeps
+one core busy. EncodePool starts worker processes that each load the encoder
+(settings.encoder_backend, same model as embedding_store, so embedding-cache keys
+match) and also extract the PDFs. The ingesting process stays the single writer:
+
+ - extract_async(): PDFs are chunked in the workers, a few ahead of the writer
+ - prefetch(): chunk texts of the next PDFs are split into batch_size batches and
+   encoded in the background while the writer is still on earlier PDFs
+ - encode(): what embedding_store calls for new chunks (see set_chunk_encoder);
+   returns rows in the caller's order, waiting on prefetched batches or encoding
+   the rest right away
+
+Rows go through add_texts / replace_source one PDF at a time and in input order, so
+dedup decisions and chunk ids come out exactly as in a serial run.
+
+The pool is off by default (--workers 0). Each worker loads its own copy of the
+encoder (start-up time and memory per worker) and runs it on one thread, whereas
+in-process encoding already spreads a batch over all cores through torch / ONNX
+threads, and texts and vectors cross a pipe both ways. It can only pay off on a
+large rebuild where PDF extraction or a single-threaded encoder leaves cores idle.
+Compare the chunks/sec that offline_ingest prints for --workers 0 and --workers N on
+a few PDFs (with the embedding cache off) before using it.
+
+python -m backend.app.offline_ingest --workers 8 --batch-size 32
+"""
+from __future__ import annotations
+import multiprocessing
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+import numpy as np
+from .config import settings
+
+_encoder = None  # per worker process
+
+
+class _Batch:
+    """One encode task; counted into the pool statistics when first read."""
+
+    def __init__(self, result):
+        self.result = result
+        self.counted = False
+
+
+def _init_worker(backend: str, model: str, onnx_dir: str, onnx_int8: bool):
+    global _encoder
+    import os
+    os.environ.setdefault("OMP_NUM_THREADS", "1")  # one core per worker (set before torch loads)
+    settings.encoder_backend, settings.embedding_model = backend, model
+    settings.onnx_model_dir, settings.onnx_int8 = onnx_dir, onnx_int8
+    from .encoders import get_encoder
+    _encoder = get_encoder()
+
+
+def _encode_batch(texts: List[str]) -> Tuple[np.ndarray, float]:
+    t0 = time.perf_counter()
+    emb = np.asarray(_encoder.encode(texts, batch_size=len(texts)), dtype="float32")
+    return emb, time.perf_counter() - t0
+
+
+def _extract(args) -> Tuple[List[str], List[Dict]]:
+    from . import pdf_processing
+    path, subject, chunk_size, overlap = args
+    return pdf_processing.extract_chunks_with_metadata(Path(path), subject, chunk_size, overlap)
+
+
+class EncodePool:
+    """Worker processes holding the encoder; rows come back in submission order."""
+
+    def __init__(self, workers: int, batch_size: int = 32):
+        self.workers = workers
+        self.batch_size = max(1, batch_size)
+        # spawn: workers must not inherit the parent's encoder, FAISS or store threads
+        ctx = multiprocessing.get_context("spawn")
+        self._pool = ctx.Pool(workers, initializer=_init_worker,
+                              initargs=(settings.encoder_backend, settings.embedding_model,
+                                        settings.onnx_model_dir, settings.onnx_int8))
+        self._pending: Dict[str, Tuple[_Batch, int]] = {}  # text -> (its batch, row in it)
+        self._lock = threading.Lock()
+        self.encoded = 0
+        self.busy_seconds = 0.0  # summed worker encode time
+
+    def __enter__(self) -> "EncodePool":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._pool.terminate()
+        self._pool.join()
+
+    def extract_async(self, path: Path, subject: str, chunk_size: int, overlap: int):
+        """AsyncResult of (chunks, metadata) for one PDF."""
+        return self._pool.apply_async(_extract, ((str(path), subject, chunk_size, overlap),))
+
+    def prefetch(self, texts: List[str]):
+        """Start encoding the texts not already pending, batch_size per task."""
+        with self._lock:
+            todo = list(dict.fromkeys(t for t in texts if t not in self._pending))
+            for start in range(0, len(todo), self.batch_size):
+                batch = todo[start:start + self.batch_size]
+                task = _Batch(self._pool.apply_async(_encode_batch, (batch,)))
+                for row, text in enumerate(batch):
+                    self._pending[text] = (task, row)
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """Raw (unnormalized) embeddings of texts, one row each, in order."""
+        if not texts:
+            return np.zeros((0, 0), dtype="float32")
+        self.prefetch(texts)
+        with self._lock:
+            slots = [self._pending[t] for t in texts]
+        rows = []
+        for task, row in slots:
+            emb, seconds = task.result.get()
+            if not task.counted:
+                task.counted = True
+                self.encoded += len(emb)
+                self.busy_seconds += seconds
+            rows.append(emb[row])
+        with self._lock:
+            for text in texts:
+                self._pending.pop(text, None)  # encoded once; later copies are caught by dedup / the cache
+        return np.vstack(rows)
+
+    def discard(self, texts: List[str]):
+        """Forget prefetched texts the writer will not ask for (duplicates, cached chunks)."""
+        with self._lock:
+            for text in texts:
+                self._pending.pop(text, None)
@@ -0,0 +1,213 @@
+"""Text encoder backends for embedding_store.
+
+ - torch: the SentenceTransformer model named by settings.embedding_model (default)
+ - onnx:  the same model exported to ONNX Runtime, optionally with dynamic int8
+          weight quantization, for CPU-only ingest / serving nodes
+
+Both return float32 mean-pooled embeddings; embedding_store normalizes them.
+
+Export from the locally cached model, then check parity (PowerShell):
+python -m backend.app.encoders export --out models/all-MiniLM-L6-v2-onnx
+python -m backend.app.encoders parity --tolerance 0.99
+
+The onnx backend needs onnxruntime and tokenizers, and export also needs onnx; they
+are optional (pip install -r requirements-onnx.txt). Export additionally uses torch
+and transformers, both installed with sentence-transformers.
+"""
+from __future__ import annotations
+import argparse
+import json
+from pathlib import Path
+from typing import List, Optional
+import numpy as np
+from .config import settings
+
+try:
+    import onnxruntime as ort  # type: ignore
+except ImportError:  # pragma: no cover
+    ort = None
+
+FP32_FILE = "model_fp32.onnx"
+INT8_FILE = "model_int8.onnx"
+TOKENIZER_FILE = "tokenizer.json"
+ONNX_INPUTS = ["input_ids", "attention_mask", "token_type_ids"]
+ONNX_EXTRA = "pip install -r requirements-onnx.txt"
+
+
+def _require(module: str, purpose: str):
+    """Import an optional ONNX dependency, or fail with how to install it."""
+    try:
+        return __import__(module)
+    except ImportError as e:
+        raise RuntimeError(f"{purpose} requires the {module} package ({ONNX_EXTRA})") from e
+
+
+class SentenceTransformerEncoder:
+    """PyTorch SentenceTransformer backend."""
+
+    def __init__(self, model_name: str):
+        from sentence_transformers import SentenceTransformer
+        self.name = model_name
+        self._model = SentenceTransformer(model_name)
+
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        emb = self._model.encode(texts, batch_size=batch_size, show_progress_bar=False)
+        return np.asarray(emb, dtype="float32")
+
+
+class OnnxEncoder:
+    """ONNX Runtime backend over a model directory written by export_onnx."""
+
+    def __init__(self, model_dir: Path, model_name: str, int8: bool = True, max_length: int = 256):
+        if ort is None:
+            raise RuntimeError(f"ENCODER_BACKEND=onnx requires the onnxruntime package ({ONNX_EXTRA})")
+        Tokenizer = _require("tokenizers", "ENCODER_BACKEND=onnx").Tokenizer
+        model_dir = Path(model_dir)
+        model_file = model_dir / (INT8_FILE if int8 else FP32_FILE)
+        if not model_file.exists():
+            raise FileNotFoundError(f"{model_file} not found; run `python -m backend.app.encoders export` first")
+        self.name = _onnx_name(model_name, int8)
+        self._tokenizer = Tokenizer.from_file(str(model_dir / TOKENIZER_FILE))
+        self._tokenizer.enable_truncation(max_length)
+        self._tokenizer.enable_padding()
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self._session = ort.InferenceSession(str(model_file), opts, providers=["CPUExecutionProvider"])
+        self._inputs = {i.name for i in self._session.get_inputs()}
+
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        out = []
+        for start in range(0, len(texts), batch_size):
+            batch = self._tokenizer.encode_batch(list(texts[start:start + batch_size]))
+            feeds = {
+                "input_ids": np.array([e.ids for e in batch], dtype="int64"),
+                "attention_mask": np.array([e.attention_mask for e in batch], dtype="int64"),
+                "token_type_ids": np.array([e.type_ids for e in batch], dtype="int64"),
+            }
+            hidden = self._session.run(None, {k: v for k, v in feeds.items() if k in self._inputs})[0]
+            # Mean pooling over real tokens, as in the SentenceTransformer pipeline
+            mask = feeds["attention_mask"][..., None].astype("float32")
+            out.append((hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None))
+        if not out:
+            return np.zeros((0, 0), dtype="float32")
+        return np.concatenate(out).astype("float32")
+
+
+def _onnx_name(model_name: str, int8: bool) -> str:
+    return f"{model_name}+onnx-{'int8' if int8 else 'fp32'}"
+
+
+def encoder_name(backend: Optional[str] = None) -> str:
+    """The .name get_encoder(backend) would have (the embedding cache key), without loading the model."""
+    backend = (backend or settings.encoder_backend).lower()
+    if backend == "onnx":
+        return _onnx_name(settings.embedding_model, settings.onnx_int8)
+    return settings.embedding_model
+
+
+def get_encoder(backend: Optional[str] = None):
+    backend = (backend or settings.encoder_backend).lower()
+    if backend == "torch":
+        return SentenceTransformerEncoder(settings.embedding_model)
+    if backend == "onnx":
+        return OnnxEncoder(Path(settings.onnx_model_dir), settings.embedding_model, int8=settings.onnx_int8)
+    raise ValueError(f"Unknown encoder backend {backend!r}; expected 'torch' or 'onnx'")
+
+
+def export_onnx(model_name: str, out_dir: Path, quantize: bool = True) -> Path:
+    """Export a locally cached transformer to ONNX (+ dynamic int8 copy). Returns the output dir."""
+    import torch  # type: ignore
+    from transformers import AutoModel, AutoTokenizer  # type: ignore
+    _require("onnx", "ONNX export")  # torch.onnx.export writes through it
+    if quantize:
+        _require("onnxruntime", "int8 quantization")
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name, local_files_only=True)
+    model = AutoModel.from_pretrained(model_name, local_files_only=True).eval()
+    sample = tokenizer(["an export sample", "a second, longer export sample"], padding=True, return_tensors="pt")
+    axes = {0: "batch", 1: "sequence"}
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(sample[name] for name in ONNX_INPUTS),
+            str(out_dir / FP32_FILE),
+            input_names=ONNX_INPUTS,
+            output_names=["last_hidden_state"],
+            dynamic_axes={name: axes for name in ONNX_INPUTS + ["last_hidden_state"]},
+            opset_version=14,
+        )
+    tokenizer.save_pretrained(str(out_dir))  # writes tokenizer.json for the fast tokenizer
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic  # type: ignore
+        quantize_dynamic(str(out_dir / FP32_FILE), str(out_dir / INT8_FILE), weight_type=QuantType.QInt8)
+    with (out_dir / "export.json").open("w", encoding="utf-8") as f:
+        json.dump({"model": model_name, "quantized": quantize}, f)
+    return out_dir
+
+
+def sample_texts(n: int) -> List[str]:
+    """First n chunk texts of the configured store, or a few built-in sentences."""
+    from .text_store import TextStore
+    store_dir = Path(settings.persist_directory)
+    manifest = store_dir / "manifest.json"
+    if manifest.exists():
+        with manifest.open("r", encoding="utf-8") as f:
+            base = json.load(f).get("base")
+        if base:
+            store_dir = store_dir / "generations" / base
+    texts: List[str] = []
+    if (store_dir / "texts.bin").exists():
+        store = TextStore(store_dir / "texts.bin")
+        texts = store[:n]
+        store.close()
+    elif (store_dir / "texts.jsonl").exists():
+        with (store_dir / "texts.jsonl").open("r", encoding="utf-8") as f:
+            for line in f:
+                texts.append(json.loads(line)["text"])
+                if len(texts) >= n:
+                    break
+    return texts or [
+        "Explain the principle of superposition of waves.",
+        "What are Okazaki fragments in DNA replication?",
+        "State the LIATE rule for integration by parts.",
+        "Derive the magnetic field using the Biot-Savart law.",
+    ]
+
+
+def parity(n: int, tolerance: float) -> bool:
+    """Compare the ONNX backend against PyTorch embeddings by per-text cosine similarity."""
+    texts = sample_texts(n)
+    reference = SentenceTransformerEncoder(settings.embedding_model).encode(texts)
+    candidate = OnnxEncoder(Path(settings.onnx_model_dir), settings.embedding_model, int8=settings.onnx_int8).encode(texts)
+    ref = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    cand = candidate / np.linalg.norm(candidate, axis=1, keepdims=True)
+    cos = (ref * cand).sum(axis=1)
+    ok = bool(cos.min() >= tolerance)
+    print(f"texts={len(texts)} cosine min={cos.min():.5f} mean={cos.mean():.5f} "
+          f"tolerance={tolerance} -> {'PASS' if ok else 'FAIL'}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Encoder backend utilities")
+    sub = parser.add_subparsers(dest="command", required=True)
+    exp = sub.add_parser("export", help="Export the cached model to ONNX with an int8 copy")
+    exp.add_argument("--model", default=settings.embedding_model)
+    exp.add_argument("--out", type=Path, default=Path(settings.onnx_model_dir))
+    exp.add_argument("--no-quantize", action="store_true")
+    par = sub.add_parser("parity", help="Cosine parity of ONNX vs PyTorch embeddings")
+    par.add_argument("--texts", type=int, default=256)
+    par.add_argument("--tolerance", type=float, default=0.99)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        out = export_onnx(args.model, args.out, quantize=not args.no_quantize)
+        print(f"Exported {args.model} to {out}")
+    elif args.command == "parity":
+        raise SystemExit(0 if parity(args.texts, args.tolerance) else 1)
+
+
+if __name__ == "__main__":
+    main()
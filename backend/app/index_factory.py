@@ -0,0 +1,223 @@
+"""Construction and tuning of the FAISS indexes used by embedding_store.
+
+All indexes use the inner-product metric over L2-normalized vectors, so search
+scores stay cosine similarities whichever type is selected:
+ - flat: exact brute-force scan (IndexFlatIP)
+ - ivf:  inverted file over k-means cells (IndexIVFFlat), searched with nprobe cells
+ - hnsw: graph index (IndexHNSWFlat), searched with efSearch candidates
+
+"auto" keeps a flat index until settings.auto_index_threshold vectors and then
+switches to settings.auto_index_type.
+
+settings.index_compression swaps the float32 payload for SQ8 (4x smaller) or PQ
+(pq_m bytes per vector) codes. Compressed scores are approximate; embedding_store
+re-scores their candidates against the full-precision vectors.
+
+settings.pca_dim puts a PCA projection (FAISS PCAMatrix, trained with the index) in
+front of any of them: the index stores and searches pca_dim-dimensional vectors,
+queries are projected by the same IndexPreTransform, and the candidates are
+re-scored like compressed ones. `python -m backend.app.bench recall` reports the
+recall@k it costs.
+"""
+from __future__ import annotations
+import math
+import faiss  # type: ignore
+import numpy as np
+from .config import settings
+
+INDEX_TYPES = ("flat", "ivf", "hnsw")
+COMPRESSIONS = ("none", "sq8", "pq")
+# FAISS wants roughly 39 training points per IVF centroid
+MIN_POINTS_PER_CENTROID = 39
+MAX_TRAIN_POINTS_PER_CENTROID = 256
+# Each PQ sub-quantizer learns 256 centroids
+PQ_MIN_TRAIN_POINTS = 256 * MIN_POINTS_PER_CENTROID
+# Filtered HNSW searches widen efSearch by 1 / (fraction of rows allowed), at most this much
+FILTER_EF_MAX_FACTOR = 16
+# The projection is only learned once the corpus is clearly larger than the input dimension
+PCA_MIN_TRAIN_POINTS = 4096
+PCA_MAX_TRAIN_POINTS = 65536
+
+
+def resolve_index_type(ntotal: int, index_type: str | None = None) -> str:
+    """Index kind that should serve a store of ntotal vectors."""
+    index_type = (index_type or settings.index_type).lower()
+    if index_type == "auto":
+        return settings.auto_index_type.lower() if ntotal >= settings.auto_index_threshold else "flat"
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type {index_type!r}; expected one of {INDEX_TYPES + ('auto',)}")
+    return index_type
+
+
+def resolve_compression(ntotal: int, compression: str | None = None) -> str:
+    """Code type for a store of ntotal vectors; PQ waits until it has enough training points."""
+    compression = (compression or settings.index_compression).lower()
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Unknown index compression {compression!r}; expected one of {COMPRESSIONS}")
+    if compression == "pq" and ntotal < PQ_MIN_TRAIN_POINTS:
+        return "none"
+    return compression
+
+
+def resolve_pca_dim(ntotal: int, pca_dim: int | None = None) -> int:
+    """Projected dimension for a store of ntotal vectors (0: no projection yet / disabled)."""
+    pca_dim = settings.pca_dim if pca_dim is None else pca_dim
+    return pca_dim if pca_dim > 0 and ntotal >= PCA_MIN_TRAIN_POINTS else 0
+
+
+def ivf_nlist(ntotal: int, nlist: int | None = None) -> int:
+    nlist = nlist or settings.ivf_nlist or int(4 * math.sqrt(max(ntotal, 1)))
+    return max(1, min(nlist, ntotal // MIN_POINTS_PER_CENTROID))
+
+
+def factory_string(kind: str, ntotal: int, params: dict | None = None, compression: str = "none",
+                   pca_dim: int = 0) -> str:
+    params = params or {}
+    codes = {"none": "Flat", "sq8": "SQ8", "pq": f"PQ{params.get('pq_m', settings.pq_m)}"}[compression]
+    prefix = f"PCA{pca_dim}," if pca_dim else ""
+    if kind == "flat":
+        return prefix + codes
+    if kind == "ivf":
+        return f"{prefix}IVF{ivf_nlist(ntotal, params.get('nlist'))},{codes}"
+    if kind == "hnsw":
+        m = params.get('M', settings.hnsw_m)
+        if compression == "pq":
+            # IndexHNSWPQ does not support the inner-product metric
+            raise ValueError("PQ compression is not supported with HNSW; use sq8 or an ivf index")
+        return prefix + (f"HNSW{m}" if compression == "none" else f"HNSW{m},SQ8")
+    raise ValueError(f"Unknown index type {kind!r}")
+
+
+def _inner(index):
+    """The index behind a PCA IndexPreTransform (index itself otherwise)."""
+    if isinstance(index, faiss.IndexPreTransform):
+        return faiss.downcast_index(index.index)
+    return index
+
+
+def index_pca_dim(index) -> int:
+    return index.index.d if isinstance(index, faiss.IndexPreTransform) else 0
+
+
+def is_approximate(index) -> bool:
+    """True if search scores are not exact cosines (compressed codes or a projection)."""
+    return index_compression(index) != "none" or index_pca_dim(index) > 0
+
+
+def index_kind(index) -> str:
+    if isinstance(_inner(index), faiss.IndexHNSW):
+        return "hnsw"
+    try:
+        faiss.extract_index_ivf(index)
+        return "ivf"
+    except RuntimeError:
+        return "flat"
+
+
+def index_compression(index) -> str:
+    index = _inner(index)
+    if isinstance(index, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer, faiss.IndexHNSWSQ)):
+        return "sq8"
+    if isinstance(index, (faiss.IndexPQ, faiss.IndexIVFPQ)):
+        return "pq"
+    return "none"
+
+
+def needs_rebuild(index, kind: str, compression: str = "none", ntotal: int | None = None) -> bool:
+    """True if index is not of kind / compression, or is an IVF index trained for a much smaller corpus.
+
+    ntotal is the corpus size the index is about to serve (defaults to index.ntotal).
+    """
+    if index_kind(index) != kind or index_compression(index) != compression:
+        return True
+    if index_pca_dim(index) != resolve_pca_dim(index.ntotal if ntotal is None else ntotal):
+        return True
+    if kind == "ivf":
+        # Retrain once the corpus supports twice as many cells (geometric, so amortized linear)
+        ntotal = index.ntotal if ntotal is None else ntotal
+        return ivf_nlist(ntotal) >= 2 * faiss.extract_index_ivf(index).nlist
+    return False
+
+
+def apply_search_params(index, params: dict | None = None):
+    """Set query-time knobs (nprobe / efSearch) from settings or explicit params."""
+    params = params or {}
+    kind = index_kind(index)
+    if kind == "ivf":
+        faiss.extract_index_ivf(index).nprobe = int(params.get("nprobe", settings.ivf_nprobe))
+    elif kind == "hnsw":
+        _inner(index).hnsw.efSearch = int(params.get("efSearch", settings.hnsw_ef_search))
+
+
+def search_params(index, selector, fraction: float = 1.0):
+    """SearchParameters restricting a search to selector with the index's current knobs.
+
+    fraction is the share of rows the selector lets through: an HNSW walk skips the
+    others but still visits them, so efSearch grows as the share shrinks.
+    Returns None for index types that take no search parameters (flat PQ).
+    """
+    kind = index_kind(index)
+    if kind == "ivf":
+        return faiss.SearchParametersIVF(sel=selector, nprobe=faiss.extract_index_ivf(index).nprobe)
+    if kind == "hnsw":
+        ef = _inner(index).hnsw.efSearch
+        factor = min(1.0 / max(fraction, 1e-9), FILTER_EF_MAX_FACTOR)
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=int(ef * max(factor, 1.0)))
+    if isinstance(_inner(index), faiss.IndexPQ):
+        return None
+    return faiss.SearchParameters(sel=selector)
+
+
+def build_index(kind: str, vectors: np.ndarray, params: dict | None = None, compression: str = "none"):
+    """Create, train (if needed) and fill an index of the given kind."""
+    return build_index_from(kind, vectors.shape[1], len(vectors), lambda rows: vectors[rows], [vectors],
+                            params, compression)
+
+
+def build_index_from(kind: str, d: int, n: int, sample, batches, params: dict | None = None,
+                     compression: str = "none"):
+    """build_index over n rows that arrive as batches (in row order), for bounded memory.
+
+    sample(rows) returns the given sorted row numbers; only the training sample is
+    ever held in memory besides the index itself.
+    """
+    params = params or {}
+    pca_dim = resolve_pca_dim(n, params.get("pca_dim"))
+    if pca_dim and not 0 < pca_dim < d:
+        raise ValueError(f"PCA_DIM ({pca_dim}) must be below the embedding dimension ({d})")
+    if compression == "pq" and (pca_dim or d) % int(params.get("pq_m", settings.pq_m)):
+        raise ValueError(f"PQ_M must divide the index dimension ({pca_dim or d})")
+    index = faiss.index_factory(d, factory_string(kind, n, params, compression, pca_dim), faiss.METRIC_INNER_PRODUCT)
+    if kind == "hnsw":
+        _inner(index).hnsw.efConstruction = int(params.get("efConstruction", settings.hnsw_ef_construction))
+    if not index.is_trained:
+        cells = faiss.extract_index_ivf(index).nlist if kind == "ivf" else 1
+        limit = max(cells * MAX_TRAIN_POINTS_PER_CENTROID, PQ_MIN_TRAIN_POINTS if compression == "pq" else 0,
+                    PCA_MAX_TRAIN_POINTS if pca_dim else 0)
+        rows = np.arange(n)
+        if n > limit:
+            rng = np.random.default_rng(0)
+            rows = np.sort(rng.choice(n, limit, replace=False))
+        index.train(np.ascontiguousarray(sample(rows), dtype="float32"))
+    for batch in batches:
+        if len(batch):
+            index.add(np.ascontiguousarray(batch, dtype="float32"))
+    enable_reconstruct(index)
+    apply_search_params(index, params)
+    return index
+
+
+def reconstruct_all(index) -> np.ndarray:
+    """Recover the stored vectors (approximate for compressed indexes)."""
+    if index.ntotal == 0:
+        return np.zeros((0, index.d), dtype="float32")
+    enable_reconstruct(index)
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def enable_reconstruct(index):
+    """Make single-row reconstruct() work (IVF needs a direct map); call before publishing the index."""
+    if index_kind(index) == "ivf":
+        ivf = faiss.extract_index_ivf(index)
+        if ivf.direct_map.no():
+            ivf.make_direct_map()
@@ -0,0 +1,205 @@
+"""Sparse lexical (BM25) inverted index kept next to the FAISS index.
+
+Exact terms such as "Okazaki fragments", "LIATE" or "Biot-Savart" are where MiniLM
+embeddings are weakest; the hybrid search mode in embedding_store fuses BM25 ranks
+from this index with the dense ranks (reciprocal rank fusion).
+
+Each base generation and each delta segment owns one LexicalPart, stored as a
+lexical/ directory:
+ - terms.json   vocabulary, position = term id
+ - offsets.npy  int64, term id -> [offsets[t], offsets[t + 1]) slice of the postings
+ - docs.npy     int32 part-local rows, by descending BM25 impact within each term
+ - tfs.npy      uint16 term frequencies, parallel to docs.npy
+ - lengths.npy  uint32 token count per row (BM25 length normalization)
+
+The postings are memory-mapped; a lookup touches only the slices of the query
+terms. Collection statistics (N, average length, document frequency) are summed
+over the parts at query time so scores stay correct while deltas accumulate.
+
+Postings are impact-ordered (tf and length normalization with the default k1 / b),
+so a lookup can stop after max_postings entries per term: the rows dropped for very
+common terms are the ones where that term weighs least, which keeps lookups
+sub-millisecond at 1M chunks.
+"""
+from __future__ import annotations
+import json
+import math
+import os
+import re
+import shutil
+from array import array
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+import numpy as np
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have in is it its of on or that the "
+    "this to was were which will with what how why when where who does do".split()
+)
+MAX_TF = np.iinfo(np.uint16).max
+K1 = 1.2
+B = 0.75
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased alphanumeric terms without stopwords ("Biot-Savart" -> biot, savart)."""
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+class LexicalPart:
+    """Postings of one base generation or delta segment (rows are part-local)."""
+
+    def __init__(self, terms: List[str], offsets: np.ndarray, docs: np.ndarray, tfs: np.ndarray,
+                 lengths: np.ndarray):
+        self.terms = terms
+        self.vocab: Dict[str, int] = {t: i for i, t in enumerate(terms)}
+        self.offsets = offsets
+        self.docs = docs
+        self.tfs = tfs
+        self.lengths = lengths
+        self.total_len = int(lengths.sum())
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+    def df(self, term: str) -> int:
+        t = self.vocab.get(term)
+        return 0 if t is None else int(self.offsets[t + 1] - self.offsets[t])
+
+    def postings(self, term: str, limit: int | None = None) -> Tuple[np.ndarray, np.ndarray]:
+        """(rows, tfs) of term, highest impact first, at most limit entries."""
+        t = self.vocab.get(term)
+        if t is None:
+            return np.zeros(0, dtype="int32"), np.zeros(0, dtype="uint16")
+        lo, hi = self.offsets[t], self.offsets[t + 1]
+        if limit is not None:
+            hi = min(hi, lo + limit)
+        return self.docs[lo:hi], self.tfs[lo:hi]
+
+    def save(self, path: Path):
+        """Write to the directory path (replaced atomically as a whole)."""
+        path = Path(path)
+        tmp = path.with_name(path.name + ".tmp")
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+        with (tmp / "terms.json").open("w", encoding="utf-8") as f:
+            json.dump(self.terms, f, ensure_ascii=False)
+        np.save(tmp / "offsets.npy", np.asarray(self.offsets, dtype="int64"))
+        np.save(tmp / "docs.npy", np.asarray(self.docs, dtype="int32"))
+        np.save(tmp / "tfs.npy", np.asarray(self.tfs, dtype="uint16"))
+        np.save(tmp / "lengths.npy", np.asarray(self.lengths, dtype="uint32"))
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Path) -> "LexicalPart":
+        path = Path(path)
+        with (path / "terms.json").open("r", encoding="utf-8") as f:
+            terms = json.load(f)
+        arrays = [np.load(path / name, mmap_mode="r") for name in ("offsets.npy", "docs.npy", "tfs.npy", "lengths.npy")]
+        return cls(terms, *arrays)
+
+
+def _from_postings(terms: List[str], term_ids: np.ndarray, docs: np.ndarray, tfs: np.ndarray,
+                   lengths: np.ndarray) -> LexicalPart:
+    """Group (term, doc, tf) triples by term, highest BM25 impact first within each term."""
+    lengths = np.asarray(lengths, dtype="uint32")
+    avgdl = max(float(lengths.mean()), 1e-9) if len(lengths) else 1.0
+    tf = tfs.astype("float32")
+    impact = tf / (tf + K1 * (1 - B + B * lengths[docs] / avgdl))
+    order = np.lexsort((docs, -impact, term_ids))
+    counts = np.bincount(term_ids, minlength=len(terms))
+    offsets = np.zeros(len(terms) + 1, dtype="int64")
+    np.cumsum(counts, out=offsets[1:])
+    return LexicalPart(terms, offsets, docs[order].astype("int32"), tfs[order].astype("uint16"), lengths)
+
+
+def build_part(texts: Iterable[str]) -> LexicalPart:
+    """Tokenize texts (rows 0..n-1) into a new in-memory part."""
+    vocab: Dict[str, int] = {}
+    term_ids, docs, tfs, lengths = array("i"), array("i"), array("H"), array("I")
+    for doc, text in enumerate(texts):
+        tokens = tokenize(text)
+        lengths.append(len(tokens))
+        for term, tf in Counter(tokens).items():
+            term_ids.append(vocab.setdefault(term, len(vocab)))
+            docs.append(doc)
+            tfs.append(min(tf, MAX_TF))
+    return _from_postings(list(vocab), np.frombuffer(term_ids, dtype="int32"), np.frombuffer(docs, dtype="int32"),
+                          np.frombuffer(tfs, dtype="uint16"), np.frombuffer(lengths, dtype="uint32"))
+
+
+def merge_parts(parts: List[Tuple[int, LexicalPart]], keep: np.ndarray | None = None) -> LexicalPart:
+    """One part covering every (start, part) pair, without re-tokenizing any text.
+
+    keep, a boolean mask over all rows, drops the other rows and renumbers the survivors.
+    """
+    vocab: Dict[str, int] = {}
+    term_ids, docs, tfs, lengths = [], [], [], []
+    for start, part in parts:
+        remap = np.array([vocab.setdefault(t, len(vocab)) for t in part.terms], dtype="int32")
+        counts = np.diff(np.asarray(part.offsets))
+        term_ids.append(np.repeat(remap, counts))
+        docs.append(np.asarray(part.docs, dtype="int32") + start)
+        tfs.append(np.asarray(part.tfs))
+        lengths.append(np.asarray(part.lengths))
+    if not parts:
+        return build_part([])
+    term_ids, docs, tfs, lengths = (np.concatenate(a) for a in (term_ids, docs, tfs, lengths))
+    if keep is not None:
+        live = keep[docs]
+        renumber = np.cumsum(keep) - 1
+        term_ids, docs, tfs, lengths = term_ids[live], renumber[docs[live]].astype("int32"), tfs[live], lengths[keep]
+    return _from_postings(list(vocab), term_ids, docs, tfs, lengths)
+
+
+class LexicalIndex:
+    """BM25 over a chain of (first row, LexicalPart); immutable like the snapshot holding it."""
+
+    def __init__(self, parts: List[Tuple[int, LexicalPart]] | None = None):
+        self.parts: List[Tuple[int, LexicalPart]] = list(parts or [])
+        self.n_docs = sum(len(part) for _, part in self.parts)
+        self.total_len = sum(part.total_len for _, part in self.parts)
+
+    def extended(self, start: int, part: LexicalPart) -> "LexicalIndex":
+        return LexicalIndex(self.parts + [(start, part)])
+
+    def __len__(self) -> int:
+        return self.n_docs
+
+    def search(self, query: str, pool: int, k1: float = K1, b: float = B,
+               max_postings: int | None = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Up to pool (scores, rows) by BM25, best first; empty when no query term is indexed.
+
+        max_postings caps the entries read per term and part (None reads them all).
+        """
+        if not self.n_docs:
+            return np.zeros(0, dtype="float32"), np.zeros(0, dtype="int64")
+        avgdl = max(self.total_len / self.n_docs, 1e-9)
+        rows, scores = [], []
+        for term in set(tokenize(query)):
+            df = sum(part.df(term) for _, part in self.parts)
+            if not df:
+                continue
+            idf = math.log(1 + (self.n_docs - df + 0.5) / (df + 0.5))
+            for start, part in self.parts:
+                docs, tf = part.postings(term, max_postings)
+                if not len(docs):
+                    continue
+                tf = tf.astype("float32")
+                norm = k1 * (1 - b + b * part.lengths[docs] / avgdl)
+                rows.append(docs.astype("int64") + start)
+                scores.append(idf * tf * (k1 + 1) / (tf + norm))
+        if not rows:
+            return np.zeros(0, dtype="float32"), np.zeros(0, dtype="int64")
+        rows, scores = np.concatenate(rows), np.concatenate(scores)
+        if len(rows) > 1:
+            rows, inverse = np.unique(rows, return_inverse=True)
+            scores = np.bincount(inverse, weights=scores).astype("float32")
+        if len(rows) > pool:
+            top = np.argpartition(-scores, pool - 1)[:pool]
+            rows, scores = rows[top], scores[top]
+        order = np.argsort(-scores, kind="stable")
+        return scores[order], rows[order]
@@ -1,14 +1,16 @@
 from fastapi import FastAPI, UploadFile, File, Form, Body, Request
+from fastapi.concurrency import run_in_threadpool
 from typing import List, Optional
 import json
 from pathlib import Path
 from .config import settings
 from .rag_pipeline import answer_question
+from .embedding_store import query_batch_stats, query_cache_stats, result_cache_stats
 
 # Only import ingestion-related modules if not read-only to avoid unnecessary deps at runtime
 if not settings.read_only:
     from . import pdf_processing  # type: ignore
-    from .embedding_store import add_texts, reset_index  # type: ignore
+    from .embedding_store import add_texts, remove_source, replace_source, reset_index  # type: ignore
 
 app = FastAPI(title="NCERT Class 12 RAG Assistant")
 
@@ -17,18 +19,39 @@ PDF_DIR = Path("data/raw_pdfs")
 # Register ingestion + reset endpoints only when not in read-only mode
 if not settings.read_only:
     @app.post("/ingest")
-    async def ingest_pdfs(subject: str = Form(...), files: List[UploadFile] = File(...)):
+    async def ingest_pdfs(subject: str = Form(...), files: List[UploadFile] = File(...),
+                          replace: bool = Form(False)):
+        """Ingest PDFs; with replace=true each file's previously ingested chunks are swapped out."""
         all_chunks = []
         metadata = []
+        totals = {"added": 0, "exact_duplicates": 0, "near_duplicates": 0, "removed": 0}
         for f in files:
             pdf_path = PDF_DIR / f.filename
             content = await f.read()
             pdf_path.write_bytes(content)
             chunks, meta = pdf_processing.extract_chunks_with_metadata(pdf_path, subject, settings.chunk_size, settings.chunk_overlap)
             all_chunks.extend(chunks)
-            metadata.extend(meta)
-        add_texts(all_chunks, metadata)
-        return {"ingested_files": [f.filename for f in files], "chunks": len(all_chunks)}
+            if replace:
+                stats = replace_source(pdf_path.name, chunks, meta)
+                for key in totals:
+                    totals[key] += stats[key]
+            else:
+                metadata.extend(meta)
+        if not replace:
+            totals.update(add_texts(all_chunks, metadata))
+        return {
+            "ingested_files": [f.filename for f in files],
+            "chunks": len(all_chunks),
+            "added": totals["added"],
+            "removed": totals["removed"],
+            "skipped_exact_duplicates": totals["exact_duplicates"],
+            "skipped_near_duplicates": totals["near_duplicates"],
+        }
+
+    @app.delete("/sources/{name}")
+    async def delete_source(name: str):
+        """Drop every chunk ingested from the PDF file name."""
+        return {"source": name, "removed": remove_source(name)}
 
 @app.post("/ask")
 async def ask(
@@ -42,6 +65,8 @@ async def ask(
     use_zero_shot: Optional[bool] = Form(False),
     use_chain_of_thought: Optional[bool] = Form(False),
     stop_sequence: Optional[str] = Form(None),
+    filter: Optional[str] = Form(None),  # e.g. "subject = Physics AND source in {leph201, leph202}"
+    mmr_lambda: Optional[float] = Form(None),  # below 1 trades relevance for less repeated context
     json_body: Optional[dict] = Body(None)
 ):
     # Support both form-data (Streamlit current) and JSON clients
@@ -70,6 +95,10 @@ async def ask(
                     use_chain_of_thought = body_data.get("use_chain_of_thought", False)
                 if stop_sequence is None:  # Only override if not provided via Form
                     stop_sequence = body_data.get("stop_sequence")
+                if filter is None:  # Only override if not provided via Form
+                    filter = body_data.get("filter")
+                if mmr_lambda is None:  # Only override if not provided via Form
+                    mmr_lambda = body_data.get("mmr_lambda")
                 k = body_data.get("k")
         except Exception:
             pass  # Silently continue if JSON parsing fails
@@ -95,6 +124,10 @@ async def ask(
             use_chain_of_thought = json_body.get("use_chain_of_thought", False)
         if stop_sequence is None:  # Only override if not provided via Form
             stop_sequence = json_body.get("stop_sequence")
+        if filter is None:  # Only override if not provided via Form
+            filter = json_body.get("filter")
+        if mmr_lambda is None:  # Only override if not provided via Form
+            mmr_lambda = json_body.get("mmr_lambda")
         k = json_body.get("k")
     else:
         k = None
@@ -104,7 +137,9 @@ async def ask(
         return {"error": "Question cannot be empty"}
         
     try:
-        result = answer_question(
+        # Off the event loop, so concurrent questions can share query encoder batches
+        result = await run_in_threadpool(
+            answer_question,
             question, 
             temperature=temperature, 
             subject=subject, 
@@ -114,7 +149,9 @@ async def ask(
             use_dynamic=use_dynamic,
             use_zero_shot=use_zero_shot,
             use_chain_of_thought=use_chain_of_thought,
-            stop_sequence=stop_sequence
+            stop_sequence=stop_sequence,
+            filter=filter,
+            mmr_lambda=mmr_lambda
         )
         return result
     except Exception as e:
@@ -128,6 +165,13 @@ async def health():
     return {"status": "ok"}
 
 
+@app.get("/cache_stats")
+async def cache_stats():
+    """Hit ratios of the retrieval caches, for monitoring."""
+    return {"results": result_cache_stats(), "query_embeddings": query_cache_stats(),
+            "query_batches": query_batch_stats()}
+
+
 if not settings.read_only:
     @app.post("/reset_index")
     async def reset():
@@ -0,0 +1,291 @@
+"""Typed, columnar chunk metadata.
+
+Chunk metadata is {"subject", "source", "page", "id"} plus occasional extra keys. As a
+list of dicts that costs hundreds of bytes per chunk and a json.loads per row on
+startup. MetadataColumns keeps it as arrays instead:
+ - subject, source: int32 codes into small string dictionaries (-1 = key absent)
+ - page: int32 (MISSING = key absent)
+ - id: int64
+ - extra: JSON object per row for any other key or a value the typed columns cannot
+   hold, stored as one blob with int64 offsets (empty for ordinary rows)
+
+Row dicts are only built for the rows that are read, so it stands in for a tuple of
+dicts wherever metadata is only indexed. Subject / source filters compare codes
+(`matches`) instead of building dicts, and `sorted_column` gives the row set of any
+value or page range without a scan (see metadata_filter).
+
+On disk (metadata.cols, one per base generation and delta segment) the columns are
+one file read in a single call: magic b"NCMETA01", header length (u32), JSON header
+{"count", "subjects", "sources"}, then the arrays (8-byte aligned, in ARRAYS order) and
+the extra blob. MetadataChain strings the files of a base and its segments together.
+"""
+from __future__ import annotations
+import json
+import os
+import struct
+from bisect import bisect_right
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import numpy as np
+
+MISSING = np.iinfo(np.int32).min
+_INT32 = (np.iinfo(np.int32).min + 1, np.iinfo(np.int32).max)
+ARRAYS = ("subject_codes", "source_codes", "pages", "ids", "extra_offsets")
+DTYPES = {"subject_codes": "<i4", "source_codes": "<i4", "pages": "<i4", "ids": "<i8", "extra_offsets": "<i8"}
+MAGIC = b"NCMETA01"
+HEADER = struct.Struct("<8sI")
+
+
+class MetadataColumns(Sequence[Dict]):
+    """Read-only column view over chunk metadata; row dicts are materialised on access."""
+
+    def __init__(self, subjects: List[str], sources: List[str], subject_codes: np.ndarray,
+                 source_codes: np.ndarray, pages: np.ndarray, ids: np.ndarray, extra_offsets: np.ndarray,
+                 extra: bytes | memoryview):
+        self.subjects = subjects
+        self.sources = sources
+        self.subject_codes = subject_codes
+        self.source_codes = source_codes
+        self.pages = pages
+        self.ids = ids
+        self.extra_offsets = extra_offsets
+        self.extra = extra
+        self._sorted: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}  # key -> (rows by value, sorted values)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _row(self, i: int) -> Dict:
+        row: Dict = {}
+        code = self.subject_codes[i]
+        if code >= 0:
+            row["subject"] = self.subjects[code]
+        code = self.source_codes[i]
+        if code >= 0:
+            row["source"] = self.sources[code]
+        if self.pages[i] != MISSING:
+            row["page"] = int(self.pages[i])
+        lo, hi = self.extra_offsets[i], self.extra_offsets[i + 1]
+        if hi > lo:
+            row.update(json.loads(bytes(self.extra[lo:hi])))
+        row["id"] = int(self.ids[i])
+        return row
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._row(j) for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return self._row(int(i))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self._row(i)
+
+    def matches(self, key: str, value, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Boolean mask: row[key] == value (key "subject" or "source"), over rows or the whole column."""
+        names, codes = (self.subjects, self.subject_codes) if key == "subject" else (self.sources, self.source_codes)
+        if rows is not None:
+            codes = codes[rows]
+        if not isinstance(value, str):
+            rows = np.arange(len(self)) if rows is None else rows
+            return np.array([self._row(int(i)).get(key) == value for i in rows], dtype=bool)
+        try:
+            return codes == names.index(value)
+        except ValueError:
+            return np.zeros(len(codes), dtype=bool)
+
+    def column(self, key: str) -> np.ndarray:
+        """Typed column of key: int32 codes for "subject" / "source", pages for "page"."""
+        return {"subject": self.subject_codes, "source": self.source_codes, "page": self.pages}[key]
+
+    def sorted_column(self, key: str) -> Tuple[np.ndarray, np.ndarray]:
+        """(rows ordered by the key's column, the column in that order); built once per part.
+
+        Every value's rows are one contiguous run, ascending, so the rows of a value set or
+        a page range are a few searchsorted slices.
+        """
+        cached = self._sorted.get(key)
+        if cached is None:
+            column = np.asarray(self.column(key))
+            order = np.argsort(column, kind="stable")
+            cached = self._sorted[key] = (order, column[order])
+        return cached
+
+    def rows_between(self, key: str, lo: int, hi: int) -> np.ndarray:
+        """Sorted rows whose typed key column lies in [lo, hi] (codes for subject / source)."""
+        order, values = self.sorted_column(key)
+        return np.sort(order[np.searchsorted(values, lo):np.searchsorted(values, hi, side="right")])
+
+    def rows_in(self, key: str, codes: Sequence[int]) -> np.ndarray:
+        """Sorted rows whose typed key column holds one of codes."""
+        order, values = self.sorted_column(key)
+        runs = [order[np.searchsorted(values, c):np.searchsorted(values, c, side="right")] for c in codes]
+        return np.sort(np.concatenate(runs)) if runs else np.zeros(0, dtype="int64")
+
+    def arrays(self) -> Dict[str, object]:
+        """Everything needed to rebuild the columns: JSON-able dictionaries, numpy arrays and the extra blob."""
+        out: Dict[str, object] = {"subjects": self.subjects, "sources": self.sources, "extra": bytes(self.extra)}
+        out.update((name, getattr(self, name)) for name in ARRAYS)
+        return out
+
+
+def _typed(key: str, value) -> bool:
+    """True if (key, value) fits a typed column."""
+    if key in ("subject", "source"):
+        return isinstance(value, str)
+    if key == "page":
+        return isinstance(value, int) and not isinstance(value, bool) and _INT32[0] <= value <= _INT32[1]
+    return key == "id"
+
+
+def build_columns(rows: Iterable[Dict]) -> MetadataColumns:
+    """Encode metadata dicts (each with an "id") into columns."""
+    subjects: Dict[str, int] = {}
+    sources: Dict[str, int] = {}
+    subject_codes, source_codes, pages, ids = [], [], [], []
+    offsets, blob = [0], bytearray()
+    for row in rows:
+        ids.append(int(row["id"]))
+        extra = {key: value for key, value in row.items() if not _typed(key, value)}
+        subject, source, page = row.get("subject"), row.get("source"), row.get("page")
+        subject_codes.append(subjects.setdefault(subject, len(subjects)) if _typed("subject", subject) else -1)
+        source_codes.append(sources.setdefault(source, len(sources)) if _typed("source", source) else -1)
+        pages.append(page if _typed("page", page) else MISSING)
+        if extra:
+            blob += json.dumps(extra, ensure_ascii=False).encode("utf-8")
+        offsets.append(len(blob))
+    return MetadataColumns(list(subjects), list(sources), np.array(subject_codes, dtype="int32"),
+                           np.array(source_codes, dtype="int32"), np.array(pages, dtype="int32"),
+                           np.array(ids, dtype="int64"), np.array(offsets, dtype="int64"), bytes(blob))
+
+
+def concat_columns(parts: Sequence[MetadataColumns], keep: Optional[np.ndarray] = None) -> MetadataColumns:
+    """One MetadataColumns holding the rows of parts in order (only those set in keep, if given)."""
+    subjects: Dict[str, int] = {}
+    sources: Dict[str, int] = {}
+    columns: Dict[str, List[np.ndarray]] = {name: [] for name in ARRAYS[:-1]}
+    lengths = []
+    for part in parts:
+        # Trailing -1 so that absent values (code -1) stay -1
+        for names, table, key in ((part.subjects, subjects, "subject_codes"), (part.sources, sources, "source_codes")):
+            lut = np.array([table.setdefault(name, len(table)) for name in names] + [-1], dtype="int32")
+            columns[key].append(lut[getattr(part, key)])
+        columns["pages"].append(np.asarray(part.pages))
+        columns["ids"].append(np.asarray(part.ids))
+        lengths.append(np.diff(part.extra_offsets))
+    merged = {name: np.concatenate(arrays) if arrays else np.zeros(0, dtype=DTYPES[name])
+              for name, arrays in columns.items()}
+    lengths = np.concatenate(lengths) if lengths else np.zeros(0, dtype="int64")
+    if keep is not None:
+        merged = {name: array[keep] for name, array in merged.items()}
+    # Extra values are rare: copy the non-empty slices only
+    extra = bytearray()
+    row = 0
+    for part in parts:
+        part_keep = None if keep is None else keep[row:row + len(part)]
+        for i in np.flatnonzero(np.diff(part.extra_offsets) > 0):
+            if part_keep is None or part_keep[i]:
+                extra += bytes(part.extra[part.extra_offsets[i]:part.extra_offsets[i + 1]])
+        row += len(part)
+    kept_lengths = lengths if keep is None else lengths[keep]
+    offsets = np.concatenate([[0], np.cumsum(kept_lengths)]).astype("int64")
+    return MetadataColumns(list(subjects), list(sources), merged["subject_codes"], merged["source_codes"],
+                           merged["pages"], merged["ids"], offsets, bytes(extra))
+
+
+def save_columns(path: Path, columns: MetadataColumns):
+    """Write columns to path atomically (see the module docstring for the layout)."""
+    path = Path(path)
+    header = json.dumps({"count": len(columns), "subjects": columns.subjects, "sources": columns.sources},
+                        ensure_ascii=False).encode("utf-8")
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("wb") as f:
+        f.write(HEADER.pack(MAGIC, len(header)))
+        f.write(header)
+        for name in ARRAYS:
+            f.write(b"\0" * (-f.tell() % 8))
+            f.write(np.ascontiguousarray(getattr(columns, name), dtype=DTYPES[name]).tobytes())
+        f.write(bytes(columns.extra))
+    os.replace(tmp, path)
+
+
+def load_columns(path: Path) -> MetadataColumns:
+    """Read a metadata.cols file; the arrays are views into the one buffer read."""
+    data = Path(path).read_bytes()
+    magic, header_len = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError(f"Invalid metadata columns file: {path}")
+    header = json.loads(data[HEADER.size:HEADER.size + header_len])
+    count = header["count"]
+    pos = HEADER.size + header_len
+    arrays = {}
+    for name in ARRAYS:
+        pos += -pos % 8
+        n = count + 1 if name == "extra_offsets" else count
+        arrays[name] = np.frombuffer(data, dtype=DTYPES[name], count=n, offset=pos)
+        pos += arrays[name].nbytes
+    return MetadataColumns(header["subjects"], header["sources"], *(arrays[name] for name in ARRAYS),
+                           memoryview(data)[pos:])
+
+
+class MetadataChain(Sequence[Dict]):
+    """Metadata of a base and its delta segments as consecutive MetadataColumns parts (immutable)."""
+
+    def __init__(self, parts: Sequence[MetadataColumns] = ()):
+        self.parts: Tuple[MetadataColumns, ...] = tuple(parts)
+        self._starts: List[int] = []
+        total = 0
+        for part in self.parts:
+            self._starts.append(total)
+            total += len(part)
+        self._count = total
+
+    def extended(self, part: MetadataColumns) -> "MetadataChain":
+        return MetadataChain(self.parts + (part,))
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        p = bisect_right(self._starts, i) - 1
+        return self.parts[p]._row(int(i - self._starts[p]))
+
+    def __iter__(self):
+        for part in self.parts:
+            yield from part
+
+    def matches(self, key: str, value, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Boolean mask: row[key] == value (key "subject" or "source"), over rows or all rows."""
+        if rows is None:
+            masks = [part.matches(key, value) for part in self.parts]
+            return np.concatenate(masks) if masks else np.zeros(0, dtype=bool)
+        rows = np.asarray(rows, dtype="int64")
+        out = np.zeros(len(rows), dtype=bool)
+        which = np.searchsorted(self._starts, rows, side="right") - 1
+        for p in np.unique(which):
+            sel = which == p
+            out[sel] = self.parts[p].matches(key, value, rows[sel] - self._starts[p])
+        return out
+
+    @property
+    def starts(self) -> List[int]:
+        """First row of each part."""
+        return self._starts
+
+    @property
+    def ids(self) -> np.ndarray:
+        arrays = [np.asarray(part.ids) for part in self.parts]
+        return np.concatenate(arrays) if arrays else np.zeros(0, dtype="int64")
+
+    def merged(self, keep: Optional[np.ndarray] = None) -> MetadataColumns:
+        """All rows (or those set in keep) as one MetadataColumns."""
+        return concat_columns(self.parts, keep)
@@ -0,0 +1,183 @@
+"""Metadata filters: conjunctions over subject, source and page.
+
+A filter restricts a search to the chunks that satisfy every clause, e.g.
+
+    {"subject": "Physics", "source": ["leph201", "leph202"], "page": {"gte": 10, "lte": 40}}
+    "subject = Physics AND source in {leph201, leph202} AND page in 10..40"
+
+ - subject / source: one value or a list of values (any of them); a source may omit
+   its ".pdf" extension
+ - page: one page, {"gte": lo, "lte": hi} (either bound optional), or in the string
+   form "page = 3", "page >= 10", "page <= 40", "page in 10..40"
+
+Clauses only look at the typed metadata columns (see metadata_columns), so rows are
+found through each part's sorted columns: the clause matching the fewest rows is
+read as a few slices, and the other clauses are checked on those rows only. The cost
+follows the size of the filtered subset, not of the store. embedding_store then
+scores the subset exactly when it is small (settings.filter_exact_rows) and
+otherwise hands it to FAISS as an IDSelectorBitmap, so filtered results are exact
+top-k within the subset rather than a post-filter of a global candidate pool.
+"""
+from __future__ import annotations
+import json
+import re
+from typing import Dict, Optional, Tuple, Union
+import numpy as np
+from .metadata_columns import MISSING, MetadataChain, MetadataColumns
+
+KEYS = ("subject", "source", "page")
+PAGE_MIN, PAGE_MAX = MISSING + 1, np.iinfo(np.int32).max
+
+_CLAUSE_RE = re.compile(r"^\s*(\w+)\s*(=|==|>=|<=|\bin\b)\s*(.+?)\s*$", re.IGNORECASE)
+_AND_RE = re.compile(r"\s+and\s+", re.IGNORECASE)
+
+
+def _strip(value: str) -> str:
+    return value.strip().strip("'\"").strip()
+
+
+class MetadataFilter:
+    """Immutable conjunction of clauses; equal filters hash alike (usable as cache keys)."""
+
+    def __init__(self, subjects: Optional[Tuple[str, ...]] = None, sources: Optional[Tuple[str, ...]] = None,
+                 pages: Optional[Tuple[int, int]] = None):
+        self.subjects = tuple(sorted(set(subjects))) if subjects is not None else None
+        self.sources = tuple(sorted(set(sources))) if sources is not None else None
+        self.pages = pages  # inclusive (lo, hi)
+        self.key = (self.subjects, self.sources, self.pages)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, MetadataFilter) and self.key == other.key
+
+    def __hash__(self) -> int:
+        return hash(self.key)
+
+    def __repr__(self) -> str:
+        return f"MetadataFilter({self.describe()!r})"
+
+    def describe(self) -> str:
+        clauses = []
+        for key, values in (("subject", self.subjects), ("source", self.sources)):
+            if values is not None:
+                clauses.append(f"{key} = {values[0]}" if len(values) == 1 else f"{key} in {{{', '.join(values)}}}")
+        if self.pages is not None:
+            clauses.append(f"page in {self.pages[0]}..{self.pages[1]}")
+        return " AND ".join(clauses) or "true"
+
+    def and_subject(self, subject: str) -> "MetadataFilter":
+        """This filter AND subject = subject."""
+        subjects = (subject,) if self.subjects is None or subject in self.subjects else ()
+        return MetadataFilter(subjects, self.sources, self.pages)
+
+    # ----- evaluation -------------------------------------------------------------------
+    def _codes(self, part: MetadataColumns, key: str) -> np.ndarray:
+        """Dictionary codes of the part's values that the subject / source clause accepts."""
+        if key == "subject":
+            wanted = set(self.subjects)
+            return np.array([c for c, name in enumerate(part.subjects) if name in wanted], dtype="int32")
+        wanted = set(self.sources)
+        return np.array([c for c, name in enumerate(part.sources)
+                         if name in wanted or name.rsplit(".", 1)[0] in wanted], dtype="int32")
+
+    def _part_rows(self, part: MetadataColumns) -> np.ndarray:
+        clauses = []  # (estimated rows, key, codes or (lo, hi))
+        for key, values in (("subject", self.subjects), ("source", self.sources)):
+            if values is not None:
+                codes = self._codes(part, key)
+                _, column = part.sorted_column(key)
+                size = int(sum(np.searchsorted(column, c, side="right") - np.searchsorted(column, c) for c in codes))
+                clauses.append((size, key, codes))
+        if self.pages is not None:
+            _, column = part.sorted_column("page")
+            lo, hi = self.pages
+            size = int(np.searchsorted(column, hi, side="right") - np.searchsorted(column, lo))
+            clauses.append((size, "page", self.pages))
+        if not clauses:
+            return np.arange(len(part), dtype="int64")
+        clauses.sort(key=lambda c: c[0])
+        size, key, arg = clauses[0]
+        if not size:
+            return np.zeros(0, dtype="int64")
+        rows = part.rows_between("page", *arg) if key == "page" else part.rows_in(key, arg)
+        for _, key, arg in clauses[1:]:
+            values = np.asarray(part.column(key))[rows]
+            keep = (values >= arg[0]) & (values <= arg[1]) if key == "page" else np.isin(values, arg)
+            rows = rows[keep]
+        return rows.astype("int64")
+
+    def rows(self, metadata: MetadataChain, tombstones: Optional[np.ndarray] = None) -> np.ndarray:
+        """Sorted rows of metadata that match every clause, without the removed ones."""
+        parts = [self._part_rows(part) + start for start, part in zip(metadata.starts, metadata.parts)]
+        rows = np.concatenate(parts) if parts else np.zeros(0, dtype="int64")
+        if tombstones is not None and len(tombstones) and len(rows):
+            rows = rows[~np.isin(rows, tombstones, assume_unique=True)]
+        return rows
+
+
+def _page_range(value) -> Tuple[int, int]:
+    if isinstance(value, dict):
+        unknown = set(value) - {"gte", "lte"}
+        if unknown:
+            raise ValueError(f"Unknown page bound(s) {sorted(unknown)}; expected 'gte' / 'lte'")
+        return int(value.get("gte", PAGE_MIN)), int(value.get("lte", PAGE_MAX))
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise ValueError(f"Page filter must be a page number or {{'gte', 'lte'}}, got {value!r}")
+    return value, value
+
+
+def _values(key: str, value) -> Tuple[str, ...]:
+    values = (value,) if isinstance(value, str) else tuple(value)
+    if not values or not all(isinstance(v, str) for v in values):
+        raise ValueError(f"{key} filter must be a string or a non-empty list of strings, got {value!r}")
+    return values
+
+
+def _parse_text(text: str) -> Dict:
+    """"subject = Physics AND source in {a, b} AND page >= 3" -> dict spec."""
+    spec: Dict = {}
+    for clause in filter(None, (c.strip() for c in _AND_RE.split(text))):
+        match = _CLAUSE_RE.match(clause)
+        if not match:
+            raise ValueError(f"Cannot parse filter clause {clause!r}")
+        key, op, value = match.group(1).lower(), match.group(2).lower(), match.group(3)
+        if key not in KEYS:
+            raise ValueError(f"Unknown filter key {key!r}; expected one of {KEYS}")
+        if key == "page":
+            lo, hi = spec.get("page", {}).get("gte", PAGE_MIN), spec.get("page", {}).get("lte", PAGE_MAX)
+            if op == "in":
+                first, _, last = value.partition("..")
+                lo, hi = max(lo, int(first)), min(hi, int(last))
+            elif op == ">=":
+                lo = max(lo, int(value))
+            elif op == "<=":
+                hi = min(hi, int(value))
+            else:
+                lo, hi = max(lo, int(value)), min(hi, int(value))
+            spec["page"] = {"gte": lo, "lte": hi}
+        elif op == "in":
+            if not (value.startswith("{") and value.endswith("}")):
+                raise ValueError(f"Expected {key} in {{a, b, ...}}, got {clause!r}")
+            spec[key] = [_strip(v) for v in value[1:-1].split(",") if _strip(v)]
+        elif op in ("=", "=="):
+            spec[key] = _strip(value)
+        else:
+            raise ValueError(f"Operator {op!r} only applies to page")
+    return spec
+
+
+def parse_filter(spec: Union[None, str, Dict, MetadataFilter]) -> Optional[MetadataFilter]:
+    """MetadataFilter from a dict spec, its JSON text or a filter string (None / empty: no filter)."""
+    if spec is None or isinstance(spec, MetadataFilter):
+        return spec
+    if isinstance(spec, str):
+        spec = json.loads(spec) if spec.lstrip().startswith("{") else _parse_text(spec)
+    if not isinstance(spec, dict):
+        raise ValueError(f"Filter must be a dict or a filter string, got {type(spec).__name__}")
+    unknown = set(spec) - set(KEYS)
+    if unknown:
+        raise ValueError(f"Unknown filter key(s) {sorted(unknown)}; expected one of {KEYS}")
+    if not spec:
+        return None
+    return MetadataFilter(_values("subject", spec["subject"]) if "subject" in spec else None,
+                          _values("source", spec["source"]) if "source" in spec else None,
+                          _page_range(spec["page"]) if "page" in spec else None)
@@ -0,0 +1,38 @@
+"""Maximal-marginal-relevance re-selection of retrieved chunks.
+
+Overlapping chunk windows (chunk_overlap) and neighbouring pages that repeat a
+definition put near-identical chunks into the top-k, and each one costs prompt
+tokens. MMR picks the k results greedily from a wider candidate pool: every step
+takes the candidate with the highest
+
+    lam * cosine(query, c) - (1 - lam) * max cosine(c, already picked)
+
+so lam 1 is plain relevance order and lower values trade relevance for coverage.
+Similarities come from the stored (normalized) chunk vectors of the pool only, a
+pool x pool product. embedding_store applies it with settings.mmr_lambda over
+settings.mmr_pool candidates; `python -m backend.app.bench mmr` reports prompt
+tokens, distinct content and latency per prompting mode.
+"""
+from __future__ import annotations
+from typing import List, Sequence
+import numpy as np
+
+
+def mmr(relevance: np.ndarray, vectors: np.ndarray, k: int, lam: float, chosen: Sequence[int] = ()) -> List[int]:
+    """Positions of up to k candidates in pick order; chosen (already picked) positions come first."""
+    chosen = list(chosen)
+    n = len(relevance)
+    if n == 0 or len(chosen) >= k:
+        return chosen[:k]
+    sims = vectors @ vectors.T
+    redundancy = sims[:, chosen].max(axis=1) if chosen else np.zeros(n, dtype=sims.dtype)
+    available = np.ones(n, dtype=bool)
+    available[chosen] = False
+    while len(chosen) < k and available.any():
+        gain = lam * relevance - (1 - lam) * redundancy
+        gain[~available] = -np.inf
+        j = int(np.argmax(gain))
+        chosen.append(j)
+        available[j] = False
+        redundancy = np.maximum(redundancy, sims[:, j])
+    return chosen
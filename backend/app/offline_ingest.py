@@ -3,16 +3,20 @@
 Usage (PowerShell):
 python -m backend.app.offline_ingest --subject Biology
 python -m backend.app.offline_ingest --subject Physics --pattern leph*.pdf
+python -m backend.app.offline_ingest --compact   # merge delta segments into the base files afterwards
+python -m backend.app.offline_ingest --workers 8 --batch-size 32   # extract / encode in 8 processes (measure first, see encode_pool)
 
 If --subject is omitted, will try to infer subject from filename prefix (leph -> Physics, lebo -> Biology, lemh -> Math) else fallback to 'General'.
 """
 from __future__ import annotations
 import argparse
+import time
+from collections import deque
 from pathlib import Path
-from typing import Iterable
+from typing import Dict, Iterable, Iterator, List, Tuple
 from .config import settings
 from . import pdf_processing
-from .embedding_store import add_texts
+from .embedding_store import add_texts, compact, replace_source, set_chunk_encoder, uncached_chunks
 
 PDF_DIR = Path('data/raw_pdfs')
 
@@ -36,15 +40,45 @@ def iter_pdfs(pattern: str | None) -> Iterable[Path]:
         return sorted(PDF_DIR.glob(pattern))
     return sorted(PDF_DIR.glob('*.pdf'))
 
-def process_file(path: Path, subject: str, chunk_size: int, overlap: int):
+def ingest_chunks(path: Path, chunks: List[str], meta: List[Dict], replace: bool = False):
+    if replace:
+        return replace_source(path.name, chunks, meta)
+    return add_texts(chunks, meta)
+
+def process_file(path: Path, subject: str, chunk_size: int, overlap: int, replace: bool = False):
     chunks, meta = pdf_processing.extract_chunks_with_metadata(path, subject, chunk_size, overlap)
-    add_texts(chunks, meta)
-    return len(chunks)
+    return ingest_chunks(path, chunks, meta, replace=replace)
+
+def pooled(jobs: List[Tuple[Path, str]], pool, lookahead: int) -> Iterator[Tuple[Path, str, List[str], List[Dict]]]:
+    """(pdf, subject, chunks, metadata) in job order; later PDFs are extracted and encoded in the pool meanwhile."""
+    pending = deque()  # [pdf, subject, AsyncResult, prefetched]
+    queued = iter(jobs)
+    while True:
+        while len(pending) < lookahead:
+            job = next(queued, None)
+            if job is None:
+                break
+            pending.append([job[0], job[1], pool.extract_async(job[0], job[1], settings.chunk_size, settings.chunk_overlap), False])
+        if not pending:
+            return
+        pending[0][2].wait()
+        for entry in pending:
+            if not entry[3] and entry[2].ready():
+                entry[3] = True
+                pool.prefetch(uncached_chunks(entry[2].get()[0]))
+        pdf, subj, result, _ = pending.popleft()
+        chunks, meta = result.get()
+        yield pdf, subj, chunks, meta
+        pool.discard(chunks)  # duplicates the writer skipped
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('--subject', help='Override subject for all PDFs')
     parser.add_argument('--pattern', help='Glob pattern to filter PDFs (e.g., leph*.pdf)')
+    parser.add_argument('--replace', action='store_true', help='Replace chunks previously ingested from the same PDFs')
+    parser.add_argument('--compact', action='store_true', help='Merge delta segments into the base files when done')
+    parser.add_argument('--workers', type=int, default=0, help='Extract and encode in this many processes (default 0: in-process; see encode_pool before raising it)')
+    parser.add_argument('--batch-size', type=int, default=32, help='Chunks per encode task with --workers')
     args = parser.parse_args()
 
     pdfs = list(iter_pdfs(args.pattern))
@@ -52,13 +86,43 @@ def main():
         print('No PDFs found.')
         return
 
-    total_chunks = 0
-    for pdf in pdfs:
-        subj = args.subject or infer_subject(pdf.name)
-        count = process_file(pdf, subj, settings.chunk_size, settings.chunk_overlap)
-        total_chunks += count
-        print(f'Ingested {pdf.name} as {subj}: {count} chunks')
-    print(f'Total chunks added: {total_chunks}')
+    jobs = [(pdf, args.subject or infer_subject(pdf.name)) for pdf in pdfs]
+    pool = None
+    if args.workers > 0:
+        from .encode_pool import EncodePool
+        pool = EncodePool(args.workers, args.batch_size)
+        set_chunk_encoder(pool.encode)
+        files = pooled(jobs, pool, lookahead=2 * args.workers)
+    else:
+        files = ((pdf, subj, *pdf_processing.extract_chunks_with_metadata(pdf, subj, settings.chunk_size, settings.chunk_overlap))
+                 for pdf, subj in jobs)
+
+    totals = {'added': 0, 'exact_duplicates': 0, 'near_duplicates': 0, 'removed': 0}
+    chunk_count = 0
+    t0 = time.perf_counter()
+    try:
+        for pdf, subj, chunks, meta in files:
+            stats = ingest_chunks(pdf, chunks, meta, replace=args.replace)
+            chunk_count += len(chunks)
+            for key in totals:
+                totals[key] += stats.get(key, 0)
+            replaced = f", replaced {stats['removed']}" if args.replace else ""
+            print(f"Ingested {pdf.name} as {subj}: {stats['added']} chunks{replaced} "
+                  f"(skipped {stats['exact_duplicates']} exact / {stats['near_duplicates']} near duplicates)")
+    finally:
+        if pool is not None:
+            set_chunk_encoder(None)
+            pool.close()
+    elapsed = time.perf_counter() - t0
+    print(f"Total chunks added: {totals['added']}, removed: {totals['removed']}, "
+          f"skipped: {totals['exact_duplicates']} exact duplicates, {totals['near_duplicates']} near duplicates")
+    mode = f"{args.workers} workers, batch {args.batch_size}" if pool is not None else "in-process"
+    encoded = f", {pool.encoded} encoded in the pool" if pool is not None else ""
+    print(f"{chunk_count} chunks from {len(pdfs)} PDFs in {elapsed:.1f} s: "
+          f"{chunk_count / max(elapsed, 1e-9):.1f} chunks/sec ({mode}{encoded})")
+    if args.compact:
+        compact()
+        print('Compacted store segments.')
 
 if __name__ == '__main__':
     main()
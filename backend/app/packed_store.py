@@ -0,0 +1,189 @@
+"""Single-file, read-only store artifact shared by several server processes.
+
+`uvicorn backend.app.main:app --workers N` gives every worker its own copy of the
+index, metadata and texts. A pack holds the live rows of the store in one file that
+each worker maps read-only (PACKED_STORE=path), so the workers share the OS page cache
+and opening it only reads the footer and the table of contents.
+
+Layout (little endian):
+ - FAISS index at offset 0 (absent for flat indexes), so IVF indexes open with
+   IO_FLAG_MMAP and their inverted lists are mapped straight from the pack
+ - page-aligned sections: vectors (float32 rows), metadata columns (see
+   metadata_columns), texts (a texts.bin image, see text_store), lexical postings
+   arrays (see lexical_index), aliases
+ - table of contents: JSON {"sections": {name: {offset, length, crc32, dtype, shape}}, ...}
+ - footer: magic b"NCPACK01", TOC offset (u64), TOC length (u64), TOC crc32 (u32)
+
+The TOC checksum is checked on every open, section checksums by `verify` (and on open
+with settings.pack_verify). Flat indexes are searched directly over the mapped vectors
+(faiss.knn, the same BLAS kernel as IndexFlatIP); HNSW graphs and flat SQ / PQ codes
+are still read into each process, FAISS 1.8 cannot map them.
+
+python -m backend.app.packed_store pack vector_store.pack
+python -m backend.app.packed_store verify vector_store.pack
+"""
+from __future__ import annotations
+import argparse
+import json
+import mmap
+import os
+import struct
+import zlib
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+import faiss  # type: ignore
+import numpy as np
+
+MAGIC = b"NCPACK01"
+FOOTER = struct.Struct("<8sQQI")
+PAGE = 4096
+_COPY_BLOCK = 1 << 22
+
+Payload = Union[bytes, np.ndarray, Path]
+
+
+class MappedFlatIndex:
+    """Exact inner-product search over memory-mapped rows; read-only stand-in for IndexFlatIP."""
+
+    def __init__(self, vectors: np.ndarray):
+        self.vectors = vectors
+        self.ntotal, self.d = vectors.shape
+
+    def search(self, q_emb: np.ndarray, k: int, params=None):
+        k = min(k, self.ntotal)
+        if k <= 0:
+            return np.zeros((len(q_emb), 0), dtype="float32"), np.zeros((len(q_emb), 0), dtype="int64")
+        return faiss.knn(np.ascontiguousarray(q_emb, dtype="float32"), self.vectors, k,
+                         metric=faiss.METRIC_INNER_PRODUCT)
+
+    def reconstruct(self, i: int) -> np.ndarray:
+        return np.array(self.vectors[i], dtype="float32")
+
+
+def _chunks(payload: Payload) -> Iterable[bytes]:
+    if isinstance(payload, Path):
+        with payload.open("rb") as f:
+            while True:
+                block = f.read(_COPY_BLOCK)
+                if not block:
+                    return
+                yield block
+    elif isinstance(payload, np.ndarray):
+        flat = payload.reshape(-1)
+        step = max(1, _COPY_BLOCK // max(flat.itemsize, 1))
+        for i in range(0, len(flat), step):
+            yield np.ascontiguousarray(flat[i:i + step]).tobytes()
+    else:
+        yield bytes(payload)
+
+
+def write_pack(path: Path, sections: List[Tuple[str, Payload]], info: Dict,
+               index_bytes: Optional[np.ndarray] = None):
+    """Write sections (name, bytes / array / file) into path atomically; info goes into the TOC."""
+    path = Path(path)
+    tmp = path.with_name(path.name + ".tmp")
+    toc: Dict[str, Dict] = {}
+    with tmp.open("wb") as f:
+        if index_bytes is not None:
+            f.write(index_bytes.tobytes())
+            toc["index"] = {"offset": 0, "length": int(index_bytes.nbytes), "crc32": zlib.crc32(index_bytes)}
+        for name, payload in sections:
+            f.write(b"\0" * (-f.tell() % PAGE))
+            entry = {"offset": f.tell(), "crc32": 0}
+            for block in _chunks(payload):
+                f.write(block)
+                entry["crc32"] = zlib.crc32(block, entry["crc32"])
+            entry["length"] = f.tell() - entry["offset"]
+            if isinstance(payload, np.ndarray):
+                entry["dtype"], entry["shape"] = payload.dtype.str, list(payload.shape)
+            toc[name] = entry
+        f.write(b"\0" * (-f.tell() % PAGE))
+        raw = json.dumps({"info": info, "sections": toc}).encode("utf-8")
+        toc_offset = f.tell()
+        f.write(raw)
+        f.write(FOOTER.pack(MAGIC, toc_offset, len(raw), zlib.crc32(raw)))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)  # a reloading replica sees the old pack or the new one, never a partial file
+
+
+class PackFile:
+    """Read-only mapping of a pack; sections are zero-copy views into it."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        with self.path.open("rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < FOOTER.size:
+                raise ValueError(f"Invalid store pack: {self.path}")
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, toc_offset, toc_len, toc_crc = FOOTER.unpack_from(self._mm, size - FOOTER.size)
+        if magic != MAGIC:
+            raise ValueError(f"Invalid store pack magic in {self.path}")
+        raw = self._mm[toc_offset:toc_offset + toc_len]
+        if zlib.crc32(raw) != toc_crc:
+            raise ValueError(f"Store pack table of contents is corrupt: {self.path}")
+        toc = json.loads(raw)
+        self.info: Dict = toc["info"]
+        self.sections: Dict[str, Dict] = toc["sections"]
+        self.checksum = f"{toc_crc:08x}"
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.sections
+
+    def section(self, name: str) -> memoryview:
+        entry = self.sections[name]
+        return memoryview(self._mm)[entry["offset"]:entry["offset"] + entry["length"]]
+
+    def array(self, name: str) -> np.ndarray:
+        entry = self.sections[name]
+        arr = np.frombuffer(self._mm, dtype=np.dtype(entry["dtype"]), offset=entry["offset"],
+                            count=int(np.prod(entry["shape"])))
+        return arr.reshape(entry["shape"])
+
+    def json(self, name: str):
+        return json.loads(bytes(self.section(name)))
+
+    def verify(self) -> List[str]:
+        """Names of the sections whose crc32 does not match."""
+        bad = []
+        for name, entry in self.sections.items():
+            crc = 0
+            for pos in range(entry["offset"], entry["offset"] + entry["length"], _COPY_BLOCK):
+                crc = zlib.crc32(self._mm[pos:min(pos + _COPY_BLOCK, entry["offset"] + entry["length"])], crc)
+            if crc != entry["crc32"]:
+                bad.append(name)
+        return bad
+
+    def load_index(self):
+        """The FAISS index (inverted lists mapped for IVF) or a MappedFlatIndex over the vectors."""
+        if "index" not in self.sections:
+            return MappedFlatIndex(self.array("vectors"))
+        return faiss.read_index(str(self.path), faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Packed store artifact utilities")
+    sub = parser.add_subparsers(dest="command", required=True)
+    pk = sub.add_parser("pack", help="Write the live rows of the store into one file")
+    pk.add_argument("out", type=Path)
+    vf = sub.add_parser("verify", help="Check every section checksum of a pack")
+    vf.add_argument("path", type=Path)
+    args = parser.parse_args()
+
+    if args.command == "pack":
+        from .embedding_store import pack
+        info = pack(args.out)
+        print(f"Packed {info['count']} chunks (generation {info['generation']}) -> {args.out} "
+              f"({args.out.stat().st_size / 2**20:.1f} MiB)")
+    else:
+        pack_file = PackFile(args.path)
+        bad = pack_file.verify()
+        print(f"{args.path}: {len(pack_file.sections)} sections, "
+              + ("ok" if not bad else f"checksum mismatch in {', '.join(bad)}"))
+        if bad:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-from .embedding_store import similarity_search
+from .embedding_store import similarity_search, snapshot
 from .llm import generate_answer
 from .config import settings
 from typing import List, Optional, Dict
@@ -635,7 +635,7 @@ def answer_question(question: str, temperature: float | None = None, k: int | No
                  subject: Optional[str] = None, use_one_shot: bool = False, 
                  use_multi_shot: bool = False, use_dynamic: bool = False,
                  use_zero_shot: bool = False, use_chain_of_thought: bool = False,
-                 stop_sequence: Optional[str] = None):
+                 stop_sequence: Optional[str] = None, filter=None, mmr_lambda: Optional[float] = None):
     if not question:
         return {"error": "Question cannot be empty"}
     
@@ -667,7 +667,10 @@ def answer_question(question: str, temperature: float | None = None, k: int | No
     elif use_chain_of_thought:
         question_type = "chain_of_thought"
     
-    retrieved = similarity_search(question, k=k, subject=subject)
+    # Pin one store snapshot so a hot reload mid-request cannot mix generations
+    # (local store only; with shards each shard pins its own and reports it)
+    snap = None if settings.shards else snapshot()
+    retrieved = similarity_search(question, k=k, subject=subject, snap=snap, filter=filter, mmr_lambda=mmr_lambda)
     prompt = build_prompt(
         question, 
         retrieved, 
@@ -717,5 +720,8 @@ def answer_question(question: str, temperature: float | None = None, k: int | No
             "total": total_tokens,
             "model": model_used
         },
-        "used_stop_sequence": stop_sequence is not None
+        "used_stop_sequence": stop_sequence is not None,
+        # With shards: {shard address: generation searched}, plus whether a shard was skipped
+        "store_generation": retrieved.generations if settings.shards else snap.version,
+        "partial_retrieval": getattr(retrieved, "partial", False)
     }
@@ -0,0 +1,79 @@
+"""Offline re-index: rebuild the base FAISS index from the raw vector archive.
+
+Switching index type, compression or PCA projection never re-runs the encoder: the
+normalized vectors of every chunk are already on disk (see vector_archive). They are
+streamed batch by batch into the new index, so besides the index itself only one
+batch and the training sample are held in memory. The result is a new base
+generation (delta segments and removed rows are folded in, as by compaction).
+
+Usage (PowerShell):
+python -m backend.app.reindex --type ivf --compression sq8 --params nlist=1024,nprobe=32
+python -m backend.app.reindex --type hnsw --params M=48,efConstruction=200,efSearch=96
+python -m backend.app.reindex --type flat --pca-dim 192
+
+Servers (and later ingests) must run with the matching settings, printed at the
+end; otherwise they rebuild the base to their own settings on load.
+"""
+from __future__ import annotations
+import argparse
+import time
+from pathlib import Path
+from typing import Dict
+from .config import settings
+from . import index_factory
+
+# --params key -> (settings field, environment variable, type)
+PARAMS = {
+    "nlist": ("ivf_nlist", "IVF_NLIST", int),
+    "nprobe": ("ivf_nprobe", "IVF_NPROBE", int),
+    "M": ("hnsw_m", "HNSW_M", int),
+    "efConstruction": ("hnsw_ef_construction", "HNSW_EF_CONSTRUCTION", int),
+    "efSearch": ("hnsw_ef_search", "HNSW_EF_SEARCH", int),
+    "pq_m": ("pq_m", "PQ_M", int),
+}
+
+
+def parse_params(text: str) -> Dict[str, int]:
+    """"nlist=1024,nprobe=32" -> {"nlist": 1024, "nprobe": 32}."""
+    params: Dict[str, int] = {}
+    for item in filter(None, (part.strip() for part in text.split(","))):
+        key, sep, value = item.partition("=")
+        if not sep or key not in PARAMS:
+            raise ValueError(f"Bad index parameter {item!r}; expected key=value with key in {', '.join(PARAMS)}")
+        params[key] = PARAMS[key][2](value)
+    return params
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the base index from the stored vectors")
+    parser.add_argument("--type", required=True, choices=index_factory.INDEX_TYPES)
+    parser.add_argument("--compression", choices=index_factory.COMPRESSIONS, default=settings.index_compression)
+    parser.add_argument("--pca-dim", type=int, default=settings.pca_dim)
+    parser.add_argument("--params", default="", help="Comma-separated key=value: " + ", ".join(PARAMS))
+    parser.add_argument("--batch-size", type=int, default=65536, help="Vectors read and added per step")
+    parser.add_argument("--store", type=Path, default=None, help="Default: settings.persist_directory")
+    args = parser.parse_args()
+
+    params = parse_params(args.params)
+    # This process builds and checks the index against the same settings the servers should use
+    settings.index_type, settings.index_compression, settings.pca_dim = args.type, args.compression, args.pca_dim
+    for key, value in params.items():
+        setattr(settings, PARAMS[key][0], value)
+
+    from .embedding_store import EmbeddingStore, _store
+    store = EmbeddingStore(args.store) if args.store else _store
+    before = store.snapshot()
+    t0 = time.perf_counter()
+    snap = store.reindex(args.type, args.compression, {**params, "pca_dim": args.pca_dim}, batch=args.batch_size)
+    index = snap.index
+    print(f"Rebuilt {index.ntotal} vectors (was {before.count} rows, {len(before.tombstones)} removed) as "
+          f"{index_factory.index_kind(index)} / {index_factory.index_compression(index)}"
+          + (f" / PCA{index_factory.index_pca_dim(index)}" if index_factory.index_pca_dim(index) else "")
+          + f" in {time.perf_counter() - t0:.1f} s -> {snap.base} (generation {snap.version})")
+    env = {"INDEX_TYPE": args.type, "INDEX_COMPRESSION": args.compression, "PCA_DIM": args.pca_dim}
+    env.update((PARAMS[key][1], value) for key, value in params.items())
+    print("Serve with: " + " ".join(f"{name}={value}" for name, value in env.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+"""Sharded retrieval: shard servers behind a scatter-gather coordinator.
+
+One process holds one slice of the corpus: `split` writes the store into N packs (see
+packed_store) by chunk id hash or by subject, and `serve` answers searches over one of
+them through multiprocessing.connection (length-prefixed pickles over TCP; bind it to
+localhost or a private network only).
+
+Requests are unpickled, so anyone who can complete the handshake can run code on the
+shard. Both sides therefore refuse to start unless SHARD_AUTHKEY is set (there is no
+default); use a long random value shared by the shards and the API, e.g.
+python -c "import secrets; print(secrets.token_hex(32))".
+
+With settings.shards ("host:port,host:port") similarity_search_many becomes the
+coordinator: queries are embedded once (query cache included), sent to every shard in
+parallel, and the per-shard top-k lists are merged by score. Subject preference and
+fallback work as on a single store: matching hits first, then the best of the rest.
+In hybrid mode shards return their dense and BM25 candidate lists unfused; the
+coordinator merges each into a global ranking (BM25 statistics stay per shard) and
+fuses those, as embedding_store does for one store. Metadata filters are evaluated
+by every shard over its own rows.
+
+A shard that does not answer within settings.shard_timeout (connect, authkey handshake
+and reply together), or answers with an error (logged), is skipped; the results are
+then flagged partial (ShardResults.partial / .missing).
+
+python -m backend.app.shards split --shards 4 --by hash --out shards
+SHARD_AUTHKEY=... python -m backend.app.shards serve shards/shard-0.pack --port 7101
+SHARD_AUTHKEY=... SHARDS=127.0.0.1:7101,127.0.0.1:7102,... uvicorn backend.app.main:app
+"""
+from __future__ import annotations
+import argparse
+import json
+import logging
+import queue
+import socket
+import struct
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from multiprocessing.connection import Connection, Listener, answer_challenge, deliver_challenge
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from .config import settings
+
+SHARDS_FILE = "shards.json"
+
+log = logging.getLogger(__name__)
+
+
+class ShardResults(list):
+    """Hits for one query; partial is True when some shard did not answer (listed in missing)."""
+
+    def __init__(self, hits=(), missing: Optional[List[str]] = None, generations: Optional[Dict[str, int]] = None):
+        super().__init__(hits)
+        self.missing: List[str] = missing or []
+        self.partial = bool(self.missing)
+        self.generations: Dict[str, int] = generations or {}  # shard address -> store generation searched
+
+
+def parse_address(address: str) -> Tuple[str, int]:
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+def _io_timeout(sock: socket.socket, seconds: float):
+    """Kernel-level send/receive timeout (0 clears it); unlike settimeout it also holds for a detached fd."""
+    if sys.platform == "win32":
+        value = struct.pack("L", int(seconds * 1000))
+    else:
+        value = struct.pack("ll", int(seconds), int(seconds % 1 * 1_000_000))
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVTIMEO, value)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDTIMEO, value)
+
+
+def connect(address: str, authkey: bytes, timeout: float) -> Connection:
+    """multiprocessing.connection.Client, but the connect and the authkey handshake give up after timeout.
+
+    A stopped or overloaded shard still accepts TCP connections (the kernel backlog does) and
+    then never answers the challenge, which would block the plain Client forever.
+    """
+    timeout = max(timeout, 0.001)  # 0 would mean "no timeout" to SO_RCVTIMEO
+    with socket.create_connection(parse_address(address), timeout=timeout) as sock:
+        sock.setblocking(True)
+        _io_timeout(sock, timeout)
+        conn = Connection(sock.dup().detach())
+        try:
+            answer_challenge(conn, authkey)
+            deliver_challenge(conn, authkey)
+        except BaseException:
+            conn.close()
+            raise
+        _io_timeout(sock, 0)  # the options belong to the socket, so this also clears them for conn
+    return conn
+
+
+def fuse_rankings(per_shard: List[Dict], k: int) -> List[Dict]:
+    """Hybrid mode: global dense and BM25 rankings from the shards' candidates, fused by RRF into "score"."""
+    from .embedding_store import rrf
+    pool = max(settings.hybrid_pool, k)
+    dense = sorted((h for r in per_shard for h in r["dense"]), key=lambda h: -h["score"])[:pool]
+    lexical = sorted((h for r in per_shard for h in r["lexical"]), key=lambda h: -h["bm25"])[:settings.hybrid_pool]
+    hits = {h["metadata"]["id"]: h for h in lexical + dense}
+    fused = rrf([[h["metadata"]["id"] for h in dense], [h["metadata"]["id"] for h in lexical]])
+    for chunk_id, hit in hits.items():
+        hit.pop("bm25", None)
+        hit["score"] = fused[chunk_id]
+    return list(hits.values())
+
+
+def merge_hits(per_shard: List[List[Dict]], k: int, subject: Optional[str]) -> List[Dict]:
+    """Global top k of several shards' hits: by score, subject matches first, then the rest as fallback."""
+    hits = sorted((h for hits in per_shard for h in hits), key=lambda h: -h["score"])
+    selected = [h for h in hits if not subject or h["metadata"].get("subject") == subject][:k]
+    if len(selected) < k and subject:
+        chosen = {id(h) for h in selected}
+        selected += [h for h in hits if id(h) not in chosen][:k - len(selected)]
+    for h in selected:
+        h.pop("score", None)
+    return selected
+
+
+class ShardCoordinator:
+    """Fans searches out to shard servers and merges their answers."""
+
+    def __init__(self, addresses: List[str], timeout: float, authkey: bytes):
+        if not authkey:
+            raise RuntimeError("SHARD_AUTHKEY is not set; shard connections require a shared secret")
+        self.addresses = addresses
+        self.timeout = timeout
+        self.authkey = authkey
+        self._idle: Dict[str, queue.SimpleQueue] = {a: queue.SimpleQueue() for a in addresses}
+        self._pool = ThreadPoolExecutor(max_workers=max(1, len(addresses)), thread_name_prefix="shard")
+
+    def _call(self, address: str, request: Dict, deadline: float):
+        """One request / reply on an idle (or new) connection; None on timeout, connection error or error reply."""
+        try:
+            conn = self._idle[address].get_nowait()
+        except queue.Empty:
+            conn = None
+        try:
+            if conn is None:
+                conn = connect(address, self.authkey, deadline - time.monotonic())
+            conn.send(request)
+            if not conn.poll(max(0.0, deadline - time.monotonic())):
+                conn.close()  # a late reply would be read by the next request
+                return None
+            reply = conn.recv()
+        except (OSError, EOFError):
+            if conn is not None:
+                conn.close()
+            return None
+        self._idle[address].put(conn)
+        if "error" in reply:
+            log.warning("shard %s: %s", address, reply["error"])
+            return None
+        return reply
+
+    def scatter(self, request: Dict) -> Dict[str, Optional[Dict]]:
+        """Replies by shard address; None for shards that failed or missed the deadline."""
+        deadline = time.monotonic() + self.timeout
+        futures = {a: self._pool.submit(self._call, a, request, deadline) for a in self.addresses}
+        done, pending = wait(futures.values(), timeout=max(0.0, deadline - time.monotonic()))
+        for f in pending:
+            f.cancel()  # still queued behind a stuck call; a running one gives up at its own deadline
+        return {a: f.result() if f in done else None for a, f in futures.items()}
+
+    def search_many(self, queries: List[str], k: int, subjects: List[Optional[str]],
+                    mode: Optional[str] = None, filters: Optional[List] = None) -> List[ShardResults]:
+        from .embedding_store import _embed_queries
+        rows = [r for r, q in enumerate(queries) if q]
+        if not rows:
+            return [ShardResults() for _ in queries]
+        q_emb = _embed_queries([queries[r] for r in rows])
+        mode = (mode or settings.search_mode).lower()
+        replies = self.scatter({"op": "search", "queries": queries, "rows": rows, "q_emb": q_emb, "k": k,
+                                "subjects": subjects, "mode": mode, "filters": filters})
+        answered = {a: r for a, r in replies.items() if r is not None}
+        if not answered:
+            raise RuntimeError(f"No shard answered within {self.timeout} s (errors are logged): "
+                               f"{', '.join(self.addresses)}")
+        missing = [a for a, r in replies.items() if r is None]
+        generations = {a: r["generation"] for a, r in answered.items()}
+        out = []
+        for j in range(len(queries)):
+            per_shard = [r["results"][j] for r in answered.values()]
+            if mode == "hybrid":
+                per_shard = [fuse_rankings(per_shard, k)]
+            out.append(ShardResults(merge_hits(per_shard, k, subjects[j]), missing, generations))
+        return out
+
+    def info(self) -> Dict[str, Optional[Dict]]:
+        return self.scatter({"op": "info"})
+
+
+_coordinator: Optional[ShardCoordinator] = None
+_coordinator_lock = threading.Lock()
+
+
+def coordinator() -> ShardCoordinator:
+    """Process-wide coordinator for settings.shards."""
+    global _coordinator
+    with _coordinator_lock:
+        if _coordinator is None:
+            addresses = [a.strip() for a in settings.shards.split(",") if a.strip()]
+            _coordinator = ShardCoordinator(addresses, settings.shard_timeout, settings.shard_authkey.encode())
+        return _coordinator
+
+
+# ----- shard server --------------------------------------------------------------------
+def _handle(store, conn):
+    with conn:
+        while True:
+            try:
+                request = conn.recv()
+            except (EOFError, OSError):
+                return
+            try:
+                snap = store.snapshot()
+                if request["op"] == "search":
+                    results = store.search_vectors(request["queries"], request["rows"], request["q_emb"],
+                                                   request["k"], request["subjects"], snap, request["mode"],
+                                                   rankings=True, filters=request.get("filters"))
+                    reply = {"results": results, "generation": snap.version}
+                elif request["op"] == "info":
+                    reply = {"generation": snap.version, "count": snap.live_count, "base": snap.base}
+                else:
+                    reply = {"error": f"unknown op {request['op']!r}"}
+            except Exception as e:  # reported to the coordinator instead of dropping the connection
+                reply = {"error": f"{type(e).__name__}: {e}"}
+            conn.send(reply)
+
+
+def serve(path: Path, host: str, port: int):
+    """Answer searches over one shard (a pack file or a store directory) until interrupted."""
+    if not settings.shard_authkey:
+        raise SystemExit("SHARD_AUTHKEY is not set; refusing to serve a shard without a shared secret")
+    from .embedding_store import EmbeddingStore
+    path = Path(path)
+    store = EmbeddingStore(path) if path.is_dir() else EmbeddingStore(path.parent, pack_path=path)
+    snap = store.snapshot()
+    if settings.reload_interval > 0:
+        store.watch(settings.reload_interval)  # a re-split replaces the pack in place
+    with Listener((host, port), authkey=settings.shard_authkey.encode()) as listener:
+        print(f"Serving {path} ({snap.live_count} chunks, generation {snap.version}) on {host}:{port}", flush=True)
+        while True:
+            conn = listener.accept()
+            threading.Thread(target=_handle, args=(store, conn), daemon=True).start()
+
+
+def split(out_dir: Path, shards: int, by: str) -> List[Dict]:
+    """Write the current store as packs out_dir/shard-N.pack, by chunk id hash or by subject."""
+    from . import embedding_store
+    snap = embedding_store.snapshot()
+    ids = snap.metadata.ids
+    if by == "hash":
+        assignment = ids % shards
+        layout = [{"hash": f"id % {shards} == {n}"} for n in range(shards)]
+    elif by == "subject":
+        subjects = np.array([m.get("subject") or "" for m in snap.metadata], dtype=object)
+        names = sorted(set(subjects))
+        # Largest subjects first, each to the currently smallest shard
+        sizes = {name: int((subjects == name).sum()) for name in names}
+        load, owner = [0] * shards, {}
+        for name in sorted(names, key=lambda n: -sizes[n]):
+            target = load.index(min(load))
+            owner[name] = target
+            load[target] += sizes[name]
+        assignment = np.array([owner[s] for s in subjects], dtype="int64")
+        layout = [{"subjects": sorted(n for n in names if owner[n] == shard)} for shard in range(shards)]
+    else:
+        raise ValueError(f"Unknown split {by!r}; expected 'hash' or 'subject'")
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    for n in range(shards):
+        if not (assignment == n).any():
+            continue
+        path = out_dir / f"shard-{n}.pack"
+        info = embedding_store.pack(path, rows=assignment == n)
+        layout[n].update(path=path.name, count=info["count"], generation=info["generation"])
+    layout = [entry for entry in layout if "path" in entry]
+    with (out_dir / SHARDS_FILE).open("w", encoding="utf-8") as f:
+        json.dump(layout, f, indent=2)
+    return layout
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sharded retrieval")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sp = sub.add_parser("split", help="Write the store as N shard packs")
+    sp.add_argument("--shards", type=int, required=True)
+    sp.add_argument("--by", choices=["hash", "subject"], default="hash")
+    sp.add_argument("--out", type=Path, default=Path("shards"))
+    sv = sub.add_parser("serve", help="Serve one shard pack (or store directory)")
+    sv.add_argument("path", type=Path)
+    sv.add_argument("--host", default="127.0.0.1")
+    sv.add_argument("--port", type=int, required=True)
+    args = parser.parse_args()
+
+    if args.command == "split":
+        for entry in split(args.out, args.shards, args.by):
+            print(f"{entry['path']}: {entry['count']} chunks " + (", ".join(entry["subjects"]) if "subjects" in entry else ""))
+    else:
+        serve(args.path, args.host, args.port)
+
+
+if __name__ == "__main__":
+    main()
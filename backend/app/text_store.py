@@ -0,0 +1,222 @@
+"""Binary, memory-mapped store for chunk texts.
+
+Layout of a texts.bin file (little endian):
+ - header: magic b"TXT1", block size (u32), text count (u64), block count (u64), table offset (u64)
+ - blocks: zlib-compressed [u32 lengths of the block's texts][utf-8 bytes]
+ - offset table: block count + 1 u64 file offsets (written last so blocks stream to disk)
+
+Only the blocks holding requested ids are decompressed, so resident memory and
+open time do not grow with the number of chunks.
+
+Migration from the legacy JSONL layout:
+python -m backend.app.text_store migrate vector_store/texts.jsonl vector_store/texts.bin
+"""
+from __future__ import annotations
+import argparse
+import json
+import mmap
+import os
+import struct
+import zlib
+from pathlib import Path
+from typing import Dict, Iterable, List, Sequence
+
+MAGIC = b"TXT1"
+HEADER = struct.Struct("<4sIQQQ")
+DEFAULT_BLOCK_SIZE = 16
+
+
+def write_text_store(path: Path, texts: Iterable[str], block_size: int = DEFAULT_BLOCK_SIZE) -> int:
+    """Write texts to path (atomically) and return how many were written."""
+    path = Path(path)
+    tmp = path.with_name(path.name + ".tmp")
+    pending: List[bytes] = []
+    offsets: List[int] = [HEADER.size]
+    count = 0
+
+    with tmp.open("wb") as f:
+        f.write(b"\0" * HEADER.size)
+
+        def flush():
+            lengths = struct.pack(f"<{len(pending)}I", *(len(b) for b in pending))
+            block = zlib.compress(lengths + b"".join(pending), 6)
+            f.write(block)
+            offsets.append(offsets[-1] + len(block))
+            pending.clear()
+
+        for text in texts:
+            pending.append(text.encode("utf-8"))
+            count += 1
+            if len(pending) == block_size:
+                flush()
+        if pending:
+            flush()
+        f.write(struct.pack(f"<{len(offsets)}Q", *offsets))
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, block_size, count, len(offsets) - 1, offsets[-1]))
+    os.replace(tmp, path)
+    return count
+
+
+class TextStore(Sequence[str]):
+    """Read-only view over a texts.bin file; texts are decoded on access."""
+
+    def __init__(self, path: Path, buffer=None):
+        """buffer, if given, is a texts.bin image the caller already mapped (a packed store section)."""
+        self.path = Path(path)
+        if buffer is not None:
+            self._file = None
+            self._mm, size = buffer, len(buffer)
+        else:
+            self._file = self.path.open("rb")
+            size = os.fstat(self._file.fileno()).st_size
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        if self._mm is None or size < HEADER.size:
+            raise ValueError(f"Invalid text store: {self.path}")
+        magic, self.block_size, self._count, self._nblocks, self._offsets_at = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"Invalid text store magic in {self.path}")
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _block(self, b: int) -> List[str]:
+        start, end = struct.unpack_from("<2Q", self._mm, self._offsets_at + 8 * b)
+        raw = zlib.decompress(self._mm[start:end])
+        n = min(self.block_size, self._count - b * self.block_size)
+        lengths = struct.unpack_from(f"<{n}I", raw, 0)
+        pos = 4 * n
+        out = []
+        for length in lengths:
+            out.append(raw[pos:pos + length].decode("utf-8"))
+            pos += length
+        return out
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self._count))]
+        if i < 0:
+            i += self._count
+        if not 0 <= i < self._count:
+            raise IndexError(i)
+        return self._block(i // self.block_size)[i % self.block_size]
+
+    def get_many(self, ids: Iterable[int]) -> Dict[int, str]:
+        """Fetch several texts, decompressing each touched block once."""
+        by_block: Dict[int, List[int]] = {}
+        for i in ids:
+            by_block.setdefault(i // self.block_size, []).append(i)
+        out: Dict[int, str] = {}
+        for b, members in by_block.items():
+            block = self._block(b)
+            for i in members:
+                out[i] = block[i % self.block_size]
+        return out
+
+    def __iter__(self):
+        for b in range(self._nblocks):
+            yield from self._block(b)
+
+    def close(self):
+        if self._file is None:
+            self._mm = None  # the mapping belongs to the caller
+            return
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        self._file.close()
+
+
+class TextChain(Sequence[str]):
+    """Concatenation of text sources (base store, delta segments) addressed by row."""
+
+    def __init__(self, parts: Iterable[Sequence[str]] = ()):
+        self.parts: List[Sequence[str]] = []
+        self._starts: List[int] = []
+        self._len = 0
+        for part in parts:
+            self.append_part(part)
+
+    def append_part(self, part: Sequence[str]):
+        self.parts.append(part)
+        self._starts.append(self._len)
+        self._len += len(part)
+
+    def extended(self, part: Sequence[str]) -> "TextChain":
+        """New chain with part appended; this one is left untouched for concurrent readers."""
+        return TextChain(self.parts + [part])
+
+    def __len__(self) -> int:
+        return self._len
+
+    def _locate(self, i: int):
+        lo, hi = 0, len(self._starts) - 1
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if self._starts[mid] <= i:
+                lo = mid
+            else:
+                hi = mid - 1
+        return lo, i - self._starts[lo]
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self._len))]
+        if i < 0:
+            i += self._len
+        if not 0 <= i < self._len:
+            raise IndexError(i)
+        p, local = self._locate(i)
+        return self.parts[p][local]
+
+    def get_many(self, ids: Iterable[int]) -> Dict[int, str]:
+        by_part: Dict[int, List[int]] = {}
+        for i in ids:
+            by_part.setdefault(self._locate(i)[0], []).append(i)
+        out: Dict[int, str] = {}
+        for p, members in by_part.items():
+            part, start = self.parts[p], self._starts[p]
+            if isinstance(part, TextStore):
+                fetched = part.get_many(i - start for i in members)
+                out.update((i, fetched[i - start]) for i in members)
+            else:
+                out.update((i, part[i - start]) for i in members)
+        return out
+
+    def __iter__(self):
+        for part in self.parts:
+            yield from part
+
+    def close(self):
+        for part in self.parts:
+            if isinstance(part, TextStore):
+                part.close()
+
+
+def migrate_jsonl(jsonl_path: Path, bin_path: Path, block_size: int = DEFAULT_BLOCK_SIZE) -> int:
+    """Convert a legacy texts.jsonl file into texts.bin without loading it whole."""
+    def rows():
+        with Path(jsonl_path).open("r", encoding="utf-8") as f:
+            for line in f:
+                yield json.loads(line)["text"]
+    return write_text_store(bin_path, rows(), block_size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chunk text store utilities")
+    sub = parser.add_subparsers(dest="command", required=True)
+    mig = sub.add_parser("migrate", help="Convert texts.jsonl into texts.bin")
+    mig.add_argument("src", type=Path)
+    mig.add_argument("dst", type=Path)
+    mig.add_argument("--block-size", type=int, default=DEFAULT_BLOCK_SIZE)
+    mig.add_argument("--remove-source", action="store_true", help="Delete the JSONL file after migrating")
+    args = parser.parse_args()
+
+    count = migrate_jsonl(args.src, args.dst, args.block_size)
+    print(f"Migrated {count} texts: {args.src} -> {args.dst} ({args.dst.stat().st_size} bytes)")
+    if args.remove_source:
+        args.src.unlink()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Raw embedding archive: the normalized vectors of every chunk, on disk and memory-mapped.
+
+Each add_texts batch appends a delta segment with its vectors.npy, and every base
+generation keeps vectors.npy for its rows, so the store holds the encoder output
+independently of index.faiss. It is what compressed (SQ8 / PQ) and PCA indexes
+re-score their candidates against, and what `python -m backend.app.reindex`
+streams into a new index of any type without re-encoding a chunk.
+
+Rows are float32, or float16 with settings.vector_archive_dtype (half the disk and
+page cache; re-scored distances then carry ~1e-3 rounding). Reads always return
+float32.
+"""
+from __future__ import annotations
+import os
+from pathlib import Path
+from typing import List, Tuple
+import numpy as np
+
+
+def load_vectors(path: Path) -> np.ndarray:
+    return np.load(path, mmap_mode="r")
+
+
+class VectorChain:
+    """Row-addressed view over several memory-mapped vector files."""
+
+    def __init__(self, parts: List[Tuple[int, np.ndarray]] | None = None):
+        self.parts: List[Tuple[int, np.ndarray]] = []
+        for start, arr in parts or []:
+            self.add(start, arr)
+
+    def add(self, start: int, arr: np.ndarray):
+        self.parts.append((start, arr))
+
+    def extended(self, start: int, arr: np.ndarray) -> "VectorChain":
+        """New chain with arr appended; this one is left untouched for concurrent readers."""
+        return VectorChain(self.parts + [(start, arr)])
+
+    def __len__(self) -> int:
+        return sum(len(arr) for _, arr in self.parts)
+
+    def complete(self, ntotal: int) -> bool:
+        """True if the parts cover rows 0..ntotal-1 contiguously."""
+        expected = 0
+        for start, arr in self.parts:
+            if start != expected:
+                break
+            expected += len(arr)
+        return expected >= ntotal
+
+    def prefix(self, n: int, d: int) -> np.ndarray:
+        """Rows 0..n-1 as one array (the caller checks complete(n) first)."""
+        rows = []
+        for start, arr in self.parts:
+            if start >= n:
+                break
+            rows.append(np.asarray(arr[:n - start], dtype="float32"))
+        return np.concatenate(rows) if rows else np.zeros((0, d), dtype="float32")
+
+    def gather(self, ids: np.ndarray) -> np.ndarray:
+        """Rows ids as float32; IndexError if any of them falls outside every part."""
+        ids = np.asarray(ids, dtype="int64")
+        if len(ids) and len(self.parts) == 1 and self.parts[0][0] == 0 \
+                and ids.min() >= 0 and ids.max() < len(self.parts[0][1]):
+            return np.asarray(self.parts[0][1][ids], dtype="float32")
+        d = self.parts[0][1].shape[1] if self.parts else 0
+        out = np.empty((len(ids), d), dtype="float32")
+        found = np.zeros(len(ids), dtype=bool)
+        for start, arr in self.parts:
+            mask = (ids >= start) & (ids < start + len(arr))
+            if mask.any():
+                out[mask] = arr[ids[mask] - start]
+                found |= mask
+        if not found.all():
+            raise IndexError(f"No stored vector for rows {ids[~found][:10].tolist()}")
+        return out
+
+    def iter_rows(self, batch: int = 65536):
+        """Yield float32 row batches in order (bounded memory)."""
+        for _, arr in self.parts:
+            for i in range(0, len(arr), batch):
+                yield np.ascontiguousarray(arr[i:i + batch], dtype="float32")
+
+    def close(self):
+        # Dropping the references releases the mmaps (needed before replacing files on Windows)
+        self.parts = []
+
+
+def save_vectors(path: Path, batches, d: int, ntotal: int, dtype: str = "float32"):
+    """Stream row batches into a .npy file atomically."""
+    path = Path(path)
+    tmp = path.with_name(path.stem + ".tmp.npy")
+    out = np.lib.format.open_memmap(tmp, mode="w+", dtype=dtype, shape=(ntotal, d))
+    pos = 0
+    for rows in batches:
+        out[pos:pos + len(rows)] = rows
+        pos += len(rows)
+    out.flush()
+    del out
+    os.replace(tmp, path)
@@ -0,0 +1,85 @@
+"""Shared fixtures: a scratch persist directory and a deterministic stand-in encoder.
+
+The settings are read at import, so the environment is set before backend.app is
+imported. Tests never download or load the sentence-transformer model: the lazily
+loaded encoder of embedding_store is replaced by HashEncoder.
+"""
+import hashlib
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import faiss  # type: ignore
+import numpy as np
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+os.environ["PERSIST_DIRECTORY"] = tempfile.mkdtemp(prefix="rag-tests-")
+os.environ["EMBEDDING_CACHE_PATH"] = ""
+os.environ["INDEX_TUNING_FILE"] = os.devnull
+os.environ.pop("SHARDS", None)
+
+from backend.app import embedding_store  # noqa: E402
+from backend.app.caching import LRUCache, TTLCache  # noqa: E402
+from backend.app.config import settings  # noqa: E402
+
+
+class HashEncoder:
+    """Bag-of-words vectors from hashed tokens: identical texts embed identically, shared words score higher."""
+
+    name = "test-hash-encoder"
+    dim = 64
+
+    def __init__(self):
+        self.encoded = 0
+
+    def encode(self, texts, batch_size: int = 32) -> np.ndarray:
+        self.encoded += len(texts)
+        out = np.zeros((len(texts), self.dim), dtype="float32")
+        for row, text in enumerate(texts):
+            for word in text.lower().split():
+                out[row, int(hashlib.md5(word.encode()).hexdigest(), 16) % self.dim] += 1.0
+        return out
+
+
+@pytest.fixture
+def encoder(monkeypatch):
+    enc = HashEncoder()
+    monkeypatch.setattr(embedding_store, "_model", enc)
+    return enc
+
+
+@pytest.fixture
+def store(tmp_path, encoder, monkeypatch):
+    """A fresh EmbeddingStore that the module-level functions (similarity_search, add_texts, ...) use too."""
+    monkeypatch.setattr(settings, "compact_min_rows", 1000)  # compaction only where a test asks for it
+    s = embedding_store.EmbeddingStore(tmp_path)
+    monkeypatch.setattr(embedding_store, "_store", s)
+    monkeypatch.setattr(embedding_store, "_query_cache", LRUCache(settings.query_cache_size))
+    monkeypatch.setattr(embedding_store, "_result_cache", TTLCache(settings.result_cache_size, settings.result_cache_ttl))
+    yield s
+    s.stop_watching()
+
+
+def chunks(source: str, n: int, subject: str = "Physics", start: int = 0):
+    """n distinct chunk texts of one source with their metadata."""
+    texts = [f"{source} chunk {i} about topic{i % 7} and item{start + i}" for i in range(start, start + n)]
+    metadata = [{"subject": subject, "source": source, "page": i} for i in range(start, start + n)]
+    return texts, metadata
+
+
+def write_legacy_store(directory: Path, texts, metadata, vectors=None):
+    """The pre-generation root layout: texts.jsonl, metadata.jsonl, state.json and, given vectors, index.faiss."""
+    directory.mkdir(parents=True, exist_ok=True)
+    with (directory / "texts.jsonl").open("w", encoding="utf-8") as f:
+        f.writelines(json.dumps({"text": t}) + "\n" for t in texts)
+    with (directory / "metadata.jsonl").open("w", encoding="utf-8") as f:
+        f.writelines(json.dumps(dict(m, id=i)) + "\n" for i, m in enumerate(metadata))
+    (directory / "state.json").write_text(json.dumps({"next_id": len(texts)}))
+    if vectors is not None:
+        index = faiss.IndexFlatIP(vectors.shape[1])
+        index.add(np.ascontiguousarray(vectors, dtype="float32"))
+        faiss.write_index(index, str(directory / "index.faiss"))
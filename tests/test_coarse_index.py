@@ -0,0 +1,92 @@
+import numpy as np
+
+from backend.app import embedding_store
+from backend.app.coarse_index import build_coarse
+from backend.app.config import settings
+from backend.app.metadata_columns import build_columns
+
+VOCAB = {
+    ("optics.pdf", "Physics"): "lens mirror light ray prism focus",
+    ("atoms.pdf", "Physics"): "atom electron proton orbit charge shell",
+    ("cells.pdf", "Biology"): "cell membrane nucleus protein tissue enzyme",
+    ("trade.pdf", "Economics"): "market price demand supply money bank",
+}
+
+
+def _coarse(d=8):
+    """Chapters a / b / c along axes 0 / 1 / 2, two pages of three rows each; (index, vectors)."""
+    rng = np.random.default_rng(0)
+    metadata, vectors = [], []
+    for c, source in enumerate(("a.pdf", "b.pdf", "c.pdf")):
+        for page in (1, 2):
+            for _ in range(3):
+                v = np.eye(d, dtype="float32")[c] + np.eye(d, dtype="float32")[3 + page] * 0.5
+                vectors.append(v + rng.normal(0, 0.01, d).astype("float32"))
+                metadata.append({"id": len(metadata), "subject": "S", "source": source, "page": page})
+    vectors = embedding_store._normalize(np.array(vectors))
+    return build_coarse(build_columns(metadata), [vectors], d), vectors
+
+
+def test_select_returns_the_rows_of_the_best_chapter_and_page():
+    coarse, _ = _coarse()
+    q = embedding_store._normalize(np.array([[0, 1, 0, 0, 0, 1, 0, 0]], dtype="float32"))[0]
+    assert coarse.select(q, 1, 1, 0.01, 3).tolist() == [9, 10, 11]  # b.pdf page 2
+    assert sorted(coarse.select(q, 1, 2, 0.01, 3).tolist()) == list(range(6, 12))
+    assert coarse.select(q, 1, 1, 0.01, 4) is None  # too few rows for k = 4
+
+
+def test_ambiguous_chapters_fall_back_to_a_global_search():
+    coarse, _ = _coarse()
+    q = embedding_store._normalize(np.array([[1, 1, 0, 0, 0, 0, 0, 0]], dtype="float32"))[0]
+    assert coarse.select(q, 1, 2, 0.05, 3) is None
+    assert coarse.select(q, 2, 4, 0.05, 3) is not None  # a and b both taken: nothing left out is close
+
+
+def test_allowed_pages_restrict_the_ranking():
+    coarse, _ = _coarse()
+    q = embedding_store._normalize(np.array([[0, 1, 0, 0, 0, 1, 0, 0]], dtype="float32"))[0]
+    allowed = coarse.pages_with(np.arange(12, 18))  # c.pdf only
+    assert allowed.tolist() == [False, False, False, False, True, True]
+    assert sorted(coarse.select(q, 1, 2, 0.01, 3, allowed).tolist()) == list(range(12, 18))
+
+
+def _corpus():
+    texts, metadata = [], []
+    for (source, subject), vocab in VOCAB.items():
+        words = vocab.split()
+        for page in range(3):
+            for i in range(25):
+                texts.append(f"{words[2 * page]} {words[2 * page + 1]} {words[(2 * page + 2) % 6]} {source[:4]}{page}{i}")
+                metadata.append({"subject": subject, "source": source, "page": page})
+    return texts, metadata
+
+
+def test_hierarchical_search_matches_exact_search_with_and_without_filters(store, monkeypatch):
+    monkeypatch.setattr(settings, "hierarchical_search", True)
+    monkeypatch.setattr(settings, "coarse_chapters", 1)
+    monkeypatch.setattr(settings, "coarse_pages", 2)  # 50 rows: exactly the dense candidate pool
+    monkeypatch.setattr(settings, "filter_exact_rows", 0)  # filtered rows go through FAISS, not a full scan
+    store.add_texts(*_corpus())
+    store.compact()
+    assert store.snapshot().coarse is not None
+    calls = []
+
+    def spy(*args):
+        found = coarse_search(*args)
+        calls.append(found is not None)
+        return found
+
+    coarse_search = embedding_store._coarse_search
+    monkeypatch.setattr(embedding_store, "_coarse_search", spy)
+    searches = [("lens mirror", None, None), ("membrane nucleus", "Biology", None),
+                ("price demand", None, "subject = Economics AND page <= 1"),
+                ("electron proton", "Physics", "source in {atoms.pdf, optics.pdf}")]
+    hierarchical = [store.search_many([q], 4, [subject], filters=[embedding_store.parse_filter(f)])[0]
+                    for q, subject, f in searches]
+    assert calls == [True] * len(searches)  # every base search was answered from the coarse selection
+    monkeypatch.setattr(settings, "hierarchical_search", False)
+    for (q, subject, f), got in zip(searches, hierarchical):
+        exact = store.search_many([q], 4, [subject], filters=[embedding_store.parse_filter(f)])[0]
+        assert [round(h["distance"], 5) for h in got] == [round(h["distance"], 5) for h in exact]
+        if subject:
+            assert all(h["metadata"]["subject"] == subject for h in got)
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from backend.app import embedding_cache, embedding_store
+from backend.app.config import settings
+from backend.app.embedding_cache import EmbeddingCache
+from conftest import chunks
+
+
+def _unit(n, d=8, seed=0):
+    return embedding_store._normalize(np.random.default_rng(seed).standard_normal((n, d)).astype("float32"))
+
+
+def test_lookups_count_hits_and_misses(tmp_path):
+    cache = EmbeddingCache(tmp_path / "cache.sqlite")
+    vectors = _unit(2)
+    cache.put_many("model-a", ["one", "two"], vectors)
+    found = cache.get_many("model-a", ["two", "three", "one"])
+    assert sorted(found) == [0, 2]
+    np.testing.assert_array_equal(found[0], vectors[1])
+    assert cache.get_many("model-b", ["one"]) == {}  # keyed by encoder as well
+    stats = {s["model"]: s for s in cache.stats()}
+    assert (stats["model-a"]["hits"], stats["model-a"]["misses"], stats["model-a"]["entries"]) == (2, 1, 2)
+    assert stats["model-b"]["misses"] == 1
+    cache.close()
+
+
+def test_float16_entries_come_back_normalized(tmp_path):
+    cache = EmbeddingCache(tmp_path / "cache.sqlite", "float16")
+    vectors = _unit(3, d=384)
+    cache.put_many("m", ["a", "b", "c"], vectors)
+    found = cache.get_many("m", ["a", "b", "c"])
+    got = np.stack([found[i] for i in range(3)])
+    assert got.dtype == np.float32
+    np.testing.assert_allclose(np.linalg.norm(got, axis=1), 1.0, atol=1e-6)
+    np.testing.assert_allclose(got, vectors, atol=2e-3)
+    with pytest.raises(ValueError):
+        EmbeddingCache(tmp_path / "other.sqlite", "int8")
+    cache.close()
+
+
+def test_rebuild_after_reset_only_encodes_new_chunks(store, encoder, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "embedding_cache_path", str(tmp_path / "cache.sqlite"))
+    monkeypatch.setattr(embedding_cache, "_cache", None)
+    texts, metadata = chunks("a.pdf", 8)
+    store.add_texts(texts, metadata)
+    assert encoder.encoded == 8
+    store.reset()
+    store.add_texts(texts + ["one chunk that is new"], metadata + [{"subject": "Physics", "source": "a.pdf", "page": 9}])
+    assert encoder.encoded == 9
+    assert store.search_many([texts[5]], 1, [None])[0][0]["text"] == texts[5]
+    embedding_cache.get_cache().close()
@@ -0,0 +1,144 @@
+import shutil
+
+import numpy as np
+
+from backend.app import embedding_store
+from backend.app.config import settings
+from conftest import ROOT, chunks
+
+
+def ranked(hits):
+    """(distance, id) pairs; equal distances may come in either order."""
+    return sorted((round(h["distance"], 5), h["metadata"]["id"]) for h in hits)
+
+
+def test_add_texts_stores_chunks_and_skips_exact_duplicates(store):
+    texts, metadata = chunks("a.pdf", 5)
+    assert store.add_texts(texts, metadata) == {"added": 5, "exact_duplicates": 0, "near_duplicates": 0}
+    again = store.add_texts(texts[:2] + ["a brand new chunk"], metadata[:3])
+    assert again["added"] == 1 and again["exact_duplicates"] == 2
+    snap = store.snapshot()
+    assert snap.count == snap.live_count == 6
+    assert list(snap.metadata.ids) == list(range(6))
+    hit = store.search_many([texts[3]], 1, [None])[0][0]
+    assert hit["text"] == texts[3] and hit["metadata"]["source"] == "a.pdf"
+    assert hit["generation"] == snap.version
+
+
+def test_remove_source_tombstones_rows_until_compaction(store, monkeypatch):
+    monkeypatch.setattr(settings, "tombstone_ratio", 1.0)  # keep the tombstones around
+    store.add_texts(*chunks("a.pdf", 6))
+    store.add_texts(*chunks("b.pdf", 6))
+    version = store.snapshot().version
+    assert store.remove_source("a.pdf") == 6
+    snap = store.snapshot()
+    assert snap.version > version
+    assert snap.count == 12 and snap.live_count == 6 and len(snap.tombstones) == 6
+    texts, _ = chunks("a.pdf", 6)
+    for mode in ("dense", "hybrid"):
+        hits = store.search_many([texts[0]], 10, [None], mode=mode)[0]
+        assert hits and all(h["metadata"]["source"] == "b.pdf" for h in hits)
+    assert store.remove_source("a.pdf") == 0
+
+
+def test_replace_source_swaps_chunks_and_only_embeds_changed_text(store, encoder):
+    old, metadata = chunks("a.pdf", 6)
+    store.add_texts(old, metadata)
+    encoder.encoded = 0
+    new = old[:4] + ["a rewritten chunk about optics", "another new chunk about lenses"]
+    stats = store.replace_source("a.pdf", new, metadata)
+    assert stats["removed"] == 6 and stats["added"] == 6
+    assert encoder.encoded == 2
+    snap = store.snapshot()
+    live = sorted(snap.texts[r] for r in range(snap.count) if r not in set(snap.tombstones.tolist()))
+    assert live == sorted(new)
+
+
+def test_compaction_drops_tombstones_and_keeps_ids(store, monkeypatch):
+    monkeypatch.setattr(settings, "tombstone_ratio", 1.0)  # compact explicitly below
+    store.add_texts(*chunks("a.pdf", 5))
+    store.add_texts(*chunks("b.pdf", 5))
+    store.add_texts(*chunks("c.pdf", 5))
+    store.remove_source("b.pdf")
+    before = store.snapshot()
+    live_ids = sorted(int(before.metadata.ids[r]) for r in range(before.count)
+                      if r not in set(before.tombstones.tolist()))
+    query = chunks("c.pdf", 5)[0][2]
+    expected = ranked(store.search_many([query], 10, [None], snap=before)[0])  # every live row
+
+    store.compact()
+    after = store.snapshot()
+    assert after.base is not None and after.base != before.base
+    assert not after.segments and len(after.tombstones) == 0
+    assert after.count == after.index.ntotal == 10
+    assert sorted(after.metadata.ids.tolist()) == live_ids
+    assert ranked(store.search_many([query], 10, [None])[0]) == expected
+    store.add_texts(["a chunk added after compaction"], [{"subject": "Physics", "source": "d.pdf", "page": 1}])
+    assert int(store.snapshot().metadata.ids[-1]) == 15  # ids are never reused
+
+
+def test_compaction_runs_automatically_past_the_tombstone_ratio(store, monkeypatch):
+    monkeypatch.setattr(settings, "tombstone_ratio", 0.2)
+    store.add_texts(*chunks("a.pdf", 8))
+    store.add_texts(*chunks("b.pdf", 2))
+    store.remove_source("b.pdf")
+    snap = store.snapshot()
+    assert len(snap.tombstones) == 0 and snap.count == 8
+
+
+def test_reload_after_persist(store, tmp_path):
+    store.add_texts(*chunks("a.pdf", 6))
+    store.add_texts(*chunks("b.pdf", 6, subject="Chemistry"))
+    store.remove_source("a.pdf")
+    snap = store.snapshot()
+    query = chunks("b.pdf", 6)[0][1]
+
+    reopened = embedding_store.EmbeddingStore(tmp_path)
+    loaded = reopened.snapshot()
+    assert loaded.version == snap.version
+    assert loaded.count == snap.count and loaded.tombstones.tolist() == snap.tombstones.tolist()
+    assert list(loaded.texts) == list(snap.texts)
+    assert loaded.metadata.ids.tolist() == snap.metadata.ids.tolist()
+    assert reopened.search_many([query], 4, ["Chemistry"]) == store.search_many([query], 4, ["Chemistry"])
+
+    store.compact()
+    assert embedding_store.EmbeddingStore(tmp_path).snapshot().base == store.snapshot().base
+
+
+def test_reload_picks_up_writes_of_another_process(store, tmp_path):
+    reader = embedding_store.EmbeddingStore(tmp_path)
+    assert reader.snapshot().count == 0
+    store.add_texts(*chunks("a.pdf", 3))
+    assert reader.reload() is True
+    assert reader.snapshot().count == 3
+    assert reader.reload() is False
+
+
+def test_filters_restrict_results(store):
+    store.add_texts(*chunks("a.pdf", 6))
+    store.add_texts(*chunks("b.pdf", 6, subject="Biology"))
+    query = chunks("a.pdf", 6)[0][0]
+    hits = embedding_store.similarity_search(query, k=4, filter="subject = Biology AND page in 2..4")
+    assert len(hits) == 3
+    assert all(h["metadata"]["subject"] == "Biology" and 2 <= h["metadata"]["page"] <= 4 for h in hits)
+    assert np.all(np.diff([h["distance"] for h in hits]) >= -1e-6)
+
+
+def test_bundled_legacy_store_is_re_embedded_on_first_compaction(tmp_path, encoder):
+    """vector_store/ ships texts.jsonl and metadata.jsonl without index.faiss."""
+    shutil.copytree(ROOT / "vector_store", tmp_path / "store")
+    store = embedding_store.EmbeddingStore(tmp_path / "store")
+    legacy = store.snapshot()
+    assert legacy.base is None and legacy.unembedded == legacy.count > 0
+    query = legacy.texts[10]
+
+    store.add_texts(["a chunk added to the bundled store"], [{"subject": "Physics", "source": "x.pdf", "page": 1}])
+    snap = store.snapshot()
+    assert snap.base is not None and not snap.segments and snap.unembedded == 0
+    assert snap.count == snap.index.ntotal == len(snap.vectors) == legacy.count + 1
+    assert snap.metadata.ids.tolist() == list(range(legacy.count + 1))
+    for mode in ("dense", "hybrid"):
+        hits = store.search_many([query], 4, [None], mode=mode)[0]
+        assert hits[0]["text"] == query and abs(hits[0]["distance"]) < 1e-5
+        assert all(0 <= h["distance"] <= 2 for h in hits)
+    assert embedding_store.EmbeddingStore(tmp_path / "store").snapshot().base == snap.base
@@ -0,0 +1,56 @@
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+import pytest
+
+from backend.app import embedding_store, encode_pool
+from backend.app.encode_pool import EncodePool
+from conftest import HashEncoder, chunks
+
+
+class _ThreadContext:
+    """Stands in for the spawn context: worker threads sharing one HashEncoder instead of processes."""
+
+    def Pool(self, workers, initializer=None, initargs=()):
+        return ThreadPool(workers)
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(encode_pool.multiprocessing, "get_context", lambda method: _ThreadContext())
+    monkeypatch.setattr(encode_pool, "_encoder", HashEncoder())
+    with EncodePool(4, batch_size=3) as p:
+        yield p
+
+
+def test_rows_come_back_in_the_callers_order(pool):
+    texts = [f"chunk {i} about topic{i % 5}" for i in range(20)]
+    expected = HashEncoder().encode(texts)
+    np.testing.assert_array_equal(pool.encode(texts), expected)
+    shuffled = texts[::-1] + texts[:3]
+    np.testing.assert_array_equal(pool.encode(shuffled), HashEncoder().encode(shuffled))
+
+
+def test_prefetched_batches_are_encoded_once(pool):
+    texts = [f"chunk {i}" for i in range(10)]
+    pool.prefetch(texts)
+    pool.prefetch(texts[:4])  # already pending
+    later = pool.encode(texts[5:])
+    np.testing.assert_array_equal(later, HashEncoder().encode(texts[5:]))
+    pool.encode(texts[:5])
+    assert pool.encoded == 10  # every text once, although two prefetches asked for some
+    assert pool.encode([]).shape == (0, 0)
+
+
+def test_ingest_through_the_pool_matches_a_serial_run(store, tmp_path, pool):
+    texts, metadata = chunks("a.pdf", 12)
+    serial = embedding_store.EmbeddingStore(tmp_path / "serial")
+    serial.add_texts(texts, metadata)
+    embedding_store.set_chunk_encoder(pool.encode)
+    try:
+        store.add_texts(texts, metadata)
+    finally:
+        embedding_store.set_chunk_encoder(None)
+    rows = np.arange(12)
+    np.testing.assert_allclose(store.snapshot().vectors.gather(rows), serial.snapshot().vectors.gather(rows), atol=1e-6)
+    assert store.snapshot().metadata.ids.tolist() == serial.snapshot().metadata.ids.tolist()
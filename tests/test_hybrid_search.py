@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from backend.app import embedding_store
+from backend.app.config import settings
+from conftest import chunks, write_legacy_store
+
+
+def test_rrf_rewards_agreement_between_rankings(monkeypatch):
+    monkeypatch.setattr(settings, "rrf_k", 60)
+    fused = embedding_store.rrf([["a", "b", "c"], ["c", "a"]])
+    assert fused["a"] == pytest.approx(1 / 61 + 1 / 62)
+    assert fused["c"] == pytest.approx(1 / 63 + 1 / 61)
+    assert sorted(fused, key=lambda key: -fused[key]) == ["a", "c", "b"]
+
+
+def test_hybrid_search_ranks_the_exact_term_match_first(store, encoder):
+    texts, metadata = chunks("a.pdf", 30)
+    store.add_texts(texts, metadata)
+    hits = store.search_many(["item17 topic3"], 5, [None], mode="hybrid")[0]
+    assert hits[0]["text"] == texts[17]  # the only chunk with both terms
+    q = embedding_store._normalize(encoder.encode(["item17 topic3"]))[0]
+    for hit in hits:
+        expected = embedding_store._normalize(encoder.encode([hit["text"]]))[0] @ q
+        assert hit["distance"] == pytest.approx(1 - float(expected), abs=1e-5)
+
+
+def test_hybrid_search_on_a_legacy_store_reconstructs_base_vectors(tmp_path, encoder):
+    texts, metadata = chunks("a.pdf", 12)
+    write_legacy_store(tmp_path, texts, metadata, embedding_store._normalize(encoder.encode(texts)))
+    store = embedding_store.EmbeddingStore(tmp_path)
+    store.add_texts(*chunks("b.pdf", 3))
+    assert store.snapshot().unembedded == 0
+    query = texts[4]
+    q = embedding_store._normalize(encoder.encode([query]))[0]
+    hits = store.search_many([query], 6, [None], mode="hybrid")[0]
+    assert hits[0]["text"] == query and hits[0]["distance"] == pytest.approx(0, abs=1e-5)
+    for hit in hits:
+        expected = embedding_store._normalize(encoder.encode([hit["text"]]))[0] @ q
+        assert hit["distance"] == pytest.approx(1 - float(expected), abs=1e-5)
+
+
+def test_hybrid_search_leaves_out_legacy_rows_without_vectors(tmp_path, encoder, monkeypatch):
+    # The state before the first compaction, which re-embeds those rows
+    monkeypatch.setattr(embedding_store.EmbeddingStore, "_compaction_due", lambda self, snap: False)
+    texts, metadata = chunks("a.pdf", 12)
+    write_legacy_store(tmp_path, texts, metadata)  # no index.faiss
+    store = embedding_store.EmbeddingStore(tmp_path)
+    new, new_metadata = chunks("b.pdf", 3, start=4)
+    store.add_texts(new, new_metadata)
+    assert store.snapshot().unembedded == 12
+    for mode in ("dense", "hybrid"):
+        hits = store.search_many([texts[4]], 6, [None], mode=mode)[0]
+        assert hits and all(h["metadata"]["source"] == "b.pdf" for h in hits)
+        assert all(0 <= h["distance"] <= 2 for h in hits)
+    with pytest.raises(IndexError):
+        embedding_store._row_vectors(store.snapshot(), [4])
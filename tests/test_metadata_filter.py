@@ -0,0 +1,54 @@
+import pytest
+
+from backend.app.metadata_columns import MetadataChain, build_columns
+from backend.app.metadata_filter import PAGE_MAX, PAGE_MIN, parse_filter
+
+
+def test_string_dict_and_json_forms_agree():
+    text = parse_filter("subject = Physics AND source in {leph201, leph202} AND page in 10..40")
+    spec = parse_filter({"subject": "Physics", "source": ["leph202", "leph201"], "page": {"gte": 10, "lte": 40}})
+    js = parse_filter('{"subject": ["Physics"], "source": ["leph201", "leph202"], "page": {"gte": 10, "lte": 40}}')
+    assert text == spec == js
+    assert hash(text) == hash(spec)
+    assert text.describe() == "subject = Physics AND source in {leph201, leph202} AND page in 10..40"
+
+
+@pytest.mark.parametrize("text, pages", [
+    ("page = 3", (3, 3)),
+    ("page >= 10", (10, PAGE_MAX)),
+    ("page <= 40", (PAGE_MIN, 40)),
+    ("page >= 5 AND page <= 9", (5, 9)),
+])
+def test_page_clauses(text, pages):
+    assert parse_filter(text).pages == pages
+
+
+def test_empty_filters_mean_no_filter():
+    assert parse_filter(None) is None
+    assert parse_filter({}) is None
+
+
+@pytest.mark.parametrize("spec", [
+    "chapter = 3",
+    "subject >= Physics",
+    "subject in Physics",
+    "nonsense",
+    {"page": "3"},
+    {"page": {"from": 3}},
+    {"subject": []},
+    ["subject"],
+])
+def test_invalid_filters_are_rejected(spec):
+    with pytest.raises(ValueError):
+        parse_filter(spec)
+
+
+def test_rows_match_every_clause_and_skip_tombstones():
+    rows = [{"subject": s, "source": f"book{i // 4}.pdf", "page": i, "id": i}
+            for i, s in enumerate(["Physics", "Biology"] * 6)]
+    metadata = MetadataChain([build_columns(rows[:8]), build_columns(rows[8:])])
+    where = parse_filter("subject = Physics AND source in {book1, book2.pdf}")
+    assert where.rows(metadata).tolist() == [4, 6, 8, 10]
+    assert where.rows(metadata, tombstones=[6, 8]).tolist() == [4, 10]
+    assert parse_filter({"page": {"gte": 9}}).rows(metadata).tolist() == [9, 10, 11]
+    assert parse_filter("subject = Chemistry").rows(metadata).tolist() == []
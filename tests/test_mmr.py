@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from backend.app import embedding_store
+from backend.app.mmr import mmr
+
+# Rows 0 and 1 nearly repeat each other; row 2 is less relevant but adds content
+VECTORS = embedding_store._normalize(np.array([[1, 0.1, 0], [1, 0.12, 0], [0.6, 0, 0.8]], dtype="float32"))
+RELEVANCE = np.array([0.95, 0.94, 0.6], dtype="float32")
+
+
+def test_lambda_one_keeps_the_relevance_order():
+    assert mmr(RELEVANCE, VECTORS, 2, 1.0) == [0, 1]
+    assert mmr(RELEVANCE, VECTORS, 5, 1.0) == [0, 1, 2]  # fewer candidates than k
+
+
+def test_near_duplicates_give_way_below_one():
+    assert mmr(RELEVANCE, VECTORS, 2, 0.5) == [0, 2]
+    assert mmr(RELEVANCE, VECTORS, 3, 0.5) == [0, 2, 1]
+    assert mmr(RELEVANCE, VECTORS, 2, 0.5, chosen=[1]) == [1, 2]  # picked rows count as redundancy too
+    assert mmr(RELEVANCE[:0], VECTORS[:0], 2, 0.5) == []
+
+
+def test_store_search_diversifies_repeated_chunks(store):
+    texts = ["photosynthesis uses light energy in the chlorophyll of the leaf",
+             "photosynthesis uses light energy in the chlorophyll of a leaf",
+             "photosynthesis uses light energy in the chlorophyll of each leaf",
+             "photosynthesis makes glucose and releases oxygen",
+             "the heart pumps blood through arteries"]
+    store.add_texts(texts, [{"subject": "Biology", "source": "bio.pdf", "page": i} for i in range(len(texts))])
+    query = ["photosynthesis light energy chlorophyll leaf"]
+    relevant = [h["text"] for h in store.search_many(query, 3, [None], mode="dense", mmr_lambda=1.0)[0]]
+    assert set(relevant) == set(texts[:3])
+    diverse = [h["text"] for h in store.search_many(query, 3, [None], mode="dense", mmr_lambda=0.3)[0]]
+    assert diverse[0] in texts[:3] and texts[3] in diverse
+    assert len(set(diverse) & set(texts[:3])) < 3
+    with pytest.raises(ValueError, match="MMR lambda"):
+        store.search_many(query, 3, [None], mmr_lambda=1.5)
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from backend.app import embedding_store
+from backend.app.config import settings
+from backend.app.packed_store import MappedFlatIndex, PackFile, write_pack
+from conftest import chunks
+
+
+def _flip_byte(path, offset):
+    with open(path, "r+b") as f:
+        f.seek(offset)
+        byte = f.read(1)
+        f.seek(offset)
+        f.write(bytes([byte[0] ^ 0xFF]))
+
+
+def test_sections_round_trip(tmp_path):
+    vectors = np.arange(12, dtype="float32").reshape(4, 3)
+    text_file = tmp_path / "texts.bin"
+    text_file.write_bytes(b"from a file" * 1000)
+    path = tmp_path / "store.pack"
+    write_pack(path, [("vectors", vectors), ("names", b'["a", "b"]'), ("texts", text_file)], {"generation": 7})
+    pack = PackFile(path)
+    assert pack.info == {"generation": 7} and pack.verify() == []
+    np.testing.assert_array_equal(pack.array("vectors"), vectors)
+    assert pack.json("names") == ["a", "b"]
+    assert bytes(pack.section("texts")) == text_file.read_bytes()
+    assert all(entry["offset"] % 4096 == 0 for entry in pack.sections.values())
+    assert "index" not in pack and isinstance(pack.load_index(), MappedFlatIndex)
+
+
+def test_corruption_is_detected(tmp_path, monkeypatch):
+    path = tmp_path / "store.pack"
+    write_pack(path, [("a", b"x" * 100), ("b", b"y" * 100)], {"generation": 1})
+    _flip_byte(path, PackFile(path).sections["b"]["offset"] + 5)
+    assert PackFile(path).verify() == ["b"]
+    monkeypatch.setattr(settings, "pack_verify", True)
+    with pytest.raises(ValueError, match="Checksum mismatch"):
+        embedding_store.EmbeddingStore(tmp_path, pack_path=path).snapshot()
+
+    write_pack(path, [("a", b"x" * 100)], {"generation": 1})
+    toc = path.stat().st_size - 40  # inside the JSON table of contents, before the 28-byte footer
+    _flip_byte(path, toc)
+    with pytest.raises(ValueError, match="table of contents"):
+        PackFile(path)
+
+
+def test_packed_store_serves_the_live_rows_of_the_directory_store(store, tmp_path):
+    store.add_texts(*chunks("a.pdf", 10))
+    store.add_texts(*chunks("b.pdf", 10, subject="Biology", start=10))
+    store.remove_source("a.pdf")
+    path = tmp_path / "served" / "store.pack"
+    path.parent.mkdir()
+    info = store.pack(path)
+    snap = store.snapshot()
+    assert info["count"] == snap.live_count == 10 and info["generation"] == snap.version
+
+    packed = embedding_store.EmbeddingStore(path.parent, pack_path=path)
+    served = packed.snapshot()
+    assert served.count == 10 and served.version == snap.version and served.base == f"pack-{PackFile(path).checksum}"
+    assert sorted(served.texts) == sorted(chunks("b.pdf", 10, start=10)[0])
+    queries = ["topic3 item13", "topic5"]
+    for mode in ("dense", "hybrid"):
+        assert packed.search_many(queries, 4, [None, "Biology"], mode=mode) == \
+            store.search_many(queries, 4, [None, "Biology"], mode=mode)
+    with pytest.raises(RuntimeError, match="read-only"):
+        packed.add_texts(*chunks("c.pdf", 2))
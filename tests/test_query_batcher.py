@@ -0,0 +1,81 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from backend.app.query_batcher import QueryBatcher
+from conftest import HashEncoder
+
+
+class _GatedEncoder:
+    """HashEncoder whose first call blocks until released, so later callers queue up behind it."""
+
+    def __init__(self, fail=False):
+        self.calls = []
+        self.release = threading.Event()
+        self.fail = fail
+        self._hash = HashEncoder()
+
+    def __call__(self, texts):
+        self.calls.append(list(texts))
+        if len(self.calls) == 1:
+            self.release.wait(5)
+        elif self.fail:
+            raise RuntimeError("encoder down")
+        return self._hash.encode(texts)
+
+
+def _queue_behind_first(batcher, encoder, batches):
+    """Start one caller per batch; the first holds the worker until the rest are queued. Futures."""
+    pool = ThreadPoolExecutor(len(batches))
+    futures = [pool.submit(batcher.encode, batches[0])]
+    while not encoder.calls:
+        time.sleep(0.001)
+    for queued, texts in enumerate(batches[1:], 1):
+        futures.append(pool.submit(batcher.encode, texts))
+        while batcher._queue.qsize() < queued:  # one at a time, so the queue order is fixed
+            time.sleep(0.001)
+    encoder.release.set()
+    pool.shutdown(wait=False)
+    return futures
+
+
+def test_queued_callers_are_encoded_in_one_batch():
+    encoder = _GatedEncoder()
+    batcher = QueryBatcher(encoder, max_batch=32, max_wait_ms=0)
+    batches = [["first"], ["a", "b"], ["b", "c"], ["a"], ["d"]]
+    futures = _queue_behind_first(batcher, encoder, batches)
+    for texts, future in zip(batches, futures):
+        np.testing.assert_array_equal(future.result(5), HashEncoder().encode(texts))
+    assert encoder.calls == [["first"], ["a", "b", "c", "d"]]  # duplicates encoded once
+    assert batcher.stats() == {"batches": 2, "texts": 5, "largest": 4, "mean_batch": 2.5}
+
+
+def test_batch_size_caps_the_coalescing():
+    encoder = _GatedEncoder()
+    batcher = QueryBatcher(encoder, max_batch=3, max_wait_ms=0)
+    futures = _queue_behind_first(batcher, encoder, [["first"], ["a", "b"], ["c", "d"], ["e"]])
+    for future in futures:
+        future.result(5)
+    assert encoder.calls == [["first"], ["a", "b", "c", "d"], ["e"]]  # a batch stops once it holds 3+ texts
+
+
+def test_an_encoder_error_reaches_every_caller_of_the_batch():
+    encoder = _GatedEncoder(fail=True)
+    batcher = QueryBatcher(encoder, max_batch=32, max_wait_ms=0)
+    futures = _queue_behind_first(batcher, encoder, [["first"], ["a"], ["b"]])
+    futures[0].result(5)
+    for future in futures[1:]:
+        with pytest.raises(RuntimeError, match="encoder down"):
+            future.result(5)
+    encoder.fail = False
+    np.testing.assert_array_equal(batcher.encode(["c"]), HashEncoder().encode(["c"]))  # the worker lives on
+
+
+def test_batch_size_one_bypasses_the_worker():
+    calls = []
+    batcher = QueryBatcher(lambda texts: calls.append(texts) or HashEncoder().encode(texts), 1, 0)
+    batcher.encode(["x"])
+    assert calls == [["x"]] and batcher._worker is None
@@ -0,0 +1,58 @@
+import numpy as np
+
+from backend.app import embedding_store
+from conftest import chunks
+
+
+def test_repeated_search_is_served_from_the_cache(store):
+    store.add_texts(*chunks("a.pdf", 8))
+    first = embedding_store.similarity_search("topic3 item3", k=3)
+    second = embedding_store.similarity_search("  topic3   item3 ", k=3)  # same normalized query
+    assert first == second
+    stats = embedding_store.result_cache_stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1
+
+    second[0]["metadata"]["subject"] = "changed"  # callers get copies
+    assert embedding_store.similarity_search("topic3 item3", k=3) == first
+
+
+def test_cache_key_covers_k_subject_and_filter(store):
+    store.add_texts(*chunks("a.pdf", 8))
+    embedding_store.similarity_search("topic3", k=3)
+    embedding_store.similarity_search("topic3", k=4)
+    embedding_store.similarity_search("topic3", k=3, subject="Biology")
+    embedding_store.similarity_search("topic3", k=3, filter="page <= 2")
+    assert embedding_store.result_cache_stats()["hits"] == 0
+
+
+def test_write_bumps_the_generation_and_invalidates(store):
+    store.add_texts(*chunks("a.pdf", 8))
+    before = embedding_store.similarity_search("topic3 fresh words", k=3)
+    version = store.snapshot().version
+    store.add_texts(["fresh words topic3 fresh words"], [{"subject": "Physics", "source": "b.pdf", "page": 1}])
+    assert store.snapshot().version == version + 1
+    after = embedding_store.similarity_search("topic3 fresh words", k=3)
+    assert after != before
+    assert after[0]["metadata"]["source"] == "b.pdf" and after[0]["generation"] == version + 1
+    assert embedding_store.result_cache_stats()["hits"] == 0
+
+    store.remove_source("b.pdf")
+    assert all(h["metadata"]["source"] != "b.pdf" for h in embedding_store.similarity_search("topic3 fresh words", k=3))
+
+
+def test_repack_at_the_same_generation_invalidates(store, tmp_path, monkeypatch):
+    store.add_texts(*chunks("a.pdf", 8))
+    pack = tmp_path / "served" / "store.pack"
+    pack.parent.mkdir()
+    store.pack(pack)
+    packed = embedding_store.EmbeddingStore(pack.parent, pack_path=pack)
+    monkeypatch.setattr(embedding_store, "_store", packed)
+    before = embedding_store.similarity_search("topic3 item3", k=3)
+    assert before[0]["metadata"]["page"] == 3
+
+    keep = np.array([m["page"] != 3 for m in store.snapshot().metadata])
+    store.pack(pack, rows=keep)  # same generation, different rows
+    assert packed.reload() is True and packed.snapshot().version == before[0]["generation"]
+    after = embedding_store.similarity_search("topic3 item3", k=3)
+    assert all(h["metadata"]["page"] != 3 for h in after)
+    assert embedding_store.result_cache_stats()["hits"] == 0
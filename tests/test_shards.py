@@ -0,0 +1,124 @@
+import logging
+import socket
+import threading
+import time
+from multiprocessing.connection import Listener
+
+import pytest
+
+from backend.app import embedding_store, shards
+from conftest import chunks
+
+AUTHKEY = b"test-shard-key"
+
+
+def _listen(handler):
+    """Serve handler(conn) per connection on a free localhost port; returns (address, listener)."""
+    listener = Listener(("127.0.0.1", 0), authkey=AUTHKEY)
+
+    def loop():
+        while True:
+            try:
+                conn = listener.accept()
+            except OSError:
+                return
+            threading.Thread(target=handler, args=(conn,), daemon=True).start()
+
+    threading.Thread(target=loop, daemon=True).start()
+    host, port = listener.address
+    return f"{host}:{port}", listener
+
+
+@pytest.fixture
+def servers():
+    listeners = []
+
+    def start(handler):
+        address, listener = _listen(handler)
+        listeners.append(listener)
+        return address
+
+    yield start
+    for listener in listeners:
+        listener.close()
+
+
+def _packed_shards(store, tmp_path, texts, metadata, n=2):
+    """store filled with the chunks and split into n packs by id hash; the packed stores."""
+    store.add_texts(texts, metadata)
+    layout = shards.split(tmp_path / "shards", n, "hash")
+    return [embedding_store.EmbeddingStore(tmp_path / "shards", pack_path=tmp_path / "shards" / entry["path"])
+            for entry in layout]
+
+
+def _serve(servers, shard):
+    return servers(lambda conn: shards._handle(shard, conn))
+
+
+def _failing(conn):
+    with conn:
+        conn.recv()
+        conn.send({"error": "ValueError: boom"})
+
+
+def test_scatter_gather_merges_shards_like_one_store(store, servers, tmp_path):
+    a, b = chunks("a.pdf", 10), chunks("b.pdf", 10, subject="Biology", start=10)
+    addresses = [_serve(servers, s) for s in _packed_shards(store, tmp_path, a[0] + b[0], a[1] + b[1])]
+    coordinator = shards.ShardCoordinator(addresses, 5.0, AUTHKEY)
+    queries = ["topic3 item13", "topic5"]
+    merged = coordinator.search_many(queries, 4, [None, "Biology"], mode="dense")
+    local = store.search_many(queries, 4, [None, "Biology"], mode="dense")
+    everything = store.search_many(queries, 20, [None, None], mode="dense")
+    for got, expected, every in zip(merged, local, everything):
+        assert not got.partial and set(got.generations) == set(addresses)
+        # Equal distances may come in either order
+        assert [round(h["distance"], 5) for h in got] == [round(h["distance"], 5) for h in expected]
+        distance = {h["metadata"]["id"]: h["distance"] for h in every}
+        assert all(h["distance"] == pytest.approx(distance[h["metadata"]["id"]], abs=1e-5) for h in got)
+    assert all(h["metadata"]["subject"] == "Biology" for h in merged[1])
+    hybrid = coordinator.search_many(["topic3 item13"], 4, [None], mode="hybrid")[0]
+    assert {h["text"] for h in hybrid[:2]} == {a[0][3], b[0][0]}  # the topic3 chunks, one per shard
+
+
+def test_silent_shard_is_skipped_after_the_timeout(store, servers, tmp_path):
+    texts, metadata = chunks("a.pdf", 6)
+    good = _serve(servers, _packed_shards(store, tmp_path, texts, metadata, n=1)[0])
+    silent = socket.socket()
+    silent.bind(("127.0.0.1", 0))
+    silent.listen()  # accepts connections but never completes the handshake
+    try:
+        address = f"127.0.0.1:{silent.getsockname()[1]}"
+        coordinator = shards.ShardCoordinator([good, address], 0.5, AUTHKEY)
+        start = time.monotonic()
+        results = coordinator.search_many([texts[2]], 3, [None])[0]
+        assert time.monotonic() - start < 2.0
+        assert results.partial and results.missing == [address]
+        assert results[0]["text"] == texts[2]
+    finally:
+        silent.close()
+
+
+def test_error_reply_marks_results_partial(store, servers, tmp_path, caplog):
+    texts, metadata = chunks("a.pdf", 6)
+    good = _serve(servers, _packed_shards(store, tmp_path, texts, metadata, n=1)[0])
+    failing = servers(_failing)
+    coordinator = shards.ShardCoordinator([good, failing], 5.0, AUTHKEY)
+    with caplog.at_level(logging.WARNING, logger="backend.app.shards"):
+        results = coordinator.search_many([texts[1]], 3, [None])[0]
+    assert results.partial and results.missing == [failing]
+    assert results[0]["text"] == texts[1]
+    assert "boom" in caplog.text
+
+
+def test_no_answering_shard_is_an_error(encoder, servers):
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        closed = f"127.0.0.1:{s.getsockname()[1]}"  # nothing listens once the socket is closed
+    coordinator = shards.ShardCoordinator([closed, servers(_failing)], 1.0, AUTHKEY)
+    with pytest.raises(RuntimeError, match="No shard answered"):
+        coordinator.search_many(["topic1"], 3, [None])
+
+
+def test_coordinator_requires_an_authkey():
+    with pytest.raises(RuntimeError, match="SHARD_AUTHKEY"):
+        shards.ShardCoordinator(["127.0.0.1:1"], 1.0, b"")